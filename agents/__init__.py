@@ -1,9 +1,14 @@
-from .project_manager import ProjectManagerAgent
-from .developer import DeveloperAgent
-from .tester import TesterAgent
-from .devops import DevOpsAgent
-from .business_analyst import BusinessAnalystAgent
-from .ux_designer import UXDesignerAgent
+from importlib import import_module
+
+# Agent classes are imported on first access so that importing the package stays cheap
+_AGENT_MODULES = {
+    'ProjectManagerAgent': '.project_manager',
+    'DeveloperAgent': '.developer',
+    'TesterAgent': '.tester',
+    'DevOpsAgent': '.devops',
+    'BusinessAnalystAgent': '.business_analyst',
+    'UXDesignerAgent': '.ux_designer'
+}
 
 __all__ = [
     'ProjectManagerAgent',
@@ -11,5 +16,21 @@ __all__ = [
     'TesterAgent',
     'DevOpsAgent',
     'BusinessAnalystAgent',
-    'UXDesignerAgent'
+    'UXDesignerAgent',
+    'AgentRegistry'
 ]
+
+
+def __getattr__(name):
+    if name in _AGENT_MODULES:
+        value = getattr(import_module(_AGENT_MODULES[name], __name__), name)
+    elif name == 'AgentRegistry':
+        from .registry import AgentRegistry as value
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,231 @@
+from contextlib import contextmanager, asynccontextmanager
+from collections import Counter
+import threading
+import asyncio
+import logging
+import math
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# LLM calls in flight per process and per agent type, calls allowed to wait, and their queue-time SLO
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY', 12))
+DEFAULT_MAX_PER_AGENT = int(os.environ.get('AGENT_MAX_CONCURRENCY_PER_AGENT', 4))
+DEFAULT_MAX_QUEUE = int(os.environ.get('AGENT_MAX_QUEUE', 24))
+DEFAULT_QUEUE_TIMEOUT = float(os.environ.get('AGENT_QUEUE_TIMEOUT', 10))
+
+
+class AgentOverloadedError(ValueError):
+    """Raised when an LLM call is refused because too many are already running or waiting."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentRateLimitError(ValueError):
+    """Raised when the LLM provider rejects a call with a rate limit or quota error."""
+
+    def __init__(self, message: str, retry_after: int = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bound the number of LLM calls running at once, globally and per agent type.
+
+    A call that finds no free slot waits in a bounded queue for at most
+    ``queue_timeout`` seconds (or what its deadline leaves). When the queue
+    is full the call is refused at once with AgentOverloadedError, whose
+    retry_after is estimated from recent call latency and the queue depth.
+    Threads wait with slot() and coroutines with aslot(); both share the
+    same slots and queue.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_per_agent: int = DEFAULT_MAX_PER_AGENT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        """
+        Args:
+            max_concurrency: Maximum LLM calls in flight in this process
+            max_per_agent: Maximum LLM calls in flight per agent type
+            max_queue: Maximum calls waiting for a slot
+            queue_timeout: Longest time a call may wait, in seconds
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_agent = max(1, max_per_agent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._running = Counter()
+        self._waiting = 0
+        self._async_waiters = []
+        self._latency = None
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+        self._counters = {'admitted': 0, 'queued': 0, 'rejected_full': 0, 'rejected_timeout': 0}
+
+    @contextmanager
+    def slot(self, agent_type: str, deadline=None):
+        """
+        Hold a call slot for agent_type while the block runs.
+
+        Args:
+            agent_type: The calling agent's type
+            deadline: Optional Deadline that shortens the wait
+
+        Raises:
+            AgentOverloadedError: when the queue is full or the wait times out
+        """
+        started = time.monotonic()
+        with self._condition:
+            if not self._has_room(agent_type):
+                self._reject_if_full(agent_type)
+                timeout = self.queue_timeout
+                if deadline is not None:
+                    timeout = min(timeout, deadline.remaining())
+
+                self._waiting += 1
+                self._counters['queued'] += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self._has_room(agent_type), timeout)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self._counters['rejected_timeout'] += 1
+                    raise AgentOverloadedError(
+                        f"{agent_type} agent waited {timeout:.1f}s without a free LLM slot",
+                        self._retry_after()
+                    )
+
+            waited = self._admit(agent_type, started)
+
+        call_started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(agent_type, time.monotonic() - call_started)
+
+    @asynccontextmanager
+    async def aslot(self, agent_type: str, deadline=None):
+        """
+        Hold a call slot for agent_type while the block runs, waiting without blocking the event loop.
+
+        Raises:
+            AgentOverloadedError: when the queue is full or the wait times out
+        """
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            admitted = self._has_room(agent_type)
+            if admitted:
+                self._admit(agent_type, started)
+            else:
+                self._reject_if_full(agent_type)
+                timeout = self.queue_timeout
+                if deadline is not None:
+                    timeout = min(timeout, deadline.remaining())
+                self._waiting += 1
+                self._counters['queued'] += 1
+
+        if not admitted:
+            try:
+                while True:
+                    waiter = loop.create_future()
+                    with self._condition:
+                        if self._has_room(agent_type):
+                            self._admit(agent_type, started)
+                            break
+                        remaining = timeout - (time.monotonic() - started)
+                        if remaining <= 0:
+                            self._counters['rejected_timeout'] += 1
+                            raise AgentOverloadedError(
+                                f"{agent_type} agent waited {timeout:.1f}s without a free LLM slot",
+                                self._retry_after()
+                            )
+                        self._async_waiters.append((loop, waiter))
+                    try:
+                        await asyncio.wait_for(waiter, remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                with self._condition:
+                    self._waiting -= 1
+
+        call_started = time.monotonic()
+        try:
+            yield time.monotonic() - started
+        finally:
+            self._release(agent_type, time.monotonic() - call_started)
+
+    def check(self, agent_type: str) -> None:
+        """
+        Refuse early when a new call for agent_type could not even queue.
+
+        Raises:
+            AgentOverloadedError: when there is no free slot and the queue is full
+        """
+        with self._condition:
+            if not self._has_room(agent_type):
+                self._reject_if_full(agent_type)
+
+    def stats(self) -> dict:
+        with self._condition:
+            admitted = self._counters['admitted']
+            stats = dict(self._counters)
+            stats.update({
+                'running': sum(self._running.values()),
+                'running_by_agent': {agent: count for agent, count in self._running.items() if count},
+                'queue_depth': self._waiting,
+                'max_concurrency': self.max_concurrency,
+                'max_per_agent': self.max_per_agent,
+                'max_queue': self.max_queue,
+                'avg_queue_ms': round(self._queue_time_total / admitted * 1000, 1) if admitted else 0.0,
+                'max_queue_ms': round(self._queue_time_max * 1000, 1),
+                'avg_call_ms': round(self._latency * 1000, 1) if self._latency is not None else None
+            })
+        return stats
+
+    def _admit(self, agent_type: str, started: float) -> float:
+        """Take a slot for agent_type; the lock is held. Returns the time spent waiting."""
+        self._running[agent_type] += 1
+        self._counters['admitted'] += 1
+        waited = time.monotonic() - started
+        self._queue_time_total += waited
+        self._queue_time_max = max(self._queue_time_max, waited)
+        return waited
+
+    def _release(self, agent_type: str, latency: float) -> None:
+        """Free a slot and wake every waiting thread and coroutine to compete for it."""
+        with self._condition:
+            self._running[agent_type] -= 1
+            # Smoothed call latency drives the Retry-After estimate
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(self._wake, waiter)
+
+    @staticmethod
+    def _wake(waiter) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def _has_room(self, agent_type: str) -> bool:
+        return (sum(self._running.values()) < self.max_concurrency
+                and self._running[agent_type] < self.max_per_agent)
+
+    def _reject_if_full(self, agent_type: str) -> None:
+        if self._waiting >= self.max_queue:
+            self._counters['rejected_full'] += 1
+            raise AgentOverloadedError(
+                f"Too many LLM calls are waiting ({self._waiting}); {agent_type} agent call refused",
+                self._retry_after()
+            )
+
+    def _retry_after(self) -> int:
+        """Seconds until the queue has likely drained, at least 1."""
+        latency = self._latency or 1.0
+        return max(1, math.ceil(latency * (self._waiting + 1) / self.max_concurrency))
@@ -1,11 +1,23 @@
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import (
+from langchain_core.messages import (
     HumanMessage,
     SystemMessage,
     AIMessage
 )
-import re
+from .memory_store import SessionMemoryStore, SessionMemory
+from .prompt_builder import PromptBuilder, PromptSection, PromptAssembly, count_tokens
+from .markers import scan_collaboration_markers
+from .response_cache import ResponseCache
+from .admission import AdmissionController, AgentRateLimitError
+from .circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from .model_router import output_limit, prompt_budget
+from .llm_transport import LLMTransport, MAX_RETRIES
+from .deadline import DeadlineExceeded
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from contextlib import contextmanager, asynccontextmanager
+import threading
+import asyncio
+import queue
+import time
 import logging
 import os
 
@@ -14,7 +26,38 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class BaseAgent:
-    # Supported OpenAI models with capabilities and use cases
+    # Conversation memory shared by all agents, keyed by project, agent and session
+    memory_store = SessionMemoryStore()
+
+    # Responses shared by all agents; see ResponseCache for configuration
+    response_cache = ResponseCache()
+
+    # Limits on concurrent LLM calls shared by all agents; see AdmissionController
+    admission = AdmissionController()
+
+    # Pooled keep-alive HTTP clients shared by every agent's and model's ChatOpenAI
+    llm_transport = LLMTransport()
+
+    # Per-model circuit breakers and latency profiles shared by all agents
+    circuit_breakers = CircuitBreakerRegistry()
+
+    # Runs both calls of a hedged request: two threads for each call admission lets run
+    hedge_pool = ThreadPoolExecutor(max_workers=2 * admission.max_concurrency, thread_name_prefix='llm-hedge')
+
+    # Optional per-model quota limiter (agents.rate_limiter.TokenRateLimiter), installed by the app
+    rate_limiter = None
+
+    # Optional per-call model choice (agents.model_router.ModelRouter), installed by the app
+    model_router = None
+
+    # Optional near-duplicate tier (agents.similarity_cache.SimilarityCache), installed by the app
+    similarity_cache = None
+
+    # Optional record/replay of LLM calls (agents.cassette.Cassette), installed by the app
+    cassette = None
+
+    # Supported OpenAI models with capabilities, use cases, USD prices per 1k tokens
+    # default account quotas (OpenAI usage tier 1) and models to use while a model's circuit is open
     SUPPORTED_MODELS = {
         "gpt-4": {
             "name": "GPT-4",
@@ -22,7 +65,25 @@ class BaseAgent:
             "context_length": 8192,
             "max_tokens": 4096,
             "temperature": 0.7,
-            "use_case": "Complex reasoning and analysis"
+            "use_case": "Complex reasoning and analysis",
+            "input_cost_per_1k": 0.03,
+            "output_cost_per_1k": 0.06,
+            "tokens_per_minute": 10000,
+            "requests_per_minute": 500,
+            "fallbacks": ["gpt-3.5-turbo"]
+        },
+        "gpt-4o": {
+            "name": "GPT-4o",
+            "description": "Fast multimodal flagship model with a large context window",
+            "context_length": 128000,
+            "max_tokens": 16384,
+            "temperature": 0.7,
+            "use_case": "Complex reasoning and long-context analysis",
+            "input_cost_per_1k": 0.0025,
+            "output_cost_per_1k": 0.01,
+            "tokens_per_minute": 30000,
+            "requests_per_minute": 500,
+            "fallbacks": ["gpt-4"]
         },
         "gpt-3.5-turbo": {
             "name": "GPT-3.5 Turbo",
@@ -30,25 +91,39 @@ class BaseAgent:
             "context_length": 4096,
             "max_tokens": 2048,
             "temperature": 0.7,
-            "use_case": "General purpose interactions"
+            "use_case": "General purpose interactions",
+            "input_cost_per_1k": 0.0005,
+            "output_cost_per_1k": 0.0015,
+            "tokens_per_minute": 200000,
+            "requests_per_minute": 3500
         },
         "o1-preview": {
             "name": "o1 Preview",
             "description": "Advanced reasoning model with internal chain of thought",
             "context_length": 128000,
             "max_output": 32768,
-            "use_case": "Complex problem solving, deep analysis, research tasks"
+            "use_case": "Complex problem solving, deep analysis, research tasks",
+            "input_cost_per_1k": 0.015,
+            "output_cost_per_1k": 0.06,
+            "tokens_per_minute": 30000,
+            "requests_per_minute": 500,
+            "fallbacks": ["gpt-4"]
         },
         "o1-mini": {
             "name": "o1 Mini",
             "description": "Specialized for code, math, and science tasks",
             "context_length": 128000,
             "max_output": 65536,
-            "use_case": "Technical implementation, mathematical analysis, scientific research"
+            "use_case": "Technical implementation, mathematical analysis, scientific research",
+            "input_cost_per_1k": 0.003,
+            "output_cost_per_1k": 0.012,
+            "tokens_per_minute": 200000,
+            "requests_per_minute": 500,
+            "fallbacks": ["gpt-4"]
         }
     }
 
-    def __init__(self, agent_type: str, system_message: str, model="gpt-4"):
+    def __init__(self, agent_type: str, system_message: str, model="gpt-4o"):
         """Initialize the agent with enhanced error handling and logging."""
         if not agent_type or not isinstance(agent_type, str):
             raise ValueError("Agent type must be a non-empty string")
@@ -58,6 +133,9 @@ class BaseAgent:
             
         try:
             self.agent_type = agent_type
+            if model not in self.SUPPORTED_MODELS:
+                raise ValueError(f"Unsupported model: {model}")
+            self.model = model
             self.system_message = SystemMessage(content=system_message)
             
             # Configure model with optimal settings based on role
@@ -67,26 +145,21 @@ class BaseAgent:
                     
                 # Configure model based on agent type and role
                 temperature = 0.7 if agent_type in ['pm', 'ba', 'uxd'] else 0.2
+                self.temperature = temperature
                 
                 # Use enhanced configuration with proper error handling
-                self.llm = ChatOpenAI(
-                    model=model,
-                    temperature=temperature,
-                    max_tokens=self.SUPPORTED_MODELS[model]['max_tokens'],
-                    request_timeout=90,
-                    max_retries=3,
-                    model_kwargs={
-                        'response_format': {"type": "text"}
-                    }
-                )
+                self.llm = self._create_llm(model)
+                self._llms = {(model, MAX_RETRIES): self.llm}
             except ValueError as e:
                 raise ValueError(f"Configuration error: {str(e)}")
             except Exception as e:
                 raise ValueError(f"Failed to initialize ChatGPT model: {str(e)}. Please check your API key and network connection.")
 
-            self.memory = ConversationBufferMemory(
-                return_messages=True,
-                memory_key="chat_history"
+            # Keep prompts within the model's context window
+            model_info = self.SUPPORTED_MODELS[model]
+            self.prompt_builder = PromptBuilder(
+                model_info['context_length'],
+                reserved_output=output_limit(model_info)
             )
             logger.info(f"Successfully initialized {agent_type} agent")
             
@@ -95,91 +168,774 @@ class BaseAgent:
             logger.error(error_msg)
             raise RuntimeError(error_msg)
 
+    def _create_llm(self, model: str, max_retries: int = MAX_RETRIES):
+        """
+        Build the chat client for one of the SUPPORTED_MODELS.
+
+        Timeouts and retries are those of the shared clients it is given
+        (see LLMTransport); ChatOpenAI ignores its own settings for them.
+        """
+        # Imported here: the client classes pull in most of langchain and openai
+        from langchain_community.chat_models import ChatOpenAI
+
+        model_info = self.SUPPORTED_MODELS[model]
+        if 'max_tokens' not in model_info:
+            # o1 models take max_completion_tokens, only the default temperature and no response_format
+            return ChatOpenAI(
+                model=model,
+                temperature=1,
+                model_kwargs={
+                    'max_completion_tokens': output_limit(model_info)
+                },
+                **self.llm_transport.chat_clients(max_retries)
+            )
+        return ChatOpenAI(
+            model=model,
+            temperature=self.temperature,
+            max_tokens=model_info['max_tokens'],
+            model_kwargs={
+                'response_format': {"type": "text"}
+            },
+            **self.llm_transport.chat_clients(max_retries)
+        )
+
+    def _get_llm(self, model: str, context: dict = None):
+        """
+        Return the client for a model, creating clients for other models on first use.
+
+        Calls with a deadline get a client that does not retry: the timeout
+        already spends the time left, so a retry would start after it.
+        """
+        max_retries = MAX_RETRIES if (context or {}).get('deadline') is None else 0
+        llm = self._llms.get((model, max_retries))
+        if llm is None:
+            llm = self._llms[model, max_retries] = self._create_llm(model, max_retries)
+        return llm
+
     def process_input(self, user_input: str, context: dict = None) -> dict:
         """
         Process user input with enhanced context management and error handling.
         
         Args:
             user_input: The user's message
-            context: Optional context dictionary
+            context: Optional context dictionary; 'project' and 'session'
+                select the conversation memory used for this call,
+                'no_cache' bypasses the response caches and 'deadline' (a
+                Deadline) bounds the LLM call's timeout. With 'speculative'
+                the turn is kept out of memory until adopt_turn()
             
         Returns:
             dict containing response and collaboration information
         """
         try:
-            if not user_input or not user_input.strip():
-                raise ValueError("User input cannot be empty")
-
-            logger.info(f"Processing input for {self.agent_type} agent")
-            
-            # Get complete chat history with enhanced logging
-            history = self.memory.chat_memory.messages
-            logger.debug(f"Retrieved {len(history)} message(s) from memory")
+            prompt, memory = self._prepare_turn(user_input, context)
             
-            # Construct a detailed prompt with full context and history
-            prompt = self._build_prompt(user_input, context, history)
-            logger.debug(f"Built prompt with context: {bool(context)}")
-            
-            # Add the user input to memory with validation
-            if isinstance(user_input, str) and user_input.strip():
-                self.memory.chat_memory.add_user_message(user_input)
-                logger.debug("Added user message to memory")
+            routed = self._route(user_input, prompt, memory, context)
+            response = self._cached_response(user_input, prompt, context, routed, memory)
+            if response is not None:
+                logger.info(f"Serving cached response for {self.agent_type} agent")
+                return self._complete_turn(response, memory, prompt, cached=True, model=routed)
             
             try:
                 # Generate response with enhanced error handling and logging
                 logger.info("Generating response from ChatGPT")
-                response = self.llm.invoke(prompt).content
-                
-                # Enhanced response validation
-                if not response or not isinstance(response, str):
-                    raise ValueError("Invalid response format from ChatGPT")
-                
-                if len(response.strip()) < 10:
-                    raise ValueError("Response too short or empty")
-                
-                # Log successful response generation
-                logger.info("Successfully generated response")
-                logger.debug(f"Response length: {len(response)}")
+                model = self._select_model(prompt, routed)
+                with self._llm_call(prompt, context, model) as usage:
+                    message = self._invoke(model, prompt, context)
+                    response = message.content
+                    usage['total_tokens'] = self._token_usage(message, prompt, response)
+                self._validate_response(response)
                     
             except ValueError as e:
                 logger.error(f"Response validation error: {str(e)}")
                 raise
                 
             except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Error generating response: {error_msg}")
-                
-                # Enhanced error classification
-                if any(err in error_msg.lower() for err in ["rate limit", "quota"]):
-                    raise ValueError("API rate limit exceeded. Please try again in a few moments.")
-                elif "invalid api key" in error_msg.lower():
-                    raise ValueError("Invalid API key. Please check your OpenAI API key configuration.")
-                elif any(err in error_msg.lower() for err in ["timeout", "timed out"]):
-                    raise ValueError("Request timed out. Please try again.")
-                else:
-                    raise ValueError(f"Failed to generate response: {error_msg}")
+                raise self._classify_llm_error(e)
+            
+            # Cached under the model that answered, which is not the routed one after a fallback
+            self._cache_response(user_input, prompt, context, model, response, memory)
+            return self._complete_turn(response, memory, prompt, model=model)
+            
+        except Exception as e:
+            logger.error(f"Error processing input: {str(e)}")
+            raise
+
+    async def aprocess_input(self, user_input: str, context: dict = None) -> dict:
+        """
+        process_input for coroutines, built on the async LLM client.
+
+        Waiting for quota, a call slot and the completion never blocks the
+        event loop, nor do the SQLite-backed cache and quota tiers, so one worker can hold many conversations that are
+        waiting on the network. Memory is updated between awaits, so turns
+        of the same session still add their messages whole.
+
+        Args:
+            user_input: The user's message
+            context: Optional context dictionary, as for process_input
+
+        Returns:
+            The same dict as process_input
+        """
+        try:
+            memory = await self._amemory_for_context(context)
+            prompt, memory = self._prepare_turn(user_input, context, memory)
+
+            routed = self._route(user_input, prompt, memory, context)
+            response = await self._acached_response(user_input, prompt, context, routed, memory)
+            if response is not None:
+                logger.info(f"Serving cached response for {self.agent_type} agent")
+                return self._complete_turn(response, memory, prompt, cached=True, model=routed)
+
+            try:
+                logger.info("Generating response from ChatGPT")
+                model = self._select_model(prompt, routed)
+                async with self._allm_call(prompt, context, model) as usage:
+                    message = await self._ainvoke(model, prompt, context)
+                    response = message.content
+                    usage['total_tokens'] = self._token_usage(message, prompt, response)
+                self._validate_response(response)
+
+            except ValueError as e:
+                logger.error(f"Response validation error: {str(e)}")
+                raise
+
+            except Exception as e:
+                raise self._classify_llm_error(e)
+
+            await self._acache_response(user_input, prompt, context, model, response, memory)
+            return self._complete_turn(response, memory, prompt, model=model)
+
+        except Exception as e:
+            logger.error(f"Error processing input: {str(e)}")
+            raise
+
+    def stream_input(self, user_input: str, context: dict = None):
+        """
+        Process user input, yielding response tokens as they arrive.
+        
+        Memory is updated and collaboration needs are analyzed once the
+        stream is finished, exactly as in process_input.
+        
+        Args:
+            user_input: The user's message
+            context: Optional context dictionary
             
-            # Add response to memory
-            self.memory.chat_memory.add_ai_message(response)
+        Yields:
+            Response tokens from ChatGPT
             
-            # Analyze collaboration needs
-            needs_collaboration, collaboration_requests = self._analyze_collaboration_needs(response)
+        Returns:
+            The same dict as process_input, as the generator's return value
+            (use ``result = yield from agent.stream_input(...)``)
+        """
+        try:
+            prompt, memory = self._prepare_turn(user_input, context)
             
-            # Get context summary
-            context_summary = self._get_context_summary()
+            routed = self._route(user_input, prompt, memory, context)
+            response = self._cached_response(user_input, prompt, context, routed, memory)
+            if response is not None:
+                logger.info(f"Serving cached response for {self.agent_type} agent")
+                yield response
+                return self._complete_turn(response, memory, prompt, cached=True, model=routed)
             
-            return {
-                'response': response,
-                'needs_collaboration': needs_collaboration,
-                'collaboration_requests': collaboration_requests,
-                'agent_type': self.agent_type,
-                'context_summary': context_summary
-            }
+            chunks = []
+            try:
+                logger.info("Streaming response from ChatGPT")
+                model = self._select_model(prompt, routed)
+                for token in self._admitted_stream(model, prompt, context):
+                    chunks.append(token)
+                    yield token
+                response = ''.join(chunks)
+                
+                self._validate_response(response)
+                
+            except ValueError as e:
+                logger.error(f"Response validation error: {str(e)}")
+                raise
+                
+            except Exception as e:
+                raise self._classify_llm_error(e)
+            
+            self._cache_response(user_input, prompt, context, model, response, memory)
+            return self._complete_turn(response, memory, prompt, model=model)
             
         except Exception as e:
             logger.error(f"Error processing input: {str(e)}")
             raise
 
+    def _route(self, user_input: str, prompt: PromptAssembly, memory: SessionMemory,
+               context: dict = None) -> str:
+        """Return the model the router picks for this call, or this agent's model without a router."""
+        if self.model_router is None:
+            return self.model
+        context = context or {}
+        deadline = context.get('deadline')
+        return self.model_router.route(
+            self.agent_type,
+            self.model,
+            prompt.usage.get('total', 0),
+            input_tokens=count_tokens(user_input),
+            collaborator='previous_responses' in context,
+            follow_up=len(memory) > 1 or bool(memory.summary),
+            deadline_remaining=deadline.remaining() if deadline is not None else None
+        )
+
+    def _select_model(self, prompt: PromptAssembly, preferred: str = None) -> str:
+        """
+        Pick the model for a call: the preferred model unless its circuit is open.
+
+        Its fallbacks from SUPPORTED_MODELS, then this agent's own model, are
+        tried in order, skipping those whose context window cannot hold the
+        prompt.
+
+        Raises:
+            CircuitOpenError: when no model can take the call
+        """
+        preferred = preferred or self.model
+        candidates = [preferred] + self.SUPPORTED_MODELS[preferred].get('fallbacks', [])
+        if self.model not in candidates:
+            candidates.append(self.model)
+        for model in candidates:
+            if model != preferred and prompt.usage.get('total', 0) > prompt_budget(self.SUPPORTED_MODELS[model]):
+                continue
+            if self.circuit_breakers.get(model).allow():
+                if model != preferred:
+                    self.circuit_breakers.record_fallback()
+                    logger.warning(f"{preferred} circuit is open; {self.agent_type} agent falls back to {model}")
+                return model
+
+        raise CircuitOpenError(
+            f"{preferred} is unavailable and no fallback model can take the call",
+            self.circuit_breakers.get(preferred).retry_after()
+        )
+
+    def _invoke(self, model: str, prompt: PromptAssembly, context: dict = None):
+        """Call a model, recording the outcome in its circuit breaker and hedging when enabled.
+
+        A replaying cassette answers instead of the model; a recording one stores the call.
+        """
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(self.agent_type, model, prompt.text)
+        llm = self._get_llm(model, context)
+        options = self._call_options(context)
+        breaker = self.circuit_breakers.get(model)
+        p95 = breaker.latency.percentile(95) if self.circuit_breakers.hedge else None
+
+        started = time.monotonic()
+        try:
+            if p95 is None:
+                message = llm.invoke(prompt.text, **options)
+            else:
+                message = self._hedged_invoke(model, llm, prompt, context, p95, breaker)
+        except Exception as e:
+            breaker.record_error(e)
+            raise
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+        if self.cassette is not None:
+            self.cassette.record(self.agent_type, model, prompt.text, message.content, latency)
+        return message
+
+    def _admitted_stream(self, model: str, prompt: PromptAssembly, context: dict = None):
+        """
+        Yield a model's response tokens, read by a thread that holds the call's quota and slot.
+
+        The thread reads the whole stream as fast as the model sends it, so
+        the slot is released when the model finishes rather than when a
+        slow client has read every token. Closing this generator early stops
+        the thread at its next token.
+        """
+        tokens = queue.Queue()
+        stop = threading.Event()
+        finished = object()
+
+        def read():
+            try:
+                with self._llm_call(prompt, context, model) as usage:
+                    chunks = []
+                    stream = self._stream_tokens(model, prompt, context)
+                    try:
+                        for token in stream:
+                            if stop.is_set():
+                                break
+                            chunks.append(token)
+                            tokens.put(token)
+                    finally:
+                        stream.close()
+                    usage['total_tokens'] = prompt.usage.get('total', 0) + count_tokens(''.join(chunks))
+                tokens.put(finished)
+            except BaseException as e:
+                tokens.put(e)
+
+        threading.Thread(target=read, name=f'{self.agent_type}-llm-stream', daemon=True).start()
+        try:
+            while True:
+                token = tokens.get()
+                if token is finished:
+                    return
+                if isinstance(token, BaseException):
+                    raise token
+                yield token
+        finally:
+            stop.set()
+
+    def _stream_tokens(self, model: str, prompt: PromptAssembly, context: dict = None):
+        """Yield a model's response tokens, recording the outcome in its circuit breaker."""
+        if self.cassette is not None and self.cassette.replaying:
+            # A replayed reply arrives as one token
+            yield self.cassette.replay(self.agent_type, model, prompt.text).content
+            return
+
+        breaker = self.circuit_breakers.get(model)
+        tokens = []
+        started = time.monotonic()
+        try:
+            for chunk in self._get_llm(model, context).stream(prompt.text, **self._call_options(context)):
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            breaker.record_error(e)
+            raise
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+        if self.cassette is not None:
+            self.cassette.record(self.agent_type, model, prompt.text, ''.join(tokens), latency)
+
+    def _hedged_invoke(self, model: str, llm, prompt: PromptAssembly, context: dict, delay: float, breaker):
+        """
+        Invoke, sending a duplicate call if the first has not answered after delay seconds.
+
+        The duplicate takes its own quota; when the model's budget cannot
+        cover it right away, no duplicate is sent. The first call to answer
+        successfully wins. When the first to finish failed, the other call
+        decides, so a hedge only fails if both calls do. The slower call
+        finishes in the background and its result is discarded.
+
+        With a deadline in the context, the duplicate's timeout is what is
+        left when it starts, every wait ends at the deadline, and no
+        duplicate is sent once it has passed.
+        """
+        deadline = (context or {}).get('deadline')
+        first = self.hedge_pool.submit(llm.invoke, prompt.text, **self._call_options(context))
+        try:
+            return first.result(timeout=self._hedge_wait(delay, deadline))
+        except FutureTimeout:
+            pass
+
+        try:
+            options = self._call_options(context)
+            reservation = self._reserve_hedge(model, prompt)
+        except (AgentRateLimitError, DeadlineExceeded):
+            return self._hedge_result(first, deadline)
+        second = self.hedge_pool.submit(llm.invoke, prompt.text, **options)
+        second.add_done_callback(lambda future: self._settle_hedge(reservation, prompt, future))
+
+        done, pending = wait([first, second], timeout=self._hedge_wait(None, deadline), return_when=FIRST_COMPLETED)
+        if not done:
+            raise self._hedge_deadline_error(deadline)
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is None:
+            # The first call to finish failed; the other one decides
+            winner = pending.pop() if pending else first
+        breaker.record_hedge(won=winner is second)
+        return self._hedge_result(winner, deadline)
+
+    @staticmethod
+    def _hedge_wait(delay: float, deadline):
+        """Seconds to wait for a hedged call: delay, cut to what the deadline leaves (None waits forever)."""
+        if deadline is None:
+            return delay
+        return deadline.remaining() if delay is None else min(delay, deadline.remaining())
+
+    def _hedge_deadline_error(self, deadline) -> DeadlineExceeded:
+        return DeadlineExceeded(
+            f"{self.agent_type} agent call stopped: the {deadline.seconds:g}s request deadline has passed"
+        )
+
+    def _hedge_result(self, future, deadline):
+        """A hedged call's result, waiting no longer than the deadline allows."""
+        try:
+            return future.result(timeout=self._hedge_wait(None, deadline))
+        except FutureTimeout:
+            if future.done():
+                raise
+            raise self._hedge_deadline_error(deadline)
+
+    def _reserve_hedge(self, model: str, prompt: PromptAssembly):
+        """
+        Take the quota of a duplicate call, without waiting for it.
+
+        Raises:
+            AgentRateLimitError: when the model's budget cannot cover it now
+        """
+        if self.rate_limiter is None:
+            return None
+        return self.rate_limiter.try_reserve(model, prompt.usage.get('total', 0))
+
+    async def _areserve_hedge(self, model: str, prompt: PromptAssembly):
+        """_reserve_hedge for coroutines."""
+        if self.rate_limiter is None:
+            return None
+        return await self.rate_limiter.atry_reserve(model, prompt.usage.get('total', 0))
+
+    def _settle_hedge(self, reservation, prompt: PromptAssembly, future) -> None:
+        """Reconcile a duplicate call's quota once its future or task is done."""
+        if reservation is None:
+            return
+        if future.cancelled() or future.exception() is not None:
+            self.rate_limiter.reconcile(reservation)
+            return
+        message = future.result()
+        self.rate_limiter.reconcile(reservation, self._token_usage(message, prompt, message.content))
+
+    async def _ainvoke(self, model: str, prompt: PromptAssembly, context: dict = None):
+        """_invoke for coroutines."""
+        if self.cassette is not None and self.cassette.replaying:
+            return await self.cassette.areplay(self.agent_type, model, prompt.text)
+        llm = self._get_llm(model, context)
+        options = self._call_options(context)
+        breaker = self.circuit_breakers.get(model)
+        p95 = breaker.latency.percentile(95) if self.circuit_breakers.hedge else None
+
+        started = time.monotonic()
+        try:
+            if p95 is None:
+                message = await llm.ainvoke(prompt.text, **options)
+            else:
+                message = await self._ahedged_invoke(model, llm, prompt, context, p95, breaker)
+        except Exception as e:
+            breaker.record_error(e)
+            raise
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+        if self.cassette is not None:
+            self.cassette.record(self.agent_type, model, prompt.text, message.content, latency)
+        return message
+
+    async def _ahedged_invoke(self, model: str, llm, prompt: PromptAssembly, context: dict, delay: float, breaker):
+        """_hedged_invoke for coroutines; the losing call, and any call still running at the deadline, is cancelled."""
+        deadline = (context or {}).get('deadline')
+        first = asyncio.ensure_future(llm.ainvoke(prompt.text, **self._call_options(context)))
+        done, _ = await asyncio.wait([first], timeout=self._hedge_wait(delay, deadline))
+        if done:
+            return first.result()
+
+        try:
+            options = self._call_options(context)
+            reservation = await self._areserve_hedge(model, prompt)
+        except (AgentRateLimitError, DeadlineExceeded):
+            return await self._ahedge_result(first, deadline)
+        second = asyncio.ensure_future(llm.ainvoke(prompt.text, **options))
+        if reservation is not None:
+            # Settled on a worker thread: a shared limiter writes SQLite
+            second.add_done_callback(lambda task: asyncio.get_running_loop().run_in_executor(
+                None, self._settle_hedge, reservation, prompt, task
+            ))
+
+        done, pending = await asyncio.wait(
+            [first, second], timeout=self._hedge_wait(None, deadline), return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            first.cancel()
+            second.cancel()
+            raise self._hedge_deadline_error(deadline)
+        winner = next((task for task in done if task.exception() is None), None)
+        if winner is None:
+            # The first call to finish failed; the other one decides
+            winner = pending.pop() if pending else first
+        for task in pending:
+            if task is not winner:
+                task.cancel()
+        breaker.record_hedge(won=winner is second)
+        return await self._ahedge_result(winner, deadline)
+
+    async def _ahedge_result(self, task, deadline):
+        """_hedge_result for coroutines; the call is cancelled when the deadline passes."""
+        done, _ = await asyncio.wait([task], timeout=self._hedge_wait(None, deadline))
+        if not done:
+            task.cancel()
+            raise self._hedge_deadline_error(deadline)
+        return task.result()
+
+    def _cache_key(self, prompt: PromptAssembly, context: dict = None, model: str = None):
+        """Return the response cache key for a prompt sent to a model, or None to bypass the cache."""
+        if not self.response_cache.enabled or (context or {}).get('no_cache'):
+            return None
+        return ResponseCache.make_key(self.agent_type, model or self.model, self.temperature, prompt.text)
+
+    @contextmanager
+    def _llm_call(self, prompt: PromptAssembly, context: dict = None, model: str = None):
+        """
+        Reserve the model's quota and a concurrency slot around one LLM call.
+
+        Yields a dict in which the call stores its 'total_tokens' so the
+        quota reservation can be reconciled with what was really used.
+        """
+        deadline = (context or {}).get('deadline')
+        reservation = None
+        if self.rate_limiter is not None:
+            reservation = self.rate_limiter.reserve(model or self.model, prompt.usage.get('total', 0), deadline)
+
+        usage = {}
+        admitted = False
+        try:
+            with self.admission.slot(self.agent_type, deadline):
+                admitted = True
+                yield usage
+        finally:
+            if reservation is not None:
+                if admitted:
+                    self.rate_limiter.reconcile(reservation, usage.get('total_tokens'))
+                else:
+                    # Refused a slot: the call never reached the model
+                    self.rate_limiter.refund(reservation)
+
+    @asynccontextmanager
+    async def _allm_call(self, prompt: PromptAssembly, context: dict = None, model: str = None):
+        """_llm_call for coroutines: quota and slot waits do not block the event loop."""
+        deadline = (context or {}).get('deadline')
+        reservation = None
+        if self.rate_limiter is not None:
+            reservation = await self.rate_limiter.areserve(
+                model or self.model, prompt.usage.get('total', 0), deadline
+            )
+
+        usage = {}
+        admitted = False
+        try:
+            async with self.admission.aslot(self.agent_type, deadline):
+                admitted = True
+                yield usage
+        finally:
+            if reservation is not None:
+                if admitted:
+                    await self.rate_limiter.areconcile(reservation, usage.get('total_tokens'))
+                else:
+                    # Refused a slot: the call never reached the model
+                    await self.rate_limiter.arefund(reservation)
+
+    @staticmethod
+    def _token_usage(message, prompt: PromptAssembly, response: str) -> int:
+        """Tokens reported by the provider, or the prompt's count plus the response's."""
+        token_usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage') or {}
+        return token_usage.get('total_tokens') or prompt.usage.get('total', 0) + count_tokens(response)
+
+    def _call_options(self, context: dict = None) -> dict:
+        """Per-call client options; the timeout is cut to what the request's deadline leaves."""
+        deadline = (context or {}).get('deadline')
+        if deadline is None:
+            return {}
+        return {'timeout': deadline.check(f"{self.agent_type} agent call")}
+
+    def _similarity_key(self, user_input: str, context: dict = None, memory: SessionMemory = None):
+        """
+        Return what the near-duplicate cache compares, or None to bypass it.
+
+        Returns:
+            (text, conversation): the input, project and requests compared by
+            similarity, and the fingerprint of the conversation history and
+            summary, which must match exactly
+        """
+        context = context or {}
+        if self.similarity_cache is None or context.get('no_cache'):
+            return None
+        project = context.get('project') or {}
+        parts = [user_input, project.get('name', ''), project.get('description', '')]
+        requests = context.get('requests')
+        if requests:
+            parts.extend([requests] if isinstance(requests, str) else requests)
+        conversation = memory.fingerprint() if memory is not None else None
+        return '\n'.join(str(part) for part in parts if part), conversation
+
+    def _cached_response(self, user_input: str, prompt: PromptAssembly, context: dict = None,
+                         model: str = None, memory: SessionMemory = None):
+        """
+        Look up a model's reply to a prompt in the exact cache, then in the near-duplicate cache.
+
+        Returns:
+            The cached response, or None on a miss
+        """
+        model = model or self.model
+        cache_key = self._cache_key(prompt, context, model)
+        response = self.response_cache.get(cache_key) if cache_key else None
+        if response is None:
+            similarity_key = self._similarity_key(user_input, context, memory)
+            if similarity_key:
+                response = self.similarity_cache.lookup(self.agent_type, model, *similarity_key)
+        self._record_cached(model, prompt, response)
+        return response
+
+    def _record_cached(self, model: str, prompt: PromptAssembly, response) -> None:
+        """Add a cache-served reply to a recording cassette, so replays without the cache find it."""
+        if response is not None and self.cassette is not None and not self.cassette.replaying:
+            self.cassette.record(self.agent_type, model, prompt.text, response, 0.0, cached=True)
+
+    def _cache_response(self, user_input: str, prompt: PromptAssembly, context: dict, model: str,
+                        response: str, memory: SessionMemory = None) -> None:
+        """Store a model's fresh response in every enabled cache."""
+        cache_key = self._cache_key(prompt, context, model)
+        if cache_key:
+            self.response_cache.set(cache_key, response)
+        similarity_key = self._similarity_key(user_input, context, memory)
+        if similarity_key:
+            text, conversation = similarity_key
+            self.similarity_cache.add(self.agent_type, model, text, response, conversation)
+
+    async def _acached_response(self, user_input: str, prompt: PromptAssembly, context: dict = None,
+                                model: str = None, memory: SessionMemory = None):
+        """_cached_response for coroutines: the SQLite tier is read on a worker thread."""
+        model = model or self.model
+        cache_key = self._cache_key(prompt, context, model)
+        response = await self.response_cache.aget(cache_key) if cache_key else None
+        if response is None:
+            similarity_key = self._similarity_key(user_input, context, memory)
+            if similarity_key:
+                response = self.similarity_cache.lookup(self.agent_type, model, *similarity_key)
+        self._record_cached(model, prompt, response)
+        return response
+
+    async def _acache_response(self, user_input: str, prompt: PromptAssembly, context: dict, model: str,
+                               response: str, memory: SessionMemory = None) -> None:
+        """_cache_response for coroutines: the SQLite tier is written on a worker thread."""
+        cache_key = self._cache_key(prompt, context, model)
+        if cache_key:
+            await self.response_cache.aset(cache_key, response)
+        similarity_key = self._similarity_key(user_input, context, memory)
+        if similarity_key:
+            text, conversation = similarity_key
+            self.similarity_cache.add(self.agent_type, model, text, response, conversation)
+
+    def get_memory(self, project_id=None, session: str = None) -> SessionMemory:
+        """Return this agent's conversation memory for a project and session."""
+        return self.memory_store.get(project_id, self.agent_type, session)
+
+    async def _amemory_for_context(self, context: dict = None) -> SessionMemory:
+        """_memory_for_context for coroutines."""
+        context = context or {}
+        project_id = (context.get('project') or {}).get('id')
+        return await self.memory_store.aget(project_id, self.agent_type, context.get('session'))
+
+    def _memory_for_context(self, context: dict = None) -> SessionMemory:
+        """Select the conversation memory for a call's context."""
+        context = context or {}
+        project_id = (context.get('project') or {}).get('id')
+        memory = self.get_memory(project_id, context.get('session'))
+        # Speculative calls work on a copy, so a discarded one leaves no trace in the history
+        if context.get('speculative'):
+            return memory.fork()
+        return memory
+
+    def adopt_turn(self, user_input: str, result: dict, context: dict = None) -> dict:
+        """
+        Commit a speculative call's turn to its session memory once its result is used.
+
+        Returns:
+            The result with its context summary taken from the updated memory
+        """
+        context = {key: value for key, value in (context or {}).items() if key != 'speculative'}
+        memory = self._memory_for_context(context)
+        memory.add_user_message(user_input)
+        memory.add_ai_message(result['response'], result.get('collaboration_requests'))
+        return dict(result, context_summary=self._get_context_summary(memory))
+
+    def record_turn(self, user_input: str, response: str, context: dict = None) -> None:
+        """Add a turn answered by another request, such as a coalesced leader, to the context's memory."""
+        memory = self._memory_for_context(context)
+        memory.add_user_message(user_input)
+        memory.add_ai_message(response, self._analyze_collaboration_needs(response)[1])
+
+    def _prepare_turn(self, user_input: str, context: dict = None, memory: SessionMemory = None) -> tuple:
+        """Validate the input, build the prompt and record the user message in memory (the context's by default)."""
+        if not user_input or not user_input.strip():
+            raise ValueError("User input cannot be empty")
+
+        # Fail before touching memory when the request is already out of time
+        deadline = (context or {}).get('deadline')
+        if deadline is not None:
+            deadline.check(f"{self.agent_type} agent call")
+
+        logger.info(f"Processing input for {self.agent_type} agent")
+        
+        # Get the session's bounded chat history with enhanced logging
+        if memory is None:
+            memory = self._memory_for_context(context)
+        history = memory.messages
+        logger.debug(f"Retrieved {len(history)} message(s) from memory")
+        
+        # Construct a detailed prompt with full context and history
+        prompt = self._assemble_prompt(user_input, context, history, memory.summary)
+        logger.debug(f"Built prompt with context: {bool(context)}, tokens: {prompt.usage}")
+        
+        # Add the user input to memory with validation
+        if isinstance(user_input, str) and user_input.strip():
+            memory.add_user_message(user_input)
+            logger.debug("Added user message to memory")
+        
+        return prompt, memory
+
+    def _validate_response(self, response) -> None:
+        """Reject empty or malformed completions."""
+        if not response or not isinstance(response, str):
+            raise ValueError("Invalid response format from ChatGPT")
+        
+        if len(response.strip()) < 10:
+            raise ValueError("Response too short or empty")
+        
+        # Log successful response generation
+        logger.info("Successfully generated response")
+        logger.debug(f"Response length: {len(response)}")
+
+    def _classify_llm_error(self, error: Exception) -> ValueError:
+        """Translate a client error into a user-facing ValueError."""
+        error_msg = str(error)
+        logger.error(f"Error generating response: {error_msg}")
+        
+        # Enhanced error classification
+        if any(err in error_msg.lower() for err in ["rate limit", "quota"]):
+            return AgentRateLimitError(
+                "API rate limit exceeded. Please try again in a few moments.",
+                self._retry_after_hint(error)
+            )
+        elif "invalid api key" in error_msg.lower():
+            return ValueError("Invalid API key. Please check your OpenAI API key configuration.")
+        elif any(err in error_msg.lower() for err in ["timeout", "timed out"]):
+            return ValueError("Request timed out. Please try again.")
+        else:
+            return ValueError(f"Failed to generate response: {error_msg}")
+
+    @staticmethod
+    def _retry_after_hint(error: Exception):
+        """Read the provider's Retry-After header from a client error, if it sent one."""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            return max(1, int(float(headers.get('retry-after'))))
+        except (TypeError, ValueError):
+            return None
+
+    def _complete_turn(self, response: str, memory: SessionMemory, prompt: PromptAssembly,
+                       cached: bool = False, model: str = None) -> dict:
+        """Record the response in memory and analyze collaboration needs."""
+        # Analyze collaboration needs
+        needs_collaboration, collaboration_requests = self._analyze_collaboration_needs(response)
+        
+        # Add response to memory, indexing the requests it makes
+        memory.add_ai_message(response, collaboration_requests)
+        
+        # Get context summary
+        context_summary = self._get_context_summary(memory)
+        
+        return {
+            'response': response,
+            'needs_collaboration': needs_collaboration,
+            'collaboration_requests': collaboration_requests,
+            'agent_type': self.agent_type,
+            'context_summary': context_summary,
+            'prompt_usage': prompt.usage,
+            'cached': cached,
+            'model': model or self.model
+        }
+
     def _get_relevant_history(self, history: list, max_messages: int = 10) -> list:
         """
         Select relevant messages from conversation history.
@@ -207,153 +963,98 @@ class BaseAgent:
         
         return filtered_history
     
-    def _build_prompt(self, user_input: str, context: dict = None, history: list = None) -> str:
+    def _build_prompt(self, user_input: str, context: dict = None, history: list = None,
+                      summary: str = None) -> str:
         """Build a comprehensive prompt with enhanced context management."""
-        prompt = f"{self.system_message.content}\n\n"
+        return self._assemble_prompt(user_input, context, history, summary).text
+
+    def _assemble_prompt(self, user_input: str, context: dict = None, history: list = None,
+                         summary: str = None) -> PromptAssembly:
+        """
+        Build the prompt within the model's context window.
+        
+        Sections are kept in priority order (requests, project, conversation
+        summary, previous agent responses, history) and the lowest-priority
+        content is truncated or dropped first when the prompt would not fit.
+        
+        Returns:
+            PromptAssembly with the prompt text and per-section token usage
+        """
+        context = context or {}
+        sections = []
+        
+        # Rolling summary of the conversation before the history window
+        if summary:
+            sections.append(PromptSection(
+                'summary', "Summary of earlier conversation:", [f"{summary}\n"],
+                priority=2, mode='truncate', max_share=0.15
+            ))
         
         # Add curated conversation history with context preservation
         if history:
-            prompt += "Previous conversation history:\n"
             # Filter and format relevant history
-            relevant_history = self._get_relevant_history(history)
-            for msg in relevant_history:
+            lines = []
+            for msg in self._get_relevant_history(history):
                 if isinstance(msg, HumanMessage):
-                    prompt += f"User: {msg.content}\n"
+                    lines.append(f"User: {msg.content}\n")
                 elif isinstance(msg, AIMessage):
-                    prompt += f"{self.agent_type.upper()}: {msg.content}\n"
-            prompt += "\n"
-        
-        # Enhanced context integration
-        if context:
-            # Project context with structured formatting
-            if context.get('project'):
-                prompt += "Project Context:\n"
-                project_data = context['project']
-                # Prioritize key project information
-                key_fields = ['name', 'description', 'status']
-                for field in key_fields:
-                    if field in project_data:
-                        prompt += f"{field.title()}: {project_data[field]}\n"
-                # Add any additional project context
-                for key, value in project_data.items():
-                    if key not in key_fields:
-                        prompt += f"{key}: {value}\n"
-                prompt += "\n"
-            
-            # Previous agent responses with improved formatting
-            if context.get('previous_responses'):
-                prompt += "Previous agent responses:\n"
-                for agent_type, response in context['previous_responses'].items():
-                    prompt += f"{agent_type.upper()}: {response}\n"
-                prompt += "\n"
-            
-            # Structured request handling
-            if context.get('requests'):
-                prompt += "Specific requests:\n"
-                if isinstance(context['requests'], list):
-                    for request in context['requests']:
-                        prompt += f"- {request}\n"
-                elif isinstance(context['requests'], str):
-                    prompt += f"- {context['requests']}\n"
-                prompt += "\n"
-        
-        prompt += f"User input: {user_input}\n\n"
-        prompt += "If you need input from other agents, use [NEED_AGENT_TYPE: message] format:\n"
-        prompt += "[NEED_DEV: technical implementation details]\n"
-        prompt += "[NEED_TEST: testing requirements]\n"
-        prompt += "[NEED_DEVOPS: deployment needs]\n"
-        prompt += "[NEED_PM: project management aspects]\n"
-        prompt += "[NEED_BA: business analysis needs]\n"
-        prompt += "[NEED_UX: design requirements]"
-        
-        return prompt
-    
-    def _analyze_collaboration_needs(self, response: str) -> tuple:
-        agent_display_names = {
-            'dev': 'Developer',
-            'tester': 'Tester',
-            'devops': 'DevOps',
-            'pm': 'PM',
-            'ba': 'Business Analyst',
-            'uxd': 'UX Designer'
-        }
-        
-        need_patterns = {
-            'dev': r'Developer\s*->\s*Task for Developer\s*\[(.*?)\]',
-            'tester': r'Tester\s*->\s*Task for Tester\s*\[(.*?)\]',
-            'devops': r'DevOps\s*->\s*Task for DevOps\s*\[(.*?)\]',
-            'pm': r'PM\s*->\s*Task for PM\s*\[(.*?)\]',
-            'ba': r'Business Analyst\s*->\s*Task for Business Analyst\s*\[(.*?)\]',
-            'uxd': r'UX Designer\s*->\s*Task for UX Designer\s*\[(.*?)\]'
-        }
-        
-        needed_agents = []
-        collaboration_requests = {}
+                    lines.append(f"{self.agent_type.upper()}: {msg.content}\n")
+            sections.append(PromptSection(
+                'history', "Previous conversation history:", lines,
+                priority=4, mode='oldest', max_share=0.3, always_header=True
+            ))
         
-        # Convert old format to new format
-        old_patterns = {
-            'dev': r'\[NEED_DEV:(.*?)\]',
-            'tester': r'\[NEED_TEST:(.*?)\]',
-            'devops': r'\[NEED_DEVOPS:(.*?)\]',
-            'pm': r'\[NEED_PM:(.*?)\]',
-            'ba': r'\[NEED_BA:(.*?)\]'
-        }
+        # Project context with structured formatting
+        if context.get('project'):
+            project_data = context['project']
+            # Prioritize key project information
+            key_fields = ['name', 'description', 'status']
+            lines = [f"{field.title()}: {project_data[field]}\n" for field in key_fields if field in project_data]
+            # Add any additional project context
+            lines.extend(f"{key}: {value}\n" for key, value in project_data.items() if key not in key_fields)
+            sections.append(PromptSection('project', "Project Context:", lines, priority=1, max_share=0.2))
         
-        modified_response = response
+        # Previous agent responses with improved formatting
+        if context.get('previous_responses'):
+            lines = [
+                f"{agent_type.upper()}: {response}\n"
+                for agent_type, response in context['previous_responses'].items()
+            ]
+            sections.append(PromptSection(
+                'peers', "Previous agent responses:", lines,
+                priority=3, mode='truncate', max_share=0.6
+            ))
         
-        # Replace old format with new format
-        for agent, pattern in old_patterns.items():
-            matches = re.findall(pattern, modified_response, re.IGNORECASE | re.DOTALL)
-            for match in matches:
-                old_text = f'[NEED_{agent.upper()}:{match}]'
-                new_text = f'{agent_display_names[agent]} -> Task for {agent_display_names[agent]} [{match.strip()}]'
-                modified_response = modified_response.replace(old_text, new_text)
+        # Structured request handling
+        if context.get('requests'):
+            requests = context['requests']
+            if isinstance(requests, str):
+                requests = [requests]
+            lines = [f"- {request}\n" for request in requests] if isinstance(requests, list) else []
+            sections.append(PromptSection(
+                'requests', "Specific requests:", lines, priority=0, max_share=0.3, always_header=True
+            ))
         
-        # Check for collaboration requests using enhanced pattern matching
-        for agent, pattern in need_patterns.items():
-            if agent != self.agent_type:
-                matches = re.findall(pattern, modified_response, re.IGNORECASE | re.DOTALL)
-                if matches:
-                    needed_agents.append(agent)
-                    collaboration_requests[agent] = [req.strip() for req in matches]
+        tail = f"User input: {user_input}\n\n"
+        tail += "If you need input from other agents, use [NEED_AGENT_TYPE: message] format:\n"
+        tail += "[NEED_DEV: technical implementation details]\n"
+        tail += "[NEED_TEST: testing requirements]\n"
+        tail += "[NEED_DEVOPS: deployment needs]\n"
+        tail += "[NEED_PM: project management aspects]\n"
+        tail += "[NEED_BA: business analysis needs]\n"
+        tail += "[NEED_UX: design requirements]"
         
-        return needed_agents, collaboration_requests
+        return self.prompt_builder.build(f"{self.system_message.content}\n\n", sections, tail)
     
-    def _get_context_summary(self) -> str:
-        """Store conversation history for memory but don't display in UI"""
+    def _analyze_collaboration_needs(self, response: str) -> tuple:
+        """Find the agents this response delegates to and what it asks of each."""
+        return scan_collaboration_markers(response, exclude=self.agent_type)
+    
+    def _get_context_summary(self, memory: SessionMemory) -> str:
+        """Return the session's bounded context summary from its incremental index."""
         try:
-            history = self.memory.chat_memory.messages
-            if not history:
-                return None
-            
-            # Store context but don't format for display
-            message_pairs = {}
-            current_user_msg = None
-            
-            for msg in history:
-                if not hasattr(msg, 'content'):
-                    continue
-                    
-                msg_content = msg.content.strip()
-                if not msg_content:
-                    continue
-                    
-                is_user = isinstance(msg, HumanMessage)
-                
-                if is_user:
-                    current_user_msg = msg_content
-                elif current_user_msg is not None:
-                    msg_hash = hash(f"{current_user_msg}:{msg_content}")
-                    if msg_hash not in message_pairs:
-                        message_pairs[msg_hash] = {
-                            'user': current_user_msg,
-                            'agent': msg_content,
-                            'timestamp': len(message_pairs)
-                        }
-                    current_user_msg = None
-                    
-            # Return None to hide context from UI while keeping it in memory
-            return None
-            
+            with memory.lock:
+                return memory.index.summary()
         except Exception as e:
-            return None
\ No newline at end of file
+            logger.warning(f"Failed to summarize context: {str(e)}")
+            return None
@@ -130,4 +130,4 @@ class BusinessAnalystAgent(BaseAgent):
         Provide specific examples and metrics where possible.
         Always consider market context and competitive landscape in your analysis.
         """
-        super().__init__("ba", system_message)
+        super().__init__("ba", system_message, model)
@@ -0,0 +1,189 @@
+from collections import defaultdict, deque
+import threading
+import asyncio
+import hashlib
+import logging
+import json
+import time
+
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+MODES = ('record', 'replay')
+
+# 'original' replays each call with its recorded latency, 'zero' answers at once
+LATENCY_MODES = ('original', 'zero')
+
+
+class CassetteMissError(LookupError):
+    """Raised when a replay has no recorded call to answer with."""
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+
+class Cassette:
+    """
+    Append-only JSON Lines record of LLM calls, for deterministic replays.
+
+    Recording stores one line per call: the prompt's hash, the agent, the
+    model, the response and the call's latency. Turns answered by a
+    response cache are stored too, flagged as cached with no latency, so a
+    replay with the caches off still finds them. It also stores one line per
+    interaction with the request that started it, so a replay can send the
+    same requests again (see benchmarks/bench_replay.py). Replay answers
+    each call with the recorded response for the same prompt and model. A
+    prompt seen several times is answered in recorded order.
+
+    Prompts include conversation history and project details, so a replay
+    in a different order than the recording, or against a different
+    database, can build prompts that were never recorded. Outside strict mode those calls get the agent's next unused
+    recording for the same model, and are counted as fallbacks.
+    """
+
+    def __init__(self, path: str, mode: str = 'record', latency: str = 'original', strict: bool = False):
+        """
+        Args:
+            path: Cassette file; appended to when recording
+            mode: 'record' or 'replay'
+            latency: 'original' or 'zero'; how long replayed calls take
+            strict: Raise CassetteMissError instead of falling back when
+                replaying a prompt that was not recorded
+        """
+        if mode not in MODES:
+            raise ValueError(f"Invalid cassette mode '{mode}'; expected one of {', '.join(MODES)}")
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Invalid cassette latency '{latency}'; expected one of {', '.join(LATENCY_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._counters = {'recorded': 0, 'recorded_cached': 0, 'replayed': 0, 'fallbacks': 0, 'misses': 0,
+                          'interactions': 0}
+        self._file = None
+        self._calls = []
+        self._interactions = []
+        self._by_prompt = defaultdict(deque)
+        self._by_agent = defaultdict(deque)
+        self._served = set()
+
+        if mode == 'record':
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def record(self, agent_type: str, model: str, prompt: str, response: str, latency: float,
+               cached: bool = False) -> None:
+        """Append one LLM call, or with cached a reply served by a response cache."""
+        entry = {'kind': 'llm', 'hash': prompt_hash(prompt), 'agent': agent_type, 'model': model,
+                 'latency_ms': round(latency * 1000, 1), 'response': response}
+        if cached:
+            entry['cached'] = True
+        self._append(entry)
+        with self._lock:
+            self._counters['recorded'] += 1
+            if cached:
+                self._counters['recorded_cached'] += 1
+
+    def record_interaction(self, request: dict) -> None:
+        """Append the request that starts an interaction."""
+        self._append({'kind': 'interaction', 'request': request})
+        with self._lock:
+            self._counters['interactions'] += 1
+
+    def interactions(self) -> list:
+        """Requests of the recorded interactions, in recorded order."""
+        return list(self._interactions)
+
+    def replay(self, agent_type: str, model: str, prompt: str) -> AIMessage:
+        """Answer a call from the cassette, waiting its recorded latency unless latency is 'zero'."""
+        call = self._next_call(agent_type, model, prompt)
+        if self.latency == 'original':
+            time.sleep(call['latency_ms'] / 1000)
+        return AIMessage(content=call['response'])
+
+    async def areplay(self, agent_type: str, model: str, prompt: str) -> AIMessage:
+        """replay for coroutines."""
+        call = self._next_call(agent_type, model, prompt)
+        if self.latency == 'original':
+            await asyncio.sleep(call['latency_ms'] / 1000)
+        return AIMessage(content=call['response'])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update({'path': self.path, 'mode': self.mode, 'latency': self.latency, 'calls': len(self._calls)})
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError(f"Cassette {self.path} is not recording")
+            self._file.write(line)
+            self._file.flush()
+
+    def _load(self) -> None:
+        with open(self.path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted recording
+                    logger.warning(f"Skipping unreadable line {number} of cassette {self.path}")
+                    continue
+                if entry.get('kind') == 'interaction':
+                    self._interactions.append(entry['request'])
+                elif entry.get('kind') == 'llm':
+                    index = len(self._calls)
+                    self._calls.append(entry)
+                    self._by_prompt[(entry['hash'], entry['model'])].append(index)
+                    self._by_agent[(entry['agent'], entry['model'])].append(index)
+        logger.info(f"Loaded {len(self._calls)} call(s) and {len(self._interactions)} interaction(s) "
+                    f"from cassette {self.path}")
+
+    def _next_call(self, agent_type: str, model: str, prompt: str) -> dict:
+        with self._lock:
+            index = self._take(self._by_prompt.get((prompt_hash(prompt), model)), reuse_last=True)
+            if index is not None:
+                self._counters['replayed'] += 1
+                return self._calls[index]
+
+            if not self.strict:
+                index = self._take(self._by_agent.get((agent_type, model)), reuse_last=False)
+                if index is not None:
+                    self._counters['replayed'] += 1
+                    self._counters['fallbacks'] += 1
+                    return self._calls[index]
+
+            self._counters['misses'] += 1
+        raise CassetteMissError(f"No recorded {model} call for this {agent_type} prompt in cassette {self.path}")
+
+    def _take(self, indexes: deque, reuse_last: bool):
+        """Pop the first unserved call; with reuse_last the last one keeps answering once all are served."""
+        while indexes:
+            index = indexes[0]
+            if index not in self._served:
+                if len(indexes) > 1 or not reuse_last:
+                    indexes.popleft()
+                self._served.add(index)
+                return index
+            if len(indexes) == 1 and reuse_last:
+                return index
+            indexes.popleft()
+        return None
@@ -0,0 +1,225 @@
+from collections import deque
+import threading
+import logging
+import math
+import time
+import os
+
+from .admission import AgentOverloadedError
+
+logger = logging.getLogger(__name__)
+
+# Outcomes considered, share of failures that opens a breaker, and how long it stays open
+DEFAULT_WINDOW = int(os.environ.get('AGENT_BREAKER_WINDOW', 20))
+DEFAULT_MIN_CALLS = int(os.environ.get('AGENT_BREAKER_MIN_CALLS', 5))
+DEFAULT_FAILURE_RATE = float(os.environ.get('AGENT_BREAKER_FAILURE_RATE', 0.5))
+DEFAULT_RESET_TIMEOUT = float(os.environ.get('AGENT_BREAKER_RESET_TIMEOUT', 30))
+
+# Send a duplicate call when the first outlives the model's p95
+DEFAULT_HEDGE = os.environ.get('AGENT_HEDGE_REQUESTS') == '1'
+
+# A call slower than this many times the model's p95 counts as a failure
+DEFAULT_OUTLIER_FACTOR = 3.0
+
+# Latency samples needed before p95 is trusted for outliers and hedging
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(AgentOverloadedError):
+    """Raised when every model able to serve a call has an open circuit breaker."""
+
+
+def is_outage(error: Exception) -> bool:
+    """
+    Whether a failed call says the model is unavailable: a timeout, a
+    connection error or a 5xx response. Rejected requests (bad input, rate
+    limits, a wrong key) say nothing about the model's health.
+    """
+    # Imported here: only needed once a call has failed
+    import openai
+
+    if isinstance(error, (TimeoutError, ConnectionError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and status >= 500
+
+
+class LatencyTracker:
+    """Recent call latencies of one model, for percentile estimates."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q: float, min_samples: int = MIN_LATENCY_SAMPLES):
+        """Return the q-th percentile (0-100), or None with too few samples."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    Failure detector for one model.
+
+    The breaker opens when at least ``failure_rate`` of the last ``window``
+    calls failed, counting calls far slower than the model's p95 as
+    failures. Only outages (see is_outage) count; a rejected request is
+    not a failure of the model. While open, calls are refused. After ``reset_timeout`` seconds
+    one trial call is let through: success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(self, name: str, window: int = DEFAULT_WINDOW, min_calls: int = DEFAULT_MIN_CALLS,
+                 failure_rate: float = DEFAULT_FAILURE_RATE, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 outlier_factor: float = DEFAULT_OUTLIER_FACTOR):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.outlier_factor = outlier_factor
+        self.latency = LatencyTracker()
+        self.state = 'closed'
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_running = False
+        self._trial_started = None
+        self._lock = threading.Lock()
+        self._counters = {'successes': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0,
+                          'client_errors': 0, 'opened': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to this model now."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            now = time.monotonic()
+            if self.state == 'open' and now - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            # A trial that never reported back (refused quota, abandoned stream) is replaced
+            if self.state == 'half_open' and (not self._trial_running
+                                              or now - self._trial_started >= self.reset_timeout):
+                self._trial_running = True
+                self._trial_started = now
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def record_success(self, latency: float) -> None:
+        p95 = self.latency.percentile(95)
+        slow = p95 is not None and latency > p95 * self.outlier_factor
+        self.latency.record(latency)
+        with self._lock:
+            self._counters['successes'] += 1
+            if slow:
+                self._counters['slow_calls'] += 1
+                logger.warning(f"{self.name} call took {latency:.1f}s, over {self.outlier_factor:g}x its p95")
+            self._record(not slow)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counters['failures'] += 1
+            self._record(False)
+
+    def record_error(self, error: Exception) -> None:
+        """Record a call that raised: outages are failures, other errors only end a trial call."""
+        if is_outage(error):
+            self.record_failure()
+            return
+        with self._lock:
+            self._counters['client_errors'] += 1
+            if self.state == 'half_open':
+                self._trial_running = False
+
+    def record_hedge(self, won: bool) -> None:
+        with self._lock:
+            self._counters['hedged'] += 1
+            if won:
+                self._counters['hedge_wins'] += 1
+
+    def retry_after(self) -> int:
+        """Seconds until the breaker lets a trial call through."""
+        with self._lock:
+            if self.state != 'open':
+                return 1
+            return max(1, math.ceil(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(95)
+        with self._lock:
+            stats = dict(self._counters)
+            stats['state'] = self.state
+        stats['p95_ms'] = round(p95 * 1000) if p95 is not None else None
+        stats['latency_samples'] = len(self.latency)
+        return stats
+
+    def _record(self, ok: bool) -> None:
+        """Add an outcome and move between states; the lock is held."""
+        if self.state == 'half_open':
+            self._trial_running = False
+            if ok:
+                self.state = 'closed'
+                self._outcomes.clear()
+                logger.info(f"Circuit breaker for {self.name} closed")
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate):
+            self._open()
+
+    def _open(self) -> None:
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._counters['opened'] += 1
+        logger.warning(f"Circuit breaker for {self.name} opened")
+
+
+class CircuitBreakerRegistry:
+    """One CircuitBreaker per model, created on first use."""
+
+    def __init__(self, hedge: bool = DEFAULT_HEDGE, **breaker_options):
+        """
+        Args:
+            hedge: Send a duplicate call when the first outlives the model's p95
+            breaker_options: Keyword arguments for every CircuitBreaker
+        """
+        self.hedge = hedge
+        self.breaker_options = breaker_options
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model, **self.breaker_options)
+            return breaker
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+            fallbacks = self.fallbacks
+        return {
+            'hedging': self.hedge,
+            'fallbacks': fallbacks,
+            'models': {model: breaker.stats() for model, breaker in breakers.items()}
+        }
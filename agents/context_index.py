@@ -0,0 +1,86 @@
+from collections import Counter, deque
+import re
+
+# Recent exchanges and requests kept per session
+DEFAULT_MAX_EXCHANGES = 5
+DEFAULT_MAX_REQUESTS = 3
+
+# Longest summary returned, in characters
+MAX_SUMMARY_CHARS = 240
+
+_WORD_PATTERN = re.compile(r"[a-zA-Z][a-zA-Z0-9_\-]{3,}")
+
+_STOPWORDS = frozenset("""
+    about after again also because been before being between both could does
+    doing during each from further have having here into itself just more most
+    need needs other over please same should some such than that their them
+    then there these they this those through under until very want what when
+    where which while will with would your yours project help like make
+""".split())
+
+
+class ContextIndex:
+    """
+    Incrementally maintained summary of a session's recent exchanges.
+
+    The index is updated once per message appended to memory, so producing a
+    summary costs the same no matter how long the conversation is. It tracks
+    topic words from the last few user messages and the latest requests this
+    agent sent to each collaborator.
+    """
+
+    def __init__(self, max_exchanges: int = DEFAULT_MAX_EXCHANGES,
+                 max_requests: int = DEFAULT_MAX_REQUESTS):
+        self._user_words = deque(maxlen=max_exchanges)
+        self._topics = Counter()
+        self._requests = {}
+        self.max_requests = max_requests
+        self.exchanges = 0
+
+    def add_user_message(self, content: str) -> None:
+        """Count topic words, forgetting those of the oldest tracked message."""
+        if len(self._user_words) == self._user_words.maxlen:
+            # Counter arithmetic drops words whose count falls to zero, keeping the index bounded
+            self._topics -= self._user_words[0]
+        words = Counter(
+            word for word in (match.lower() for match in _WORD_PATTERN.findall(content))
+            if word not in _STOPWORDS
+        )
+        self._user_words.append(words)
+        self._topics.update(words)
+
+    def add_ai_message(self, content: str) -> None:
+        self.exchanges += 1
+
+    def record_requests(self, collaboration_requests: dict) -> None:
+        """Remember the latest requests sent to each collaborator."""
+        for agent_type, requests in collaboration_requests.items():
+            recent = self._requests.setdefault(agent_type, deque(maxlen=self.max_requests))
+            recent.extend(requests)
+
+    def topics(self, limit: int = 5) -> list:
+        return [word for word, count in self._topics.most_common(limit) if count > 0]
+
+    def open_requests(self) -> dict:
+        return {agent_type: list(requests) for agent_type, requests in self._requests.items() if requests}
+
+    def summary(self) -> str:
+        """Return a short, bounded description of the recent conversation."""
+        if not self.exchanges:
+            return None
+
+        parts = []
+        topics = self.topics()
+        if topics:
+            parts.append(f"topics: {', '.join(topics)}")
+        requests = self.open_requests()
+        if requests:
+            parts.append('requests: ' + ', '.join(
+                f"{agent_type.upper()} ({len(items)})" for agent_type, items in requests.items()
+            ))
+        parts.append(f"{self.exchanges} exchange{'s' if self.exchanges != 1 else ''}")
+
+        summary = '; '.join(parts)
+        if len(summary) > MAX_SUMMARY_CHARS:
+            summary = summary[:MAX_SUMMARY_CHARS - 3] + '...'
+        return summary
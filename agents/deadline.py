@@ -0,0 +1,42 @@
+import time
+
+
+class DeadlineExceeded(ValueError):
+    """Raised when a call would start after its request's deadline."""
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered.
+
+    A Deadline is passed in the context of every agent call made for a
+    request, so each LLM call is limited to the time the request has left.
+    """
+
+    def __init__(self, seconds: float):
+        """
+        Args:
+            seconds: Time budget from now
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = 'Request') -> float:
+        """
+        Return the seconds left.
+
+        Raises:
+            DeadlineExceeded: when no time is left
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{what} skipped: the {self.seconds:g}s request deadline has passed")
+        return remaining
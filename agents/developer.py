@@ -1,7 +1,7 @@
 from .base_agent import BaseAgent
 
 class DeveloperAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, model="gpt-4o"):
         # Initialize with default configuration
         system_message = """
         You are a Developer AI agent. Your responsibilities include:
@@ -16,4 +16,4 @@ class DeveloperAgent(BaseAgent):
         When project planning or coordination is needed, mention the Project Manager.
         Keep responses technical but understandable.
         """
-        super().__init__("dev", system_message)
+        super().__init__("dev", system_message, model)
@@ -57,4 +57,4 @@ class DevOpsAgent(BaseAgent):
         Always consider scalability and maintainability in solutions.
         Focus on automation and infrastructure as code principles.
         """
-        super().__init__("devops", system_message)
+        super().__init__("devops", system_message, model)
@@ -0,0 +1,191 @@
+import threading
+import logging
+import os
+
+import httpx
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+# Pool limits of the HTTP client shared by every LLM client, and how long idle connections are kept
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get('LLM_HTTP_MAX_CONNECTIONS', 50))
+DEFAULT_MAX_KEEPALIVE = int(os.environ.get('LLM_HTTP_MAX_KEEPALIVE', 20))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_HTTP_KEEPALIVE_EXPIRY', 60))
+
+# Negotiate HTTP/2 with servers that support it; needs the h2 package
+DEFAULT_HTTP2 = os.environ.get('LLM_HTTP2', '1') == '1'
+
+# Per-request timeout and retries of the shared clients, which the agents' ChatOpenAI clients use
+REQUEST_TIMEOUT = 90
+MAX_RETRIES = 3
+
+
+class ConnectionStats:
+    """Counts requests and the connections opened for them, from httpcore trace events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'new_connections': 0, 'tls_handshakes': 0,
+                          'http2_requests': 0, 'connect_errors': 0}
+
+    def request(self) -> None:
+        self._count('requests')
+
+    def trace(self, event: str, info: dict) -> None:
+        if event == 'connection.connect_tcp.complete':
+            self._count('new_connections')
+        elif event == 'connection.connect_tcp.failed':
+            self._count('connect_errors')
+        elif event == 'connection.start_tls.complete':
+            self._count('tls_handshakes')
+        elif event == 'http2.send_request_headers.started':
+            self._count('http2_requests')
+
+    async def atrace(self, event: str, info: dict) -> None:
+        self.trace(event, info)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats['reused_connections'] = max(0, stats['requests'] - stats['new_connections'])
+        stats['reuse_ratio'] = (
+            round(stats['reused_connections'] / stats['requests'], 3) if stats['requests'] else 0.0
+        )
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+class _TracingTransport(httpx.HTTPTransport):
+    def __init__(self, connection_stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.connection_stats = connection_stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.connection_stats.request()
+        request.extensions.setdefault('trace', self.connection_stats.trace)
+        return super().handle_request(request)
+
+
+class _AsyncTracingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, connection_stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.connection_stats = connection_stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.connection_stats.request()
+        request.extensions.setdefault('trace', self.connection_stats.atrace)
+        return await super().handle_async_request(request)
+
+
+class LLMTransport:
+    """
+    Process-wide HTTP transport for every LLM client.
+
+    All agents and models share one pooled keep-alive HTTP client (and one
+    async client), so parallel collaborators reuse open TLS connections
+    instead of each ChatOpenAI opening its own. HTTP/2 is negotiated when
+    the h2 package is installed and the server supports it. Clients are
+    created on first use.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 http2: bool = DEFAULT_HTTP2, base_url: str = None, api_key: str = None):
+        """
+        Args:
+            max_connections: Maximum open connections per client
+            max_keepalive: Maximum idle connections kept open per client
+            keepalive_expiry: Seconds an idle connection is kept open
+            http2: Negotiate HTTP/2 when the h2 package is installed
+            base_url: OpenAI-compatible API URL; the openai package's default
+                (or OPENAI_BASE_URL) when None
+            api_key: API key; OPENAI_API_KEY when None
+        """
+        if http2 and h2 is None:
+            logger.info("h2 is not installed; LLM clients use HTTP/1.1")
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and h2 is not None
+        self.base_url = base_url
+        self.api_key = api_key
+        self.connection_stats = ConnectionStats()
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def chat_clients(self, max_retries: int = MAX_RETRIES) -> dict:
+        """
+        Keyword arguments that make a ChatOpenAI use the shared clients.
+
+        Args:
+            max_retries: Retries of a failed request; other values than
+                MAX_RETRIES get copies of the clients sharing their connections
+        """
+        client, async_client = self.client, self.async_client
+        if max_retries != MAX_RETRIES:
+            client = client.with_options(max_retries=max_retries)
+            async_client = async_client.with_options(max_retries=max_retries)
+        return {
+            'client': client.chat.completions,
+            'async_client': async_client.chat.completions
+        }
+
+    @property
+    def client(self):
+        """The shared openai.OpenAI client."""
+        with self._lock:
+            if self._client is None:
+                import openai
+                transport = _TracingTransport(self.connection_stats, http2=self.http2, limits=self.limits)
+                self._client = openai.OpenAI(
+                    api_key=self.api_key, base_url=self.base_url, timeout=REQUEST_TIMEOUT,
+                    max_retries=MAX_RETRIES, http_client=httpx.Client(transport=transport)
+                )
+            return self._client
+
+    @property
+    def async_client(self):
+        """The shared openai.AsyncOpenAI client."""
+        with self._lock:
+            if self._async_client is None:
+                import openai
+                transport = _AsyncTracingTransport(self.connection_stats, http2=self.http2, limits=self.limits)
+                self._async_client = openai.AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url, timeout=REQUEST_TIMEOUT,
+                    max_retries=MAX_RETRIES,
+                    http_client=httpx.AsyncClient(transport=transport)
+                )
+            return self._async_client
+
+    def stats(self) -> dict:
+        stats = self.connection_stats.stats()
+        stats.update({
+            'http2': self.http2,
+            'max_connections': self.limits.max_connections,
+            'max_keepalive': self.limits.max_keepalive_connections,
+            'keepalive_expiry': self.limits.keepalive_expiry
+        })
+        return stats
+
+    def close(self) -> None:
+        """Close the sync client's connections; see aclose for the async client."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self) -> None:
+        """Close the async client's connections, from the event loop that used them."""
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
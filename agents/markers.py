@@ -0,0 +1,147 @@
+import re
+
+# Agent types addressed by the [NEED_X: message] marker format
+NEED_MARKER_AGENTS = {
+    'DEV': 'dev',
+    'TEST': 'tester',
+    'DEVOPS': 'devops',
+    'PM': 'pm',
+    'BA': 'ba',
+    'UX': 'uxd'
+}
+
+# DEVOPS must come before DEV so the longer name wins
+NEED_MARKER_PATTERN = re.compile(
+    r'\[NEED_(DEVOPS|DEV|TEST|PM|BA|UX):(.*?)\]',
+    re.IGNORECASE | re.DOTALL
+)
+
+_NEED_MARKER_OPENERS = tuple(f'[NEED_{name}:' for name in NEED_MARKER_AGENTS)
+
+# Names used in the 'Developer -> Task for Developer [message]' format
+AGENT_DISPLAY_NAMES = {
+    'dev': 'Developer',
+    'tester': 'Tester',
+    'devops': 'DevOps',
+    'pm': 'PM',
+    'ba': 'Business Analyst',
+    'uxd': 'UX Designer'
+}
+
+_TASK_MARKER_AGENTS = {name.lower(): agent_type for agent_type, name in AGENT_DISPLAY_NAMES.items()}
+
+_DISPLAY_NAME_ALTERNATION = '|'.join(re.escape(name) for name in AGENT_DISPLAY_NAMES.values())
+
+# Both delegation formats in one alternation, so a response is scanned once.
+# Every alternative starts with '[' or '->' so the engine can skip ahead to
+# those characters instead of trying a match at every letter.
+COLLABORATION_MARKER_PATTERN = re.compile(
+    r'\[NEED_(?P<need>DEVOPS|DEV|TEST|PM|BA|UX):(?P<need_request>.*?)\]'
+    r'|->\s*Task for (?P<task>' + _DISPLAY_NAME_ALTERNATION + r')\s*\[(?P<task_request>.*?)\]',
+    re.IGNORECASE | re.DOTALL
+)
+
+# The name that must come right before '->' in the task format
+_TASK_OWNER_PATTERN = re.compile(r'(?:' + _DISPLAY_NAME_ALTERNATION + r')\s*\Z', re.IGNORECASE)
+
+# Longest display name plus generous whitespace before '->'
+_TASK_OWNER_WINDOW = max(len(name) for name in AGENT_DISPLAY_NAMES.values()) + 32
+
+
+def scan_collaboration_markers(response: str, exclude: str = None) -> tuple:
+    """
+    Extract every delegation marker from a response in a single pass.
+
+    Both the [NEED_X: message] and the 'Developer -> Task for Developer
+    [message]' formats are recognized, in any letter case. The response is
+    never copied or rewritten.
+
+    Args:
+        response: The agent's response
+        exclude: Agent type whose own markers are ignored
+
+    Returns:
+        (needed_agents, collaboration_requests): agent types in the canonical
+        order of AGENT_DISPLAY_NAMES, and each agent's requests in the order
+        they appear
+    """
+    found = {}
+    for match in COLLABORATION_MARKER_PATTERN.finditer(response):
+        if match.group('need'):
+            agent_type = NEED_MARKER_AGENTS[match.group('need').upper()]
+            request = match.group('need_request')
+        else:
+            name = match.group('task').lower()
+            start = match.start()
+            owner = _TASK_OWNER_PATTERN.search(response, max(0, start - _TASK_OWNER_WINDOW), start)
+            if not owner or owner.group().rstrip().lower() != name:
+                continue
+            agent_type = _TASK_MARKER_AGENTS[name]
+            request = match.group('task_request')
+
+        if agent_type != exclude:
+            found.setdefault(agent_type, []).append(request.strip())
+
+    needed_agents = [agent_type for agent_type in AGENT_DISPLAY_NAMES if agent_type in found]
+    return needed_agents, {agent_type: found[agent_type] for agent_type in needed_agents}
+
+
+class MarkerStreamParser:
+    """
+    Detect [NEED_X: message] markers incrementally in a token stream.
+
+    Tokens are fed as they arrive and every marker is reported as soon as its
+    closing bracket is seen. Only the text from the earliest bracket that could
+    still open a marker is kept for rescanning, so each token costs time
+    proportional to the unfinished marker rather than the whole response.
+    """
+
+    def __init__(self, exclude: str = None):
+        """
+        Args:
+            exclude: Agent type whose own markers are ignored
+        """
+        self.exclude = exclude
+        self._tail = ''
+
+    def feed(self, token: str) -> list:
+        """
+        Add a token to the stream.
+
+        Args:
+            token: The next piece of the response
+
+        Returns:
+            List of (agent_type, request) for markers closed by this token
+        """
+        if not token:
+            return []
+
+        self._tail += token
+        markers = []
+        consumed = 0
+        for match in NEED_MARKER_PATTERN.finditer(self._tail):
+            agent_type = NEED_MARKER_AGENTS[match.group(1).upper()]
+            if agent_type != self.exclude:
+                markers.append((agent_type, match.group(2).strip()))
+            consumed = match.end()
+
+        self._tail = self._tail[consumed:]
+        start = self._pending_start(self._tail)
+        self._tail = self._tail[start:] if start is not None else ''
+        return markers
+
+    @staticmethod
+    def _pending_start(text: str):
+        """Find the first bracket that may still become a marker."""
+        position = text.find('[')
+        while position != -1:
+            rest = text[position:]
+            # A closed bracket here would already have matched
+            if ']' not in rest:
+                head = rest[:len('[NEED_DEVOPS:')].upper()
+                if any(opener.startswith(head) or head.startswith(opener)
+                       for opener in _NEED_MARKER_OPENERS):
+                    return position
+            position = text.find('[', position + 1)
+        return None
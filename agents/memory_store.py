@@ -0,0 +1,226 @@
+from langchain_core.messages import HumanMessage, AIMessage
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from .summarizer import ExtractiveSummarizer
+from .context_index import ContextIndex
+import threading
+import asyncio
+import hashlib
+import copy
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Messages kept per session (the prompt's history window) and number of live sessions
+DEFAULT_HISTORY_WINDOW = int(os.environ.get('AGENT_HISTORY_WINDOW', 10))
+DEFAULT_MAX_SESSIONS = int(os.environ.get('AGENT_MAX_SESSIONS', 1000))
+
+# Persisted messages older than the window loaded on rehydration to rebuild the summary
+DEFAULT_SUMMARY_HISTORY = int(os.environ.get('AGENT_SUMMARY_HISTORY', 50))
+
+DEFAULT_SESSION = 'default'
+
+
+class SessionMemory:
+    """
+    Bounded conversation history for one project, agent and session.
+
+    Messages pushed out of the window are queued for summarization and
+    folded into ``summary``, which is placed at the front of the prompt.
+    """
+
+    def __init__(self, window: int = DEFAULT_HISTORY_WINDOW, on_evict=None):
+        """
+        Args:
+            window: Maximum number of messages kept verbatim
+            on_evict: Optional callable(memory) run when messages leave the window
+        """
+        # Ring buffer: the oldest message is dropped once the window is full
+        self._messages = deque(maxlen=window)
+        self._evicted = []
+        self.summary = ''
+        self.index = ContextIndex()
+        self.on_evict = on_evict
+        self.lock = threading.RLock()
+        self._summary_lock = threading.Lock()
+        self.hydrated = False
+
+    @property
+    def messages(self) -> list:
+        """Snapshot of the messages currently in the window."""
+        with self.lock:
+            return list(self._messages)
+
+    def add_user_message(self, content: str) -> None:
+        with self.lock:
+            self.index.add_user_message(content)
+        self._append(HumanMessage(content=content))
+
+    def add_ai_message(self, content: str, collaboration_requests: dict = None) -> None:
+        with self.lock:
+            self.index.add_ai_message(content)
+            if collaboration_requests:
+                self.index.record_requests(collaboration_requests)
+        self._append(AIMessage(content=content))
+
+    def _append(self, message) -> None:
+        with self.lock:
+            if len(self._messages) == self._messages.maxlen:
+                self._evicted.append(self._messages[0])
+            self._messages.append(message)
+            evicted = bool(self._evicted)
+
+        if evicted and self.on_evict:
+            self.on_evict(self)
+
+    def fork(self) -> 'SessionMemory':
+        """Detached copy for a speculative turn; nothing added to it reaches this memory."""
+        with self.lock:
+            fork = SessionMemory(self._messages.maxlen)
+            fork._messages.extend(self._messages)
+            fork.summary = self.summary
+            fork.index = copy.deepcopy(self.index)
+        fork.hydrated = True
+        return fork
+
+    def fingerprint(self) -> str:
+        """Hash of the summary and the messages in the window."""
+        digest = hashlib.sha256()
+        with self.lock:
+            digest.update(self.summary.encode('utf-8'))
+            for message in self._messages:
+                digest.update(b'\0' + message.type.encode('utf-8') + b'\0' + message.content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def fold(self, summarizer) -> None:
+        """Fold messages that left the window into the running summary."""
+        with self._summary_lock:
+            with self.lock:
+                pending, self._evicted = self._evicted, []
+                summary = self.summary
+            if not pending:
+                return
+
+            summary = summarizer.summarize(summary, pending)
+            with self.lock:
+                self.summary = summary
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+
+class SessionMemoryStore:
+    """
+    Agent memories keyed by (project_id, agent_type, session).
+
+    At most ``max_sessions`` memories are kept; the least recently used one is
+    evicted when a new session arrives. On a cache miss the memory is lazily
+    rehydrated through ``loader``, which returns the most recent persisted
+    messages of that project, agent and session as (message_type, content)
+    pairs; the default session loads the messages persisted without one.
+
+    Messages leaving a session's window are folded into its rolling summary
+    by ``summarizer``, on a background thread unless ``background`` is False.
+    The summary only lives in memory, so rehydration also loads up to
+    ``summary_history`` older messages and folds them into a new summary
+    before the first prompt. A restart or an eviction therefore keeps what
+    the session summarized before, and a new session starts empty.
+    """
+
+    def __init__(self, window: int = DEFAULT_HISTORY_WINDOW,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS, loader=None,
+                 summarizer=None, background: bool = True,
+                 summary_history: int = DEFAULT_SUMMARY_HISTORY):
+        """
+        Args:
+            window: Maximum number of messages kept per session
+            max_sessions: Maximum number of live sessions
+            loader: Optional callable(project_id, agent_type, session, limit) -> list
+            summarizer: Object with summarize(summary, messages) -> str
+            background: Summarize off the request path
+            summary_history: Older persisted messages summarized on rehydration
+        """
+        self.window = window
+        self.max_sessions = max(1, max_sessions)
+        self.loader = loader
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.background = background
+        self.summary_history = max(0, summary_history)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='memory-summarizer')
+
+    def get(self, project_id, agent_type: str, session: str = None) -> SessionMemory:
+        """Return the memory for a session, creating and rehydrating it on a miss."""
+        memory = self._lookup(project_id, agent_type, session)
+        if not memory.hydrated:
+            self._hydrate(memory, project_id, agent_type, session)
+        return memory
+
+    async def aget(self, project_id, agent_type: str, session: str = None) -> SessionMemory:
+        """get() for coroutines: rehydration reads the database on a worker thread."""
+        memory = self._lookup(project_id, agent_type, session)
+        if not memory.hydrated:
+            await asyncio.to_thread(self._hydrate, memory, project_id, agent_type, session)
+        return memory
+
+    def _lookup(self, project_id, agent_type: str, session: str = None) -> SessionMemory:
+        """Find or create a session's memory, evicting the least recently used one."""
+        key = (project_id, agent_type, session or DEFAULT_SESSION)
+        with self._lock:
+            memory = self._sessions.get(key)
+            if memory is not None:
+                self._sessions.move_to_end(key)
+            else:
+                memory = SessionMemory(self.window, on_evict=self._schedule_summary)
+                self._sessions[key] = memory
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    logger.debug(f"Evicted agent memory for {evicted}")
+        return memory
+
+    def _hydrate(self, memory: SessionMemory, project_id, agent_type: str, session: str = None) -> None:
+        """Load persisted history into a new memory, once, summarizing what does not fit the window."""
+        with memory.lock:
+            if memory.hydrated:
+                return
+            memory.hydrated = True
+
+            if not self.loader or not project_id:
+                return
+
+            # Messages pushed out of the window here are folded below, before the first prompt
+            on_evict, memory.on_evict = memory.on_evict, None
+            try:
+                history = self.loader(project_id, agent_type, session, self.window + self.summary_history)
+                for message_type, content in history:
+                    if message_type == 'user':
+                        memory.add_user_message(content)
+                    else:
+                        memory.add_ai_message(content)
+            except Exception as e:
+                logger.warning(f"Failed to rehydrate {agent_type} memory for {project_id}: {str(e)}")
+            finally:
+                memory.on_evict = on_evict
+            self._fold(memory)
+
+    def _schedule_summary(self, memory: SessionMemory) -> None:
+        """Fold a memory's evicted messages into its summary."""
+        if self.background:
+            self._summary_pool.submit(self._fold, memory)
+        else:
+            self._fold(memory)
+
+    def _fold(self, memory: SessionMemory) -> None:
+        try:
+            memory.fold(self.summarizer)
+        except Exception as e:
+            logger.warning(f"Failed to update conversation summary: {str(e)}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
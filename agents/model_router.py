@@ -0,0 +1,127 @@
+from collections import Counter
+import threading
+import logging
+import os
+
+from .prompt_builder import PromptBuilder
+
+logger = logging.getLogger(__name__)
+
+# Cheap model for short follow-ups, the input length still counted as short, and agents whose
+# direct answers to the user always stay on their own model
+DEFAULT_LIGHT_MODEL = os.environ.get('ROUTER_LIGHT_MODEL', 'gpt-3.5-turbo')
+DEFAULT_SHORT_INPUT_TOKENS = int(os.environ.get('ROUTER_SHORT_INPUT_TOKENS', 150))
+DEFAULT_DEEP_AGENTS = os.environ.get('ROUTER_DEEP_AGENTS', 'pm,ba,dev')
+
+
+def output_limit(model_info: dict) -> int:
+    """Most completion tokens a model returns; o1 models list it as max_output."""
+    return model_info.get('max_tokens', model_info.get('max_output', 0))
+
+
+def prompt_budget(model_info: dict) -> int:
+    """Largest prompt, in tokens, a model takes with its output reserved."""
+    return PromptBuilder(model_info['context_length'], reserved_output=output_limit(model_info)).budget
+
+
+class ModelRouter:
+    """
+    Choose the model for each LLM call from SUPPORTED_MODELS.
+
+    Short inputs that follow up on a conversation, or that answer another
+    agent's request, go to the light model unless a deep-analysis agent is
+    answering the user directly; everything else stays on the agent's own
+    model. When the request's remaining deadline is shorter than the chosen
+    model's p95 latency, the fastest model expected to finish in time is
+    used instead. A model is only chosen when the prompt fits its context
+    window.
+    """
+
+    def __init__(self, models: dict, latency_profiles, light_model: str = DEFAULT_LIGHT_MODEL,
+                 short_input_tokens: int = DEFAULT_SHORT_INPUT_TOKENS, deep_agents=DEFAULT_DEEP_AGENTS):
+        """
+        Args:
+            models: SUPPORTED_MODELS
+            latency_profiles: Object whose get(model).latency is that model's
+                LatencyTracker, such as BaseAgent.circuit_breakers
+            light_model: Model for cheap short follow-ups
+            short_input_tokens: Longest input, in tokens, sent to the light model
+            deep_agents: Agent types, as a list or comma-separated string, whose
+                answers to the user stay on their own model
+        """
+        if isinstance(deep_agents, str):
+            deep_agents = [agent.strip() for agent in deep_agents.split(',') if agent.strip()]
+        self.models = models
+        self.latency_profiles = latency_profiles
+        self.light_model = light_model
+        self.short_input_tokens = short_input_tokens
+        self.deep_agents = set(deep_agents)
+        self._budgets = {model: prompt_budget(info) for model, info in models.items()}
+        self._lock = threading.Lock()
+        self._routes = Counter()
+        self._reasons = Counter()
+
+    def route(self, agent_type: str, default_model: str, prompt_tokens: int, input_tokens: int = 0,
+              collaborator: bool = False, follow_up: bool = False, deadline_remaining: float = None) -> str:
+        """
+        Pick the model for one call.
+
+        Args:
+            agent_type: The calling agent's type
+            default_model: The agent's own model
+            prompt_tokens: Tokens in the assembled prompt
+            input_tokens: Tokens in the user input or delegated request alone
+            collaborator: Whether the agent is answering another agent
+            follow_up: Whether the session already has earlier messages
+            deadline_remaining: Seconds the request has left, if it has a deadline
+
+        Returns:
+            Name of the model to call
+        """
+        model, reason = default_model, 'default'
+
+        short = input_tokens <= self.short_input_tokens
+        answers_user = agent_type in self.deep_agents and not collaborator
+        if (short and (follow_up or collaborator) and not answers_user
+                and self.light_model in self.models and self._fits(self.light_model, prompt_tokens)):
+            model, reason = self.light_model, 'short_follow_up'
+
+        if deadline_remaining is not None:
+            p95 = self._p95(model)
+            if p95 is not None and p95 > deadline_remaining:
+                faster = self._fastest(prompt_tokens, deadline_remaining)
+                if faster is not None and faster != model:
+                    model, reason = faster, 'deadline'
+
+        with self._lock:
+            self._routes[model] += 1
+            self._reasons[reason] += 1
+        if model != default_model:
+            logger.debug(f"Routed {agent_type} agent call from {default_model} to {model} ({reason})")
+        return model
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {'routes': dict(self._routes), 'reasons': dict(self._reasons)}
+        stats['light_model'] = self.light_model
+        stats['latency_p50_ms'] = {}
+        for model in self.models:
+            p50 = self.latency_profiles.get(model).latency.percentile(50)
+            if p50 is not None:
+                stats['latency_p50_ms'][model] = round(p50 * 1000)
+        return stats
+
+    def _fits(self, model: str, prompt_tokens: int) -> bool:
+        return prompt_tokens <= self._budgets[model]
+
+    def _p95(self, model: str):
+        return self.latency_profiles.get(model).latency.percentile(95)
+
+    def _fastest(self, prompt_tokens: int, deadline_remaining: float):
+        """Fastest model with a known latency that fits the prompt and the deadline."""
+        timed = []
+        for model in self.models:
+            p95 = self._p95(model)
+            if p95 is not None and p95 <= deadline_remaining and self._fits(model, prompt_tokens):
+                timed.append((p95, model))
+        return min(timed)[1] if timed else None
@@ -25,4 +25,4 @@ class ProjectManagerAgent(BaseAgent):
         
         Keep responses concise and professional.
         """
-        super().__init__("pm", system_message)
+        super().__init__("pm", system_message, model)
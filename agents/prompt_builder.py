@@ -0,0 +1,246 @@
+from collections import OrderedDict
+from functools import lru_cache
+import threading
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Tokens kept free for message framing and counting error
+SAFETY_MARGIN = 64
+
+# Characters per token used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_NOTE = ' ...[truncated]'
+
+# Token counts remembered, keyed by a 16-byte digest of the counted text
+TOKEN_COUNT_CACHE_SIZE = 8192
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    """Load the tokenizer once; None when tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"Falling back to approximate token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Results are cached by a digest of the content, so history messages and
+    repeated agent responses are only tokenized once without the cache
+    holding on to the texts themselves.
+    """
+    if not text:
+        return 0
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+
+    encoding = _encoding()
+    if encoding is None:
+        count = max(1, -(-len(text) // CHARS_PER_TOKEN))
+    else:
+        count = len(encoding.encode(text, disallowed_special=()))
+
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= count_tokens(TRUNCATION_NOTE):
+        return ''
+
+    limit = max_tokens - count_tokens(TRUNCATION_NOTE)
+    encoding = _encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:limit]) + TRUNCATION_NOTE
+    return text[:limit * CHARS_PER_TOKEN] + TRUNCATION_NOTE
+
+
+class PromptSection:
+    """
+    A titled block of prompt lines that can be shrunk to fit a budget.
+
+    ``mode`` decides how the section shrinks: 'oldest' drops items from the
+    front (conversation history), 'last' drops items from the end, and
+    'truncate' shortens every item evenly (agent responses).
+    """
+
+    def __init__(self, name: str, header: str, items: list, priority: int,
+                 mode: str = 'last', max_share: float = 1.0, always_header: bool = False):
+        """
+        Args:
+            name: Section name used in usage reports
+            header: Line placed before the items
+            items: Lines of the section, each ending with a newline
+            priority: Fill order; lower numbers are kept first
+            mode: How the section shrinks: 'oldest', 'last' or 'truncate'
+            max_share: Largest fraction of the prompt budget the section may use
+            always_header: Render the header even when no item fits
+        """
+        self.name = name
+        self.header = header
+        self.items = items
+        self.priority = priority
+        self.mode = mode
+        self.max_share = max_share
+        self.always_header = always_header
+
+    def fit(self, budget: int) -> tuple:
+        """
+        Shrink the section to fit a token budget.
+
+        Returns:
+            (rendered text, tokens used, number of items dropped or truncated)
+        """
+        if not self.items:
+            text = f"{self.header}\n" if self.always_header else ''
+            return text, count_tokens(text), 0
+
+        overhead = count_tokens(self.header) + 2
+        available = budget - overhead
+        costs = [count_tokens(item) for item in self.items]
+
+        if sum(costs) <= available:
+            kept, changed = list(self.items), 0
+        elif available <= 0:
+            kept, changed = [], len(self.items)
+        elif self.mode == 'truncate':
+            kept, changed = self._truncate_evenly(costs, available)
+        else:
+            kept, changed = self._drop(costs, available)
+
+        if not kept and not self.always_header:
+            return '', 0, changed
+
+        text = f"{self.header}\n{''.join(kept)}\n"
+        return text, overhead + sum(count_tokens(item) for item in kept), changed
+
+    def _drop(self, costs: list, available: int) -> tuple:
+        """Keep whole items, dropping the oldest or the last ones first."""
+        order = range(len(self.items) - 1, -1, -1) if self.mode == 'oldest' else range(len(self.items))
+        kept_indexes = []
+        used = 0
+        for index in order:
+            if used + costs[index] > available:
+                break
+            kept_indexes.append(index)
+            used += costs[index]
+        kept_indexes.sort()
+        return [self.items[index] for index in kept_indexes], len(self.items) - len(kept_indexes)
+
+    def _truncate_evenly(self, costs: list, available: int) -> tuple:
+        """Give every item a fair share, letting short items donate the rest."""
+        remaining = available
+        shares = {}
+        pending = sorted(range(len(costs)), key=lambda index: costs[index])
+        while pending:
+            share = remaining // len(pending)
+            index = pending.pop(0)
+            shares[index] = min(costs[index], share)
+            remaining -= shares[index]
+
+        kept = []
+        changed = 0
+        for index, item in enumerate(self.items):
+            if shares[index] >= costs[index]:
+                kept.append(item)
+                continue
+            changed += 1
+            shortened = truncate_to_tokens(item.rstrip('\n'), shares[index] - 1)
+            if shortened:
+                kept.append(shortened + '\n')
+        return kept, changed
+
+
+class PromptAssembly:
+    """A built prompt and the number of tokens each section used."""
+
+    def __init__(self, text: str, usage: dict):
+        self.text = text
+        self.usage = usage
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class PromptBuilder:
+    """
+    Assemble a prompt from sections within a model's context window.
+
+    Required text is always kept. Optional sections are filled in priority
+    order, each capped at its ``max_share`` of the budget, so the
+    lowest-priority content is truncated or dropped first. Sections are
+    still rendered in the order they are given.
+    """
+
+    def __init__(self, context_length: int, reserved_output: int = 0,
+                 safety_margin: int = SAFETY_MARGIN):
+        """
+        Args:
+            context_length: The model's context window in tokens
+            reserved_output: Tokens reserved for the completion
+            safety_margin: Tokens kept free for framing and counting error
+        """
+        self.budget = max(0, context_length - reserved_output - safety_margin)
+
+    def build(self, head: str, sections: list, tail: str) -> PromptAssembly:
+        """
+        Build a prompt.
+
+        Args:
+            head: Required text placed first (the system message)
+            sections: PromptSections in the order they appear in the prompt
+            tail: Required text placed last (user input and instructions)
+
+        Returns:
+            PromptAssembly with the text and per-section token usage
+        """
+        usage = {'system': count_tokens(head), 'input': count_tokens(tail)}
+        remaining = self.budget - usage['system'] - usage['input']
+        dropped = {}
+
+        rendered = {}
+        for section in sorted(sections, key=lambda s: s.priority):
+            section_budget = min(remaining, int(self.budget * section.max_share))
+            text, used, changed = section.fit(max(0, section_budget))
+            rendered[section.name] = text
+            usage[section.name] = used
+            remaining -= used
+            if changed:
+                dropped[section.name] = changed
+
+        body = ''.join(rendered[section.name] for section in sections)
+
+        usage['total'] = sum(usage.values())
+        usage['budget'] = self.budget
+        if dropped:
+            usage['shrunk'] = dropped
+            logger.info(f"Prompt shrunk to fit {self.budget} tokens: {dropped}")
+
+        return PromptAssembly(f"{head}{body}{tail}", usage)
@@ -0,0 +1,303 @@
+from contextlib import contextmanager
+from collections import namedtuple
+import threading
+import asyncio
+import sqlite3
+import logging
+import time
+import os
+
+from .admission import AgentRateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Optional SQLite file shared by worker processes, longest wait for budget, and assumed completion length
+DEFAULT_RATE_LIMIT_DB = os.environ.get('AGENT_RATE_LIMIT_DB')
+DEFAULT_MAX_WAIT = float(os.environ.get('AGENT_RATE_LIMIT_MAX_WAIT', 30))
+DEFAULT_EXPECTED_COMPLETION_TOKENS = int(os.environ.get('AGENT_EXPECTED_COMPLETION_TOKENS', 500))
+
+Reservation = namedtuple('Reservation', ['model', 'tokens'])
+
+
+def parse_limits(spec: str) -> dict:
+    """
+    Parse 'model=tokens_per_minute/requests_per_minute' pairs separated by commas.
+
+    Example: 'gpt-4=40000/500,gpt-3.5-turbo=200000/3500'
+    """
+    limits = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        model, _, values = item.partition('=')
+        tokens, _, requests = values.partition('/')
+        limits[model.strip()] = (int(tokens), int(requests))
+    return limits
+
+
+class TokenRateLimiter:
+    """
+    Token buckets for each model's tokens-per-minute and requests-per-minute quotas.
+
+    Before a call, its prompt tokens plus an expected completion length are
+    reserved; the call waits until both buckets can cover it. Afterwards the
+    reservation is reconciled with the tokens the call really used, refunding
+    or charging the difference. With ``db_path`` the buckets live in a SQLite
+    file, so every worker process on the host draws from the same quota.
+    """
+
+    def __init__(self, limits: dict, db_path: str = DEFAULT_RATE_LIMIT_DB,
+                 max_wait: float = DEFAULT_MAX_WAIT,
+                 expected_completion_tokens: int = DEFAULT_EXPECTED_COMPLETION_TOKENS):
+        """
+        Args:
+            limits: Mapping of model to (tokens_per_minute, requests_per_minute);
+                models missing from it are not limited
+            db_path: Optional SQLite file shared across processes
+            max_wait: Longest time a call waits for budget, in seconds
+            expected_completion_tokens: Completion tokens reserved per call
+        """
+        self.limits = dict(limits)
+        self.db_path = db_path
+        self.max_wait = max_wait
+        self.expected_completion_tokens = expected_completion_tokens
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'reserved': 0, 'waited': 0, 'wait_seconds': 0.0, 'rejected': 0,
+                          'refunded_tokens': 0, 'charged_tokens': 0}
+
+        if self.db_path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "model TEXT NOT NULL, kind TEXT NOT NULL, level REAL NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (model, kind))"
+            )
+
+    @classmethod
+    def from_models(cls, models: dict, overrides: dict = None, **kwargs):
+        """Build a limiter from SUPPORTED_MODELS quotas, with optional per-model overrides."""
+        limits = {
+            model: (info['tokens_per_minute'], info['requests_per_minute'])
+            for model, info in models.items()
+            if 'tokens_per_minute' in info and 'requests_per_minute' in info
+        }
+        limits.update(overrides or {})
+        return cls(limits, **kwargs)
+
+    def reserve(self, model: str, prompt_tokens: int, deadline=None):
+        """
+        Wait until the model's quota covers a call, then take its budget.
+
+        Args:
+            model: The model about to be called
+            prompt_tokens: Tokens in the prompt
+            deadline: Optional Deadline that shortens the wait
+
+        Returns:
+            Reservation to pass to reconcile, or None when the model is not limited
+
+        Raises:
+            AgentRateLimitError: when the budget will not be there in time
+        """
+        if model not in self.limits:
+            return None
+
+        tokens, max_wait = self._request(model, prompt_tokens, deadline)
+        waited = 0.0
+        while True:
+            wait = self._take(model, tokens)
+            if wait <= 0:
+                break
+            self._check_wait(model, tokens, wait, waited, max_wait)
+            time.sleep(wait)
+            waited += wait
+
+        self._count(reserved=1, waited=1 if waited else 0, wait_seconds=waited)
+        return Reservation(model, tokens)
+
+    async def areserve(self, model: str, prompt_tokens: int, deadline=None):
+        """reserve() for coroutines: waits for budget without blocking the event loop."""
+        if model not in self.limits:
+            return None
+
+        tokens, max_wait = self._request(model, prompt_tokens, deadline)
+        waited = 0.0
+        while True:
+            wait = await self._off_loop(self._take, model, tokens)
+            if wait <= 0:
+                break
+            self._check_wait(model, tokens, wait, waited, max_wait)
+            await asyncio.sleep(wait)
+            waited += wait
+
+        self._count(reserved=1, waited=1 if waited else 0, wait_seconds=waited)
+        return Reservation(model, tokens)
+
+    def try_reserve(self, model: str, prompt_tokens: int):
+        """
+        Take a call's budget only if the model's quota covers it now.
+
+        Returns:
+            Reservation to pass to reconcile, or None when the model is not limited
+
+        Raises:
+            AgentRateLimitError: when the budget is not there
+        """
+        if model not in self.limits:
+            return None
+
+        tokens, _ = self._request(model, prompt_tokens)
+        wait = self._take(model, tokens)
+        if wait > 0:
+            self._check_wait(model, tokens, wait, 0.0, 0.0)
+        self._count(reserved=1)
+        return Reservation(model, tokens)
+
+    async def atry_reserve(self, model: str, prompt_tokens: int):
+        """try_reserve() for coroutines."""
+        return await self._off_loop(self.try_reserve, model, prompt_tokens)
+
+    def reconcile(self, reservation: Reservation, actual_tokens: int = None) -> None:
+        """
+        Settle a reservation with the tokens the call used.
+
+        Args:
+            reservation: Value returned by reserve, or None
+            actual_tokens: Tokens the call used; when unknown (a failed call)
+                the expected completion is refunded
+        """
+        if reservation is None:
+            return
+        if actual_tokens is None:
+            actual_tokens = max(0, reservation.tokens - self.expected_completion_tokens)
+
+        difference = reservation.tokens - actual_tokens
+        if difference:
+            self._adjust(reservation.model, difference)
+            if difference > 0:
+                self._count(refunded_tokens=difference)
+            else:
+                self._count(charged_tokens=-difference)
+
+    async def areconcile(self, reservation: Reservation, actual_tokens: int = None) -> None:
+        """reconcile() for coroutines."""
+        await self._off_loop(self.reconcile, reservation, actual_tokens)
+
+    def refund(self, reservation: Reservation) -> None:
+        """Return a reservation's whole budget, request included, for a call that never ran."""
+        if reservation is None:
+            return
+        self._adjust(reservation.model, reservation.tokens, requests=1)
+        self._count(refunded_tokens=reservation.tokens)
+
+    async def arefund(self, reservation: Reservation) -> None:
+        """refund() for coroutines."""
+        await self._off_loop(self.refund, reservation)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['shared'] = bool(self.db_path)
+        stats['limits'] = {
+            model: {'tokens_per_minute': tokens, 'requests_per_minute': requests}
+            for model, (tokens, requests) in self.limits.items()
+        }
+        return stats
+
+    def _request(self, model: str, prompt_tokens: int, deadline=None) -> tuple:
+        """Tokens to reserve for a call and the longest it may wait for them."""
+        tokens_per_minute, _ = self.limits[model]
+        # A call larger than the bucket could never run, so it only needs a full bucket
+        tokens = min(prompt_tokens + self.expected_completion_tokens, tokens_per_minute)
+        max_wait = self.max_wait if deadline is None else min(self.max_wait, deadline.remaining())
+        return tokens, max_wait
+
+    def _check_wait(self, model: str, tokens: int, wait: float, waited: float, max_wait: float) -> None:
+        """Refuse a call whose budget will not be there before max_wait."""
+        if waited + wait > max_wait:
+            self._count(rejected=1)
+            raise AgentRateLimitError(
+                f"{model} token budget exhausted; {wait:.1f}s until {tokens} tokens are available",
+                max(1, round(wait))
+            )
+
+    def _take(self, model: str, tokens: int) -> float:
+        """Take a call's budget if both buckets cover it; otherwise return the seconds to wait."""
+        tokens_per_minute, requests_per_minute = self.limits[model]
+        with self._state(model) as state:
+            now = time.time()
+            token_level = self._refill(state, 'tokens', tokens_per_minute, now)
+            request_level = self._refill(state, 'requests', requests_per_minute, now)
+            if token_level >= tokens and request_level >= 1:
+                state['tokens'] = (token_level - tokens, now)
+                state['requests'] = (request_level - 1, now)
+                return 0.0
+            return max(
+                (tokens - token_level) * 60.0 / tokens_per_minute,
+                (1 - request_level) * 60.0 / requests_per_minute
+            )
+
+    def _adjust(self, model: str, tokens: float, requests: int = 0) -> None:
+        """Add tokens (and requests) to a model's buckets; negative amounts leave them in debt."""
+        tokens_per_minute, requests_per_minute = self.limits[model]
+        with self._state(model) as state:
+            now = time.time()
+            state['tokens'] = (self._refill(state, 'tokens', tokens_per_minute, now) + tokens, now)
+            if requests:
+                state['requests'] = (self._refill(state, 'requests', requests_per_minute, now) + requests, now)
+
+    @staticmethod
+    def _refill(state: dict, kind: str, per_minute: int, now: float) -> float:
+        """Current level of a bucket that refills continuously up to its per-minute capacity."""
+        level, updated = state.get(kind, (per_minute, now))
+        return min(per_minute, level + (now - updated) * per_minute / 60.0)
+
+    @contextmanager
+    def _state(self, model: str):
+        """Read and write a model's buckets atomically, across processes with db_path."""
+        if not self.db_path:
+            with self._lock:
+                state = self._buckets.setdefault(model, {})
+                yield state
+            return
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            state = {
+                kind: (level, updated)
+                for kind, level, updated in connection.execute(
+                    "SELECT kind, level, updated FROM rate_buckets WHERE model = ?", (model,)
+                )
+            }
+            yield state
+            connection.executemany(
+                "INSERT OR REPLACE INTO rate_buckets (model, kind, level, updated) VALUES (?, ?, ?, ?)",
+                [(model, kind, level, updated) for kind, (level, updated) in state.items()]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    async def _off_loop(self, function, *args):
+        """Run a bucket operation; with db_path on a worker thread, so SQLite never blocks the event loop."""
+        if self.db_path:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _count(self, **amounts) -> None:
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets several processes share the file."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,114 @@
+from collections.abc import Mapping
+from collections import Counter
+from importlib import import_module
+import threading
+import logging
+import time
+
+from .prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Agent type -> (module, class, display name)
+AGENT_SPECS = {
+    'pm': ('agents.project_manager', 'ProjectManagerAgent', 'PM'),
+    'dev': ('agents.developer', 'DeveloperAgent', 'DEVELOPER'),
+    'tester': ('agents.tester', 'TesterAgent', 'TESTER'),
+    'devops': ('agents.devops', 'DevOpsAgent', 'DEVOPS'),
+    'ba': ('agents.business_analyst', 'BusinessAnalystAgent', 'BUSINESS ANALYST'),
+    'uxd': ('agents.ux_designer', 'UXDesignerAgent', 'UX DESIGNER')
+}
+
+
+class AgentRegistry(Mapping):
+    """
+    Agents keyed by type, each built on first use.
+
+    Values are (agent, display name) pairs. Membership tests and iteration
+    only look at the known types, so they never build an agent. A failed
+    construction is raised to the caller and retried on the next use, so
+    one misconfigured agent does not stop the app or the other agents.
+    """
+
+    def __init__(self, specs: dict = None):
+        """
+        Args:
+            specs: Mapping of agent type to (module, class name, display name);
+                AGENT_SPECS by default
+        """
+        self.specs = dict(AGENT_SPECS if specs is None else specs)
+        self._agents = {}
+        self._locks = {agent_type: threading.Lock() for agent_type in self.specs}
+        self._build_seconds = {}
+        self._failures = Counter()
+
+    def __getitem__(self, agent_type: str) -> tuple:
+        entry = self._agents.get(agent_type)
+        if entry is not None:
+            return entry
+        if agent_type not in self.specs:
+            raise KeyError(agent_type)
+
+        with self._locks[agent_type]:
+            entry = self._agents.get(agent_type)
+            if entry is None:
+                entry = self._agents[agent_type] = self._build(agent_type)
+        return entry
+
+    def __contains__(self, agent_type) -> bool:
+        return agent_type in self.specs
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def warm_up(self, agent_types: list = None) -> dict:
+        """
+        Build agents before their first request.
+
+        Args:
+            agent_types: Agents to build; all of them by default
+
+        Returns:
+            Error message by agent type for agents that could not be built
+        """
+        started = time.perf_counter()
+        errors = {}
+        for agent_type in agent_types or list(self.specs):
+            try:
+                self[agent_type]
+            except Exception as e:
+                errors[agent_type] = str(e)
+        # Load the tokenizer too; the first prompt would otherwise pay for it
+        count_tokens('warm up')
+        logger.info(f"Warmed up {len(self._agents)} agent(s) in {time.perf_counter() - started:.2f}s")
+        return errors
+
+    def warm_up_in_background(self, agent_types: list = None) -> threading.Thread:
+        """Run warm_up in a daemon thread so startup does not wait for it."""
+        thread = threading.Thread(target=self.warm_up, args=(agent_types,), name='agent-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {
+            'known': list(self.specs),
+            'built': [agent_type for agent_type in self.specs if agent_type in self._agents],
+            'build_ms': {agent_type: round(seconds * 1000) for agent_type, seconds in self._build_seconds.items()},
+            'failures': dict(self._failures)
+        }
+
+    def _build(self, agent_type: str) -> tuple:
+        module_name, class_name, display_name = self.specs[agent_type]
+        started = time.perf_counter()
+        try:
+            agent = getattr(import_module(module_name), class_name)()
+        except Exception as e:
+            self._failures[agent_type] += 1
+            logger.error(f"Could not build {agent_type} agent: {str(e)}")
+            raise
+        self._build_seconds[agent_type] = time.perf_counter() - started
+        logger.info(f"Built {agent_type} agent in {self._build_seconds[agent_type]:.2f}s")
+        return agent, display_name
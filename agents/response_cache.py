@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import threading
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# In-memory entries, entry lifetime in seconds and optional shared SQLite file
+DEFAULT_CACHE_SIZE = int(os.environ.get('AGENT_CACHE_SIZE', 256))
+DEFAULT_CACHE_TTL = float(os.environ.get('AGENT_CACHE_TTL', 3600))
+DEFAULT_CACHE_DB = os.environ.get('AGENT_CACHE_DB')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return ' '.join(prompt.split())
+
+
+class ResponseCache:
+    """
+    Cache of agent responses keyed by agent, model, temperature and prompt.
+
+    Entries live in an in-memory LRU with a TTL. When ``db_path`` is set, a
+    SQLite file acts as a second tier shared by every worker process on the
+    host; disk hits are promoted into memory.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL,
+                 db_path: str = DEFAULT_CACHE_DB):
+        """
+        Args:
+            max_entries: Maximum number of in-memory entries; 0 disables the cache
+            ttl: Seconds an entry stays valid
+            db_path: Optional SQLite file for the persistent tier
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'stores': 0}
+
+        if self.db_path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(agent_type: str, model: str, temperature: float, prompt: str) -> str:
+        """Hash the inputs that determine a response."""
+        payload = json.dumps([agent_type, model, temperature, normalize_prompt(prompt)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached response for a key, or None."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['memory_hits'] += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                row = self._connection().execute(
+                    "SELECT response, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache read failed: {str(e)}")
+                row = None
+            if row:
+                self._remember(key, row[0], row[1])
+                self._count('hits', 'disk_hits')
+                return row[0]
+
+        self._count('misses')
+        return None
+
+    def set(self, key: str, response: str) -> None:
+        """Store a response in every tier."""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl
+        self._remember(key, response, expires_at)
+        self._count('stores')
+
+        if self.db_path:
+            try:
+                with self._connection() as connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                        (key, response, expires_at)
+                    )
+                    connection.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {str(e)}")
+
+    async def aget(self, key: str):
+        """get() for coroutines: with db_path the lookup runs on a worker thread."""
+        if self.db_path and self.enabled:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, response: str) -> None:
+        """set() for coroutines: with db_path the write runs on a worker thread."""
+        if self.db_path and self.enabled:
+            await asyncio.to_thread(self.set, key, response)
+        else:
+            self.set(key, response)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['persistent'] = bool(self.db_path)
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM response_cache")
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, *names) -> None:
+        with self._lock:
+            for name in names:
+                self._counters[name] += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets several processes share the file."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
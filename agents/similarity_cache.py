@@ -0,0 +1,207 @@
+from collections import OrderedDict, deque
+import numpy as np
+import threading
+import logging
+import json
+import time
+import zlib
+import re
+import os
+
+logger = logging.getLogger(__name__)
+audit_logger = logging.getLogger(f"{__name__}.audit")
+
+# Minimum estimated Jaccard similarity for a hit, entries per index and their lifetime
+DEFAULT_THRESHOLD = float(os.environ.get('AGENT_SIMILARITY_THRESHOLD', 0.9))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('AGENT_SIMILARITY_CACHE_SIZE', 512))
+DEFAULT_TTL = float(os.environ.get('AGENT_SIMILARITY_CACHE_TTL', 3600))
+DEFAULT_AUDIT_LOG = os.environ.get('AGENT_SIMILARITY_AUDIT_LOG')
+
+# 128 permutations in 32 bands of 4 rows: pairs above ~0.42 similarity become candidates
+NUM_PERMUTATIONS = 128
+BANDS = 32
+SHINGLE_SIZE = 4
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case text and reduce punctuation and whitespace to single spaces."""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+class MinHasher:
+    """MinHash signatures of character shingles, computed with NumPy."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS,
+                 shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Hash the text's character shingles to 31-bit integers."""
+        text = normalize_text(text)
+        size = self.shingle_size
+        if len(text) <= size:
+            grams = {text}
+        else:
+            grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+        return np.fromiter(
+            (zlib.crc32(gram.encode('utf-8')) & _MERSENNE_PRIME for gram in grams),
+            dtype=np.uint64, count=len(grams)
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """Minimum of every permutation over the text's shingles."""
+        hashes = self.shingles(text)
+        # (a * x + b) mod p stays below 2**63, so uint64 never overflows
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+
+class _LSHIndex:
+    """Banded LSH buckets over MinHash signatures, with LRU eviction."""
+
+    def __init__(self, bands: int, max_entries: int):
+        self.bands = bands
+        self.max_entries = max_entries
+        self._buckets = [dict() for _ in range(bands)]
+        self._entries = OrderedDict()
+        self._next_id = 0
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        return [band.tobytes() for band in np.array_split(signature, self.bands)]
+
+    def add(self, signature: np.ndarray, response: str, text: str, expires_at: float,
+            conversation: str = None) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        band_keys = self._band_keys(signature)
+        for bucket, key in zip(self._buckets, band_keys):
+            bucket.setdefault(key, set()).add(entry_id)
+        self._entries[entry_id] = (signature, response, text, expires_at, band_keys, conversation)
+
+        while len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+
+    def remove(self, entry_id: int) -> None:
+        band_keys = self._entries.pop(entry_id)[4]
+        for bucket, key in zip(self._buckets, band_keys):
+            members = bucket.get(key)
+            if members:
+                members.discard(entry_id)
+                if not members:
+                    del bucket[key]
+
+    def best_match(self, signature: np.ndarray, now: float, conversation: str = None):
+        """Return (similarity, entry) for the most similar live candidate from the same conversation."""
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+
+        live = []
+        for entry_id in candidates:
+            if self._entries[entry_id][3] <= now:
+                self.remove(entry_id)
+            elif self._entries[entry_id][5] == conversation:
+                live.append(entry_id)
+        if not live:
+            return None
+
+        # Score every candidate at once: the share of matching permutations
+        signatures = np.stack([self._entries[entry_id][0] for entry_id in live])
+        similarities = (signatures == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        self._entries.move_to_end(live[best])
+        return float(similarities[best]), self._entries[live[best]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SimilarityCache:
+    """
+    Near-duplicate response cache based on MinHash and LSH.
+
+    Inputs are compared by the estimated Jaccard similarity of their
+    character shingles, so prompts differing only in whitespace, casing,
+    punctuation or a word can share a response. Each (agent type, model)
+    pair has its own LSH index. An entry stored with a ``conversation``
+    (a fingerprint of the history its prompt included) only matches lookups
+    from the same conversation, so a follow-up question is never answered
+    from another conversation. Every hit is written to an audit log with the
+    similarity and both texts, so hit quality can be reviewed.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL, audit_path: str = DEFAULT_AUDIT_LOG):
+        """
+        Args:
+            threshold: Minimum estimated similarity for a hit, between 0 and 1
+            max_entries: Maximum entries per index; the least recently used go first
+            ttl: Seconds an entry stays valid
+            audit_path: Optional JSON-lines file receiving every hit
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.audit_path = audit_path
+        self._hasher = MinHasher()
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stores': 0}
+        self._recent_hits = deque(maxlen=100)
+
+    def lookup(self, agent_type: str, model: str, text: str, conversation: str = None):
+        """Return a cached response for text similar enough to one stored in the same conversation, or None."""
+        signature = self._hasher.signature(text)
+        with self._lock:
+            index = self._indexes.get((agent_type, model))
+            match = index.best_match(signature, time.time(), conversation) if index else None
+            if not match or match[0] < self.threshold:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._recent_hits.append(match[0])
+
+        similarity, (_, response, cached_text, _, _, _) = match
+        self._audit(agent_type, model, similarity, text, cached_text)
+        return response
+
+    def add(self, agent_type: str, model: str, text: str, response: str, conversation: str = None) -> None:
+        signature = self._hasher.signature(text)
+        with self._lock:
+            index = self._indexes.get((agent_type, model))
+            if index is None:
+                index = self._indexes[(agent_type, model)] = _LSHIndex(BANDS, self.max_entries)
+            index.add(signature, response, text, time.time() + self.ttl, conversation)
+            self._counters['stores'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = sum(len(index) for index in self._indexes.values())
+            recent = list(self._recent_hits)
+        stats['threshold'] = self.threshold
+        stats['mean_hit_similarity'] = round(sum(recent) / len(recent), 3) if recent else None
+        return stats
+
+    def _audit(self, agent_type: str, model: str, similarity: float, text: str, cached_text: str) -> None:
+        record = {
+            'time': time.time(),
+            'agent_type': agent_type,
+            'model': model,
+            'similarity': round(similarity, 3),
+            'query': text,
+            'matched': cached_text
+        }
+        audit_logger.info(json.dumps(record))
+        if self.audit_path:
+            try:
+                with open(self.audit_path, 'a', encoding='utf-8') as audit_file:
+                    audit_file.write(json.dumps(record) + '\n')
+            except OSError as e:
+                logger.warning(f"Failed to write similarity audit log: {str(e)}")
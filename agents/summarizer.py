@@ -0,0 +1,102 @@
+from langchain_core.messages import HumanMessage
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Longest summary kept per session, in characters
+DEFAULT_SUMMARY_CHARS = 2000
+
+
+class ExtractiveSummarizer:
+    """
+    Deterministic local summarizer.
+
+    Each message that leaves the history window is reduced to its first
+    sentence. When the summary grows past ``max_chars`` the earliest lines are
+    kept (they usually hold the original requirements) and the middle of the
+    summary is dropped, so the result never depends on an LLM call.
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_SUMMARY_CHARS, max_line_chars: int = 200):
+        self.max_chars = max_chars
+        self.max_line_chars = max_line_chars
+
+    def summarize(self, summary: str, messages: list) -> str:
+        """
+        Fold messages into a running summary.
+
+        Args:
+            summary: The current summary, possibly empty
+            messages: Messages that left the history window, oldest first
+
+        Returns:
+            The updated summary
+        """
+        lines = summary.splitlines() if summary else []
+        for msg in messages:
+            content = ' '.join(msg.content.split())
+            if not content:
+                continue
+            sentence = re.split(r'(?<=[.!?])\s', content, maxsplit=1)[0][:self.max_line_chars]
+            speaker = 'User' if isinstance(msg, HumanMessage) else 'Agent'
+            lines.append(f"- {speaker}: {sentence}")
+        return self._bound(lines)
+
+    def _bound(self, lines: list) -> str:
+        """Keep the first and most recent lines within max_chars."""
+        lines = [line for line in lines if line != '- ...']
+        text = '\n'.join(lines)
+        if len(text) <= self.max_chars:
+            return text
+
+        head, tail = [], []
+        budget = self.max_chars - len('- ...')
+        # Alternate so early requirements and recent context are both kept
+        front, back = 0, len(lines) - 1
+        take_front = True
+        while front <= back:
+            line = lines[front] if take_front else lines[back]
+            if len(line) + 1 > budget:
+                break
+            budget -= len(line) + 1
+            if take_front:
+                head.append(line)
+                front += 1
+            else:
+                tail.insert(0, line)
+                back -= 1
+            take_front = not take_front
+        return '\n'.join(head + ['- ...'] + tail)
+
+
+class LLMSummarizer:
+    """Summarizer that asks a chat model to update the running summary."""
+
+    def __init__(self, llm, max_chars: int = DEFAULT_SUMMARY_CHARS):
+        """
+        Args:
+            llm: A LangChain chat model, ideally a fast and cheap one
+            max_chars: Approximate upper bound for the summary length
+        """
+        self.llm = llm
+        self.max_chars = max_chars
+        self._fallback = ExtractiveSummarizer(max_chars)
+
+    def summarize(self, summary: str, messages: list) -> str:
+        transcript = '\n'.join(
+            f"{'User' if isinstance(msg, HumanMessage) else 'Agent'}: {msg.content}"
+            for msg in messages
+        )
+        prompt = (
+            "Update the running summary of a conversation with the new messages below. "
+            "Keep every requirement, decision and open question. "
+            f"Answer with the summary only, in at most {self.max_chars} characters.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        try:
+            return self.llm.invoke(prompt).content.strip()[:self.max_chars]
+        except Exception as e:
+            logger.warning(f"LLM summarization failed, using extractive summary: {str(e)}")
+            return self._fallback.summarize(summary, messages)
@@ -17,4 +17,4 @@ class TesterAgent(BaseAgent):
         Focus on quality, edge cases, and user experience testing.
         Keep responses clear and testing-focused.
         """
-        super().__init__("tester", system_message)
+        super().__init__("tester", system_message, model)
@@ -236,4 +236,4 @@ class UXDesignerAgent(BaseAgent):
         7. Ensure scalability and maintainability of solutions
         8. Practice ethical design and research methods
         """
-        super().__init__("uxd", system_message)
+        super().__init__("uxd", system_message, model)
@@ -1,28 +1,93 @@
 import os
 import sys
-from flask import Flask, render_template, jsonify, request
+import json
+import time
+import asyncio
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from database import db, init_db, Project, ChatMessage
-from agents import (
-    ProjectManagerAgent, DeveloperAgent, TesterAgent, 
-    DevOpsAgent, BusinessAnalystAgent, UXDesignerAgent
-)
+from agents.registry import AgentRegistry
+from agents.base_agent import BaseAgent
+from agents.summarizer import LLMSummarizer
 from config import get_config
+from collaboration import CollaborationExecutor, EarlyDispatcher
+from coalescing import RequestCoalescer
+from persistence import InteractionLog, MessageWriter
+from jobs import JobManager, JobQueueFull
+from agents.deadline import Deadline
+from agents.admission import AgentOverloadedError, AgentRateLimitError
 
 app = Flask(__name__)
 
-# Initialize agents
-agents = {
-    'pm': (ProjectManagerAgent(), 'PM'),
-    'dev': (DeveloperAgent(), 'DEVELOPER'),
-    'tester': (TesterAgent(), 'TESTER'),
-    'devops': (DevOpsAgent(), 'DEVOPS'),
-    'ba': (BusinessAnalystAgent(), 'BUSINESS ANALYST'),
-    'uxd': (UXDesignerAgent(), 'UX DESIGNER')
-}
+# Agents are built on first use; AGENT_WARM_UP=1 builds them in the background at startup
+agents = AgentRegistry()
+if os.environ.get('AGENT_WARM_UP') == '1':
+    agents.warm_up_in_background()
+
+collaboration_executor = CollaborationExecutor(agents)
+
+# Time budget of a synchronous interaction, kept under the load balancer's 60s cut-off; 0 disables it
+INTERACT_DEADLINE_SECONDS = float(os.environ.get('INTERACT_DEADLINE_SECONDS', 50))
+
+# Identical concurrent /interact requests share one run; set COALESCE_REQUESTS=0 to disable
+request_coalescer = RequestCoalescer() if os.environ.get('COALESCE_REQUESTS', '1') != '0' else None
 
 # Initialize database
 init_db(app)
 
+def _load_agent_history(project_id, agent_type, session, limit):
+    """Load a session's most recent persisted messages, used to rehydrate agent memory."""
+    with app.app_context():
+        # Messages stored without a session belong to the default one
+        rows = ChatMessage.query.filter_by(
+            project_id=project_id,
+            agent_type=agent_type,
+            session_id=session
+        ).order_by(ChatMessage.id.desc()).limit(limit).all()
+        return [(row.message_type, row.content) for row in reversed(rows)]
+
+BaseAgent.memory_store.loader = _load_agent_history
+
+# Each interaction's chat messages are written in one transaction, optionally off the request path
+message_writer = MessageWriter(app)
+
+# Older conversation is folded into a rolling summary; the local summarizer is the default
+if os.environ.get('AGENT_SUMMARIZER') == 'llm':
+    from langchain_community.chat_models import ChatOpenAI
+    BaseAgent.memory_store.summarizer = LLMSummarizer(
+        ChatOpenAI(model='gpt-3.5-turbo', temperature=0, **BaseAgent.llm_transport.chat_clients())
+    )
+
+# Per-model quotas shared by all agents, and by all workers when AGENT_RATE_LIMIT_DB is set
+if os.environ.get('AGENT_RATE_LIMIT') == '1':
+    from agents.rate_limiter import TokenRateLimiter, parse_limits
+    BaseAgent.rate_limiter = TokenRateLimiter.from_models(
+        BaseAgent.SUPPORTED_MODELS, parse_limits(os.environ.get('AGENT_RATE_LIMITS'))
+    )
+
+# Each call's model is picked from its input length, role and deadline instead of always the agent's own
+if os.environ.get('AGENT_MODEL_ROUTING') == '1':
+    from agents.model_router import ModelRouter
+    BaseAgent.model_router = ModelRouter(BaseAgent.SUPPORTED_MODELS, BaseAgent.circuit_breakers)
+
+# Near-duplicate prompts can share responses; opt-in because hits are approximate
+if os.environ.get('AGENT_SIMILARITY_CACHE') == '1':
+    from agents.similarity_cache import SimilarityCache
+    BaseAgent.similarity_cache = SimilarityCache()
+
+# LLM calls and the requests that caused them are recorded to, or replayed from, a cassette file
+if os.environ.get('AGENT_CASSETTE'):
+    from agents.cassette import Cassette
+    BaseAgent.cassette = Cassette(
+        os.environ['AGENT_CASSETTE'],
+        mode=os.environ.get('AGENT_CASSETTE_MODE', 'record'),
+        latency=os.environ.get('AGENT_CASSETTE_LATENCY', 'original'),
+        strict=os.environ.get('AGENT_CASSETTE_STRICT') == '1'
+    )
+    # A coalesced request makes no LLM calls of its own, so its turn could not be replayed
+    if not BaseAgent.cassette.replaying and request_coalescer is not None:
+        app.logger.warning("Request coalescing is off while recording a cassette")
+        request_coalescer = None
+
 @app.route('/')
 def index():
     projects = {}
@@ -119,169 +184,490 @@ def get_project_context(project_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Runtime counters for the agent pipeline."""
+    metrics = {
+        'response_cache': BaseAgent.response_cache.stats(),
+        'admission': BaseAgent.admission.stats(),
+        'circuit_breakers': BaseAgent.circuit_breakers.stats(),
+        'llm_transport': BaseAgent.llm_transport.stats(),
+        'agents': agents.stats()
+    }
+    if request_coalescer is not None:
+        metrics['request_coalescing'] = request_coalescer.stats()
+    metrics['message_writer'] = message_writer.stats()
+    metrics['jobs'] = job_manager.stats()
+    if BaseAgent.rate_limiter is not None:
+        metrics['rate_limiter'] = BaseAgent.rate_limiter.stats()
+    if BaseAgent.model_router is not None:
+        metrics['model_router'] = BaseAgent.model_router.stats()
+    if BaseAgent.similarity_cache is not None:
+        metrics['similarity_cache'] = BaseAgent.similarity_cache.stats()
+    if BaseAgent.cassette is not None:
+        metrics['cassette'] = BaseAgent.cassette.stats()
+    return jsonify({
+        'success': True,
+        'metrics': metrics
+    })
+
+def _load_project_context(project_id):
+    """Load a project and the context dictionary passed to agents."""
+    project = None
+    project_context = None
+    if project_id:
+        project = Project.query.get(project_id)
+        if project:
+            project_context = {
+                'id': project.id,
+                'name': project.name,
+                'description': project.description,
+                'status': project.status
+            }
+    return project, project_context
+
+def _load_project_context_detached(project_id):
+    """_load_project_context in its own app context, so the DB connection is returned right after."""
+    with app.app_context():
+        return _load_project_context(project_id)
+
+def _interaction_events(message, agent_type, project_id, request_options=None, ordered=True, stream_tokens=False):
+    """
+    Run an interaction and yield (event name, payload) pairs.
+
+    An 'agent' event is yielded for the primary agent's reply first, followed
+    by one for every collaborator as its call completes. Each carries the
+    agent's display name, its context summary and the latency of its call.
+    With stream_tokens, the primary agent's reply is preceded by 'token'
+    events as the completion streams in, and collaborators are dispatched as
+    soon as their [NEED_X: ...] marker appears in the stream. request_options
+    (session, no_cache, deadline) are passed in every agent call's context.
+    Collaborators left out by the deadline or the collaboration plan's
+    limits are reported by a 'skipped' event instead, and a final 'plan'
+    event describes the collaboration that ran.
+    """
+    request_options = request_options or {}
+    agent, display_name = agents[agent_type]
+    _record_interaction(message, agent_type, project_id, request_options)
+    project, project_context = _load_project_context(project_id)
+
+    # Messages are collected here and persisted together once the interaction ends
+    log = InteractionLog(project_id, request_options.get('session')) if project else None
+    if log is not None:
+        log.add(agent_type, 'user', message)
+
+    # Return the DB connection to the pool while the agents wait on the LLM
+    db.session.close()
+
+    dispatcher = None
+    try:
+        # Process message with context
+        started = time.perf_counter()
+        agent_context = dict(request_options)
+        if project_context:
+            agent_context['project'] = project_context
+        if stream_tokens:
+            # Early calls are admitted by the same plan that later runs the tree
+            plan = collaboration_executor.new_plan(agent_type)
+            dispatcher = EarlyDispatcher(
+                collaboration_executor, message, agent_type, project_context, request_options, plan=plan
+            )
+            result = yield from _token_events(agent, agent_type, message, agent_context, dispatcher)
+            plan.record_primary(agent, result)
+        else:
+            result = agent.process_input(message, agent_context)
+            plan = collaboration_executor.new_plan(agent_type, result)
+        latency = time.perf_counter() - started
+
+        yield 'agent', _agent_event(log, agent_type, None, display_name, result, latency)
+
+        # Run collaborators level by level, in parallel within each level
+        if result.get('needs_collaboration'):
+            for collab in collaboration_executor.run(
+                message, agent_type, result, display_name, project_context, ordered=ordered,
+                prefetched=dispatcher.dispatched if dispatcher else None, request_options=request_options,
+                plan=plan
+            ):
+                yield _collaborator_event(log, collab)
+
+            # The executed delegation DAG, for debugging cost and latency
+            yield 'plan', plan.to_dict()
+    finally:
+        # Early collaborator calls nobody used, e.g. after a failed stream, are dropped
+        if dispatcher is not None:
+            dispatcher.discard()
+        # Keep whatever completed, as when every message was committed on its own
+        if log is not None:
+            _write_log(log)
+
+async def _ainteraction_events(message, agent_type, project_id, request_options=None, ordered=True):
+    """
+    _interaction_events for the ASGI server, as an async generator.
+
+    Agent calls run as coroutines on the event loop and database work on
+    worker threads, so a waiting interaction holds no thread. Token
+    streaming is not available on this path.
+    """
+    request_options = request_options or {}
+    agent, display_name = agents[agent_type]
+    _record_interaction(message, agent_type, project_id, request_options)
+    project, project_context = await asyncio.to_thread(_load_project_context_detached, project_id)
+
+    log = InteractionLog(project_id, request_options.get('session')) if project else None
+    if log is not None:
+        log.add(agent_type, 'user', message)
+
+    try:
+        started = time.perf_counter()
+        agent_context = dict(request_options)
+        if project_context:
+            agent_context['project'] = project_context
+        result = await agent.aprocess_input(message, agent_context)
+        latency = time.perf_counter() - started
+
+        yield 'agent', _agent_event(log, agent_type, None, display_name, result, latency)
+
+        if result.get('needs_collaboration'):
+            plan = collaboration_executor.new_plan(agent_type, result)
+            async for collab in collaboration_executor.arun(
+                message, agent_type, result, display_name, project_context, ordered=ordered,
+                request_options=request_options, plan=plan
+            ):
+                yield _collaborator_event(log, collab)
+
+            yield 'plan', plan.to_dict()
+    finally:
+        if log is not None:
+            await _awrite_log(log)
+
+def _write_log(log):
+    """
+    Persist an interaction's messages.
+
+    Called from finally blocks, so a failed commit is logged instead of
+    raised: it must not replace the agent error that may be propagating.
+    """
+    try:
+        message_writer.write(log)
+    except Exception as e:
+        app.logger.error(f"Failed to persist {len(log)} chat message(s) for project {log.project_id}: {str(e)}")
+
+async def _awrite_log(log):
+    """_write_log for coroutines."""
+    try:
+        await message_writer.awrite(log)
+    except Exception as e:
+        app.logger.error(f"Failed to persist {len(log)} chat message(s) for project {log.project_id}: {str(e)}")
+
+def _record_interaction(message, agent_type, project_id, request_options):
+    """Add an interaction's /interact request to the cassette being recorded, if any."""
+    if BaseAgent.cassette is None or BaseAgent.cassette.replaying:
+        return
+    data = {'message': message, 'agent': agent_type}
+    if project_id:
+        data['project'] = project_id
+    for option in ('session', 'no_cache'):
+        if request_options.get(option):
+            data[option] = request_options[option]
+    BaseAgent.cassette.record_interaction(data)
+
+def _agent_event(log, agent_type, parent_type, display_name, result, latency):
+    """Record an agent's reply in the interaction log and build its 'agent' event."""
+    if log is not None:
+        log.add(agent_type, 'agent', result['response'], result.get('context_summary'))
+    return {
+        'agent_type': agent_type,
+        'parent_type': parent_type,
+        'display_name': display_name,
+        'response': result['response'],
+        'context_summary': result.get('context_summary'),
+        'latency_ms': round(latency * 1000)
+    }
+
+def _collaborator_event(log, collab):
+    """Turn a collaboration executor result into an (event name, payload) pair."""
+    if collab.get('skipped'):
+        return 'skipped', {
+            'agent_type': collab['agent_type'],
+            'parent_type': collab['parent_type'],
+            'display_name': collab['display_name'],
+            'reason': collab['reason']
+        }
+    return 'agent', _agent_event(
+        log, collab['agent_type'], collab['parent_type'], collab['display_name'],
+        collab['result'], collab['latency']
+    )
+
+# Background interactions started with POST /interact?async=1
+job_manager = JobManager(app, _interaction_events)
+
+def _coalescing_key(message, agent_type, project_id, request_options):
+    """Identify requests that would produce the same interaction, or None to run alone."""
+    if request_coalescer is None or request_options.get('no_cache'):
+        return None
+    memory = agents[agent_type][0].get_memory(project_id, request_options.get('session'))
+    return RequestCoalescer.make_key(project_id, agent_type, message, memory.fingerprint())
+
+def _run_interaction(message, agent_type, project_id, request_options):
+    """Run an interaction to completion and return its [event name, payload] pairs."""
+    key = _coalescing_key(message, agent_type, project_id, request_options)
+    if key is None:
+        return [[name, event] for name, event in _interaction_events(message, agent_type, project_id, request_options)]
+
+    # Only the leader runs the tree; followers reuse its events and keep their own copy of the exchange.
+    # A follower waits no longer than its own deadline allows.
+    deadline = request_options.get('deadline')
+    session = request_options.get('session')
+    shared_run, shared = request_coalescer.run(
+        key, lambda: {
+            'session': session,
+            'events': [[name, event] for name, event in _interaction_events(message, agent_type, project_id, request_options)]
+        },
+        timeout=deadline.remaining() if deadline is not None else None
+    )
+    if shared:
+        app.logger.info(f"Coalesced identical {agent_type} request for project {project_id}")
+        _persist_shared_interaction(message, agent_type, project_id, session, shared_run)
+    return shared_run['events']
+
+def _persist_shared_interaction(message, agent_type, project_id, session, shared_run):
+    """Record a coalesced follower's message and the replies it was served, in its memory and chat history."""
+    project, _ = _load_project_context(project_id)
+    events = shared_run['events']
+
+    # The leader's turns are already in its session's memory; another session gets its own copy
+    if shared_run['session'] != session:
+        context = {'session': session}
+        if project is not None:
+            context['project'] = {'id': project.id}
+        for name, event in events:
+            if name == 'agent':
+                agents[event['agent_type']][0].record_turn(message, event['response'], context)
+
+    if project is None:
+        return
+    log = InteractionLog(project_id, session)
+    log.add(agent_type, 'user', message)
+    for name, event in events:
+        if name == 'agent':
+            log.add(event['agent_type'], 'agent', event['response'], event.get('context_summary'))
+    _write_log(log)
+
+def _token_events(agent, agent_type, message, context, dispatcher=None):
+    """Yield 'token' events for a streamed reply and return the agent's result."""
+    tokens = agent.stream_input(message, context)
+    while True:
+        try:
+            token = next(tokens)
+        except StopIteration as stop:
+            return stop.value
+        if dispatcher:
+            dispatcher.feed(token)
+        yield 'token', {'agent_type': agent_type, 'token': token}
+
+def _parse_interaction_request(data=None):
+    """Validate an interaction request (or a decoded JSON body), returning (params, error response)."""
+    if data is None:
+        data = request.get_json()
+    message = data.get('message')
+    agent_type = data.get('agent', 'pm')
+    project_id = data.get('project')
+
+    # Per-request settings passed to every agent call
+    request_options = {}
+    if data.get('session'):
+        request_options['session'] = data['session']
+    if data.get('no_cache'):
+        request_options['no_cache'] = True
+
+    if not message:
+        return None, (jsonify({
+            'success': False,
+            'error': 'No message provided'
+        }), 400)
+
+    if agent_type not in agents:
+        return None, (jsonify({
+            'success': False,
+            'error': f'Invalid agent type: {agent_type}'
+        }), 400)
+
+    return (message, agent_type, project_id, request_options), None
+
+def _format_event(event):
+    """Format a collaborator event the way it appears in the combined response."""
+    # Context summaries are stored with the message but kept out of the chat text
+    return f"{event['display_name']}: {event['response']}"
+
+def _too_many_requests(error):
+    """429 response for a refused or rate-limited LLM call, with Retry-After when known."""
+    response = jsonify({
+        'success': False,
+        'error': 'The agents are busy, please try again shortly',
+        'details': str(error)
+    })
+    response.status_code = 429
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _start_deadline(request_options):
+    """Give a synchronous interaction its time budget."""
+    if INTERACT_DEADLINE_SECONDS > 0:
+        request_options['deadline'] = Deadline(INTERACT_DEADLINE_SECONDS)
+
+def _combine_events(events):
+    """Join agent events into the chat text returned by /interact."""
+    # The primary agent's reply is shown as-is, collaborators with their name
+    parts = [events[0]['response']]
+    parts.extend(_format_event(event) for event in events[1:])
+    return '\n\n'.join(parts)
+
+def _interaction_response(events):
+    """JSON response of /interact from an interaction's [event name, payload] pairs."""
+    replies = [event for name, event in events if name == 'agent']
+    payload = {
+        'success': True,
+        'response': _combine_events(replies),
+        'skipped_agents': [event['agent_type'] for name, event in events if name == 'skipped']
+    }
+    plans = [event for name, event in events if name == 'plan']
+    if plans:
+        payload['plan'] = plans[0]
+    return jsonify(payload)
+
+async def ainteract(data):
+    """
+    POST /interact for the ASGI server (see asgi.py); runs inside an app context.
+
+    Behaves like interact() without ?async=1 jobs and request coalescing.
+    """
+    try:
+        params, error = _parse_interaction_request(data)
+        if error:
+            return error
+
+        BaseAgent.admission.check(params[1])
+        _start_deadline(params[3])
+        return _interaction_response([[name, event] async for name, event in _ainteraction_events(*params)])
+
+    except (AgentOverloadedError, AgentRateLimitError) as e:
+        return _too_many_requests(e)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while processing your request',
+            'details': str(e)
+        }), 500
+
+def _sse(event, data):
+    """Encode a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/interact', methods=['POST'])
 def interact():
     try:
-        data = request.get_json()
-        message = data.get('message')
-        agent_type = data.get('agent', 'pm')
-        project_id = data.get('project')
-        
-        if not message:
+        params, error = _parse_interaction_request()
+        if error:
+            return error
+
+        # ?async=1 returns a job id right away; progress is read from /jobs/<id>
+        if request.args.get('async') == '1':
+            try:
+                job_id = job_manager.submit(*params)
+            except JobQueueFull as e:
+                return jsonify({
+                    'success': False,
+                    'error': 'Too many interactions are queued, please try again shortly',
+                    'details': str(e)
+                }), 503
             return jsonify({
-                'success': False,
-                'error': 'No message provided'
-            }), 400
-            
-        # Get project context if project_id is provided
-        project = None
-        project_context = None
-        if project_id:
-            project = Project.query.get(project_id)
-            if project:
-                project_context = {
-                    'id': project.id,
-                    'name': project.name,
-                    'description': project.description,
-                    'status': project.status
-                }
-        
-        # Store user message if project exists
-        if project:
-            user_message = ChatMessage(
-                project_id=project_id,
-                agent_type=agent_type,
-                message_type='user',
-                content=message
-            )
-            db.session.add(user_message)
-            db.session.commit()
-        
-        # Get initial agent response
-        agent, display_name = agents.get(agent_type, (None, None))
-        if not agent:
+                'success': True,
+                'job_id': job_id,
+                'status_url': f'/jobs/{job_id}'
+            }), 202
+
+        # Refuse before doing any work when the agent's LLM queue is already full
+        BaseAgent.admission.check(params[1])
+        _start_deadline(params[3])
+        return _interaction_response(_run_interaction(*params))
+
+    except (AgentOverloadedError, AgentRateLimitError) as e:
+        db.session.rollback()
+        return _too_many_requests(e)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while processing your request',
+            'details': str(e)
+        }), 500
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Report an asynchronous interaction's progress and partial responses."""
+    try:
+        job = job_manager.get(job_id)
+        if not job:
             return jsonify({
                 'success': False,
-                'error': f'Invalid agent type: {agent_type}'
-            }), 400
-            
-        # Process message with context
-        result = agent.process_input(message, {'project': project_context} if project_context else None)
-        
-        # Store agent response if project exists
-        if project:
-            agent_message = ChatMessage(
-                project_id=project_id,
-                agent_type=agent_type,
-                message_type='agent',
-                content=result['response'],
-                context_summary=result.get('context_summary')
-            )
-            db.session.add(agent_message)
-            db.session.commit()
-        
-        # Format initial response
-        response = result['response']
-        
-        # Track collaboration context
-        collaboration_context = {
-            agent_type: {
-                'response': result['response'],
-                'display_name': display_name,
-                'requests': result.get('collaboration_requests', {}),
-                'context_summary': result.get('context_summary')
-            }
-        }
-        
-        # Handle collaboration needs
-        if result.get('needs_collaboration'):
-            collaboration_queue = [(agent_type, collab_type) for collab_type in result['needs_collaboration']]
-            used_agents = {agent_type}
-            
-            while collaboration_queue:
-                parent_type, collab_type = collaboration_queue.pop(0)
-                
-                # Process each collaboration request
-                if collab_type in used_agents:
-                    continue
-                    
-                collab_agent, collab_display_name = agents.get(collab_type, (None, None))
-                if not collab_agent:
-                    continue
-
-                try:
-                    # Prepare context with previous responses
-                    collab_context = {
-                        'previous_responses': {
-                            agent_type: info['response']
-                            for agent_type, info in collaboration_context.items()
-                        }
-                    }
-                    
-                    # Add project context
-                    if project_context:
-                        collab_context['project'] = project_context
-
-                    # Add specific requests from parent agent
-                    parent_requests = collaboration_context[parent_type].get('requests', {})
-                    if collab_type in parent_requests:
-                        collab_context['requests'] = parent_requests[collab_type]
-
-                    # Get collaboration response
-                    collab_result = collab_agent.process_input(message, collab_context)
-                    
-                    # Store collaborator response
-                    if project:
-                        collab_message = ChatMessage(
-                            project_id=project_id,
-                            agent_type=collab_type,
-                            message_type='agent',
-                            content=collab_result['response'],
-                            context_summary=collab_result.get('context_summary')
-                        )
-                        db.session.add(collab_message)
-                        db.session.commit()
-                    
-                    # Add to used agents
-                    used_agents.add(collab_type)
-                    
-                    # Update collaboration context
-                    collaboration_context[collab_type] = {
-                        'response': collab_result['response'],
-                        'display_name': collab_display_name,
-                        'requests': collab_result.get('collaboration_requests', {}),
-                        'context_summary': collab_result.get('context_summary')
-                    }
-                    
-                    # Add formatted response
-                    if collab_result.get('context_summary'):
-                        response += f"\n\n{collab_display_name} (with context from: {collab_result['context_summary']})\n{collab_result['response']}"
-                    else:
-                        response += f"\n\n{collab_display_name}: {collab_result['response']}"
-
-                    # Handle nested collaboration
-                    nested_collaboration = collab_result.get('needs_collaboration', [])
-                    if nested_collaboration:
-                        for nested_type in nested_collaboration:
-                            if nested_type not in used_agents:
-                                collaboration_queue.append((collab_type, nested_type))
-
-                except Exception as e:
-                    continue
+                'error': 'Job not found'
+            }), 404
+
+        if job['status'] == 'completed' and job['responses']:
+            job['response'] = _combine_events(job['responses'])
 
         return jsonify({
             'success': True,
-            'response': response
+            'job': job
         })
 
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
-            'error': 'An error occurred while processing your request',
-            'details': str(e)
+            'error': str(e)
         }), 500
 
+@app.route('/interact/stream', methods=['POST'])
+def interact_stream():
+    """
+    Stream an interaction as Server-Sent Events.
+
+    The primary agent's reply arrives as 'token' events while it is generated,
+    then every agent's complete reply is sent as an 'agent' event as soon as
+    its call finishes.
+    """
+    params, error = _parse_interaction_request()
+    if error:
+        return error
+    try:
+        BaseAgent.admission.check(params[1])
+    except AgentOverloadedError as e:
+        return _too_many_requests(e)
+    _start_deadline(params[3])
+
+    def generate():
+        try:
+            for name, event in _interaction_events(*params, ordered=False, stream_tokens=True):
+                yield _sse(name, event)
+            yield _sse('done', {'success': True})
+        except Exception as e:
+            db.session.rollback()
+            yield _sse('error', {
+                'success': False,
+                'error': 'An error occurred while processing your request',
+                'details': str(e),
+                'retry_after': getattr(e, 'retry_after', None)
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 if __name__ == '__main__':
     config = get_config()
     
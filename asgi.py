@@ -0,0 +1,79 @@
+"""
+ASGI entry point.
+
+POST /interact runs natively on asyncio through app.ainteract, so one
+worker holds many interactions that are waiting on the LLM without a
+thread each. Every other route, including /interact?async=1 jobs and the
+SSE stream, is the Flask app served through asgiref's WsgiToAsgi adapter.
+
+Run with an ASGI server, for example:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+from urllib.parse import parse_qs
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app, ainteract
+from agents.base_agent import BaseAgent
+
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and _is_async_interaction(scope):
+        await _interact(receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
+
+
+def _is_async_interaction(scope) -> bool:
+    """POST /interact requests served by the coroutine path."""
+    if scope['method'] != 'POST' or scope['path'] != '/interact':
+        return False
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('async') != ['1']
+
+
+async def _interact(receive, send):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    with flask_app.app_context():
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            response = flask_app.make_response(({'success': False, 'error': 'Invalid JSON body'}, 400))
+        else:
+            response = flask_app.make_response(await ainteract(data))
+
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in response.headers.items()
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Close the pooled LLM connections while their event loop still runs
+            await BaseAgent.llm_transport.aclose()
+            BaseAgent.llm_transport.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
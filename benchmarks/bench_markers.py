@@ -0,0 +1,108 @@
+"""
+Microbenchmark for collaboration marker scanning.
+
+Compares the previous multi-pass implementation of
+BaseAgent._analyze_collaboration_needs with the single-pass
+scan_collaboration_markers on synthetic 10-50 KB responses.
+
+Usage:
+    python benchmarks/bench_markers.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.markers import scan_collaboration_markers
+
+FILLER = (
+    "The team should review the architecture, align on the API contract and "
+    "document the rollout plan before the next sprint starts. "
+)
+
+MARKERS = [
+    "[NEED_DEV: implement the order service]",
+    "[NEED_DEVOPS: provision the staging cluster]",
+    "[NEED_BA: confirm the reporting requirements]",
+    "[NEED_PM: update the timeline]",
+    "Developer -> Task for Developer [add input validation]",
+    "Tester -> Task for Tester [write regression tests]",
+    "UX Designer -> Task for UX Designer [review the checkout flow]",
+]
+
+
+def legacy_analyze(response: str, agent_type: str) -> tuple:
+    """The multi-pass implementation scan_collaboration_markers replaced."""
+    agent_display_names = {
+        'dev': 'Developer', 'tester': 'Tester', 'devops': 'DevOps',
+        'pm': 'PM', 'ba': 'Business Analyst', 'uxd': 'UX Designer'
+    }
+    need_patterns = {
+        'dev': r'Developer\s*->\s*Task for Developer\s*\[(.*?)\]',
+        'tester': r'Tester\s*->\s*Task for Tester\s*\[(.*?)\]',
+        'devops': r'DevOps\s*->\s*Task for DevOps\s*\[(.*?)\]',
+        'pm': r'PM\s*->\s*Task for PM\s*\[(.*?)\]',
+        'ba': r'Business Analyst\s*->\s*Task for Business Analyst\s*\[(.*?)\]',
+        'uxd': r'UX Designer\s*->\s*Task for UX Designer\s*\[(.*?)\]'
+    }
+    old_patterns = {
+        'dev': r'\[NEED_DEV:(.*?)\]',
+        'tester': r'\[NEED_TEST:(.*?)\]',
+        'devops': r'\[NEED_DEVOPS:(.*?)\]',
+        'pm': r'\[NEED_PM:(.*?)\]',
+        'ba': r'\[NEED_BA:(.*?)\]'
+    }
+    needed_agents = []
+    collaboration_requests = {}
+    modified_response = response
+    for agent, pattern in old_patterns.items():
+        for match in re.findall(pattern, modified_response, re.IGNORECASE | re.DOTALL):
+            old_text = f'[NEED_{agent.upper()}:{match}]'
+            new_text = f'{agent_display_names[agent]} -> Task for {agent_display_names[agent]} [{match.strip()}]'
+            modified_response = modified_response.replace(old_text, new_text)
+    for agent, pattern in need_patterns.items():
+        if agent != agent_type:
+            matches = re.findall(pattern, modified_response, re.IGNORECASE | re.DOTALL)
+            if matches:
+                needed_agents.append(agent)
+                collaboration_requests[agent] = [req.strip() for req in matches]
+    return needed_agents, collaboration_requests
+
+
+def make_response(size: int, markers: int, seed: int = 0) -> str:
+    """Build a response of about `size` bytes with markers spread through it."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        parts.append(FILLER)
+        length += len(FILLER)
+    for _ in range(markers):
+        parts.insert(rng.randrange(len(parts)), rng.choice(MARKERS) + ' ')
+    return ''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=50, help='calls per measurement')
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'markers':>8} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    for size in (10_000, 20_000, 50_000):
+        for markers in (2, 20):
+            response = make_response(size, markers)
+            legacy = min(timeit.repeat(
+                lambda: legacy_analyze(response, 'pm'), number=args.repeat, repeat=3
+            )) / args.repeat
+            single = min(timeit.repeat(
+                lambda: scan_collaboration_markers(response, exclude='pm'), number=args.repeat, repeat=3
+            )) / args.repeat
+            print(f"{len(response):>8} {markers:>8} {legacy * 1000:>10.3f} {single * 1000:>15.3f} {legacy / single:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
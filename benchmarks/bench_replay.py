@@ -0,0 +1,163 @@
+"""
+Replay benchmark for the orchestration loop.
+
+Sends the interactions recorded in a cassette (see agents/cassette.py) to
+/interact through Flask's test client, and answers every LLM call from the
+cassette. There is no network, so what is measured is the app's own work.
+Prompt building, marker parsing, database writes and the collaboration
+loop are each timed across all threads.
+
+Record a cassette by running the app with AGENT_CASSETTE=calls.jsonl, then:
+    python benchmarks/bench_replay.py calls.jsonl [--latency zero|original]
+        [--repeat N] [--concurrency N] [--strict] [--allow-fallbacks] [--cprofile out.prof]
+
+A call answered by fallback had a prompt that was never recorded, so the
+run did different work than the recording; the benchmark then exits with
+an error unless --allow-fallbacks is given.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import argparse
+import cProfile
+import functools
+import inspect
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SectionTimer:
+    """Inclusive wall time of wrapped functions, summed over every thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def wrap(self, owner, name: str, label: str) -> None:
+        """Replace owner.name with a timed version."""
+        function = getattr(owner, name)
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return (yield from function(*args, **kwargs))
+                finally:
+                    self._add(label, time.perf_counter() - started)
+        else:
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self._add(label, time.perf_counter() - started)
+        setattr(owner, name, timed)
+
+    def _add(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[label] += seconds
+            self.counts[label] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('cassette', help='cassette recorded with AGENT_CASSETTE')
+    parser.add_argument('--latency', choices=('zero', 'original'), default='zero',
+                        help='answer replayed calls at once or after their recorded latency')
+    parser.add_argument('--repeat', type=int, default=1, help='times to replay the whole cassette')
+    parser.add_argument('--concurrency', type=int, default=1, help='interactions replayed at once')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail calls whose prompt was not recorded instead of falling back')
+    parser.add_argument('--allow-fallbacks', action='store_true',
+                        help='report results even when calls were answered by fallback')
+    parser.add_argument('--cprofile', help='write a cProfile of the main thread to this file')
+    args = parser.parse_args()
+
+    # The app reads these at import time
+    os.environ.update({
+        'AGENT_CASSETTE': os.path.abspath(args.cassette),
+        'AGENT_CASSETTE_MODE': 'replay',
+        'AGENT_CASSETTE_LATENCY': args.latency,
+        'AGENT_CASSETTE_STRICT': '1' if args.strict else '0'
+    })
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+    # Every repeat should do the same work, not be answered by the response cache
+    os.environ.setdefault('AGENT_CACHE_SIZE', '0')
+    sys.path.insert(0, ROOT)
+
+    import app
+    import collaboration
+    import persistence
+    from agents import base_agent
+    from agents.cassette import Cassette
+
+    interactions = app.BaseAgent.cassette.interactions()
+    if not interactions:
+        sys.exit(f"{args.cassette} has no recorded interactions")
+
+    timer = SectionTimer()
+    timer.wrap(base_agent.BaseAgent, '_assemble_prompt', 'prompt build')
+    timer.wrap(base_agent, 'scan_collaboration_markers', 'marker parsing')
+    timer.wrap(persistence.MessageWriter, '_commit', 'db writes')
+    timer.wrap(collaboration.CollaborationExecutor, 'run', 'collaboration loop')
+    timer.wrap(Cassette, 'replay', 'replayed llm calls')
+    client = app.app.test_client()
+
+    def send(data):
+        started = time.perf_counter()
+        response = client.post('/interact', json=data)
+        return response.status_code, time.perf_counter() - started
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    results = []
+    stats = []
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        # Each pass starts from empty conversations and an unplayed cassette
+        app.BaseAgent.memory_store.clear()
+        app.BaseAgent.cassette = Cassette(os.environ['AGENT_CASSETTE'], mode='replay',
+                                          latency=args.latency, strict=args.strict)
+        if profiler:
+            profiler.enable()
+        if args.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                results.extend(pool.map(send, interactions))
+        else:
+            results.extend(send(data) for data in interactions)
+        if profiler:
+            profiler.disable()
+        stats.append(app.BaseAgent.cassette.stats())
+    elapsed = time.perf_counter() - started
+    app.message_writer.close()
+
+    latencies = sorted(seconds * 1000 for status, seconds in results)
+    failed = [status for status, seconds in results if status != 200]
+    print(f"{len(results)} interaction(s) in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), "
+          f"{len(failed)} failed; latency p50 {statistics.median(latencies):.1f} ms, "
+          f"max {latencies[-1]:.1f} ms")
+    fallbacks = sum(s['fallbacks'] for s in stats)
+    print(f"LLM calls replayed: {sum(s['replayed'] for s in stats)}, "
+          f"by fallback: {fallbacks}, missing: {sum(s['misses'] for s in stats)}")
+    print(f"{'section':>20} {'calls':>8} {'total_ms':>10} {'mean_ms':>9}")
+    for label, seconds in sorted(timer.totals.items(), key=lambda item: -item[1]):
+        count = timer.counts[label]
+        print(f"{label:>20} {count:>8} {seconds * 1000:>10.1f} {seconds * 1000 / count:>9.3f}")
+    print("Sections are inclusive: the collaboration loop contains its agents' prompt builds and calls.")
+
+    if profiler:
+        profiler.dump_stats(args.cprofile)
+        print(f"Main thread profile written to {args.cprofile}")
+
+    if fallbacks and not args.allow_fallbacks:
+        sys.exit(f"{fallbacks} call(s) had prompts that were not recorded and were answered by fallback, "
+                 f"so this run did not repeat the recorded work; pass --allow-fallbacks to accept it")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup benchmark for the Flask app.
+
+Measures, in fresh interpreters, how long `import app` takes and how long
+the first /interact request takes after it. The agents are either built on
+first use (lazy, the default) or all up front as the app used to do
+(eager). Agent calls go to the local fake OpenAI server (fake_openai.py),
+so no API key or network is needed.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--agent TYPE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from fake_openai import FakeOpenAIServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+if sys.argv[1] == 'eager':
+    app.agents.warm_up()
+ready = time.perf_counter()
+response = app.app.test_client().post('/interact', json={
+    'message': 'Which tests cover the login flow?', 'agent': sys.argv[2], 'no_cache': True
+})
+answered = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - started) * 1000,
+    'warm_up_ms': (ready - imported) * 1000,
+    'first_request_ms': (answered - ready) * 1000,
+    'total_ms': (answered - started) * 1000
+}))
+"""
+
+
+def run_child(mode: str, agent: str, base_url: str) -> dict:
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, AGENT_WARM_UP='0')
+    env.setdefault('OPENAI_API_KEY', 'bench')
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, mode, agent], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per mode')
+    parser.add_argument('--agent', default='tester', help='agent answering the first request')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer().start()
+
+    columns = ('import_ms', 'warm_up_ms', 'first_request_ms', 'total_ms')
+    print(f"{'mode':>6} " + ' '.join(f'{column:>17}' for column in columns))
+    try:
+        for mode in ('eager', 'lazy'):
+            runs = [run_child(mode, args.agent, server.url) for _ in range(args.runs)]
+            failed = [run['status'] for run in runs if run['status'] != 200]
+            if failed:
+                print(f"{mode}: first request failed with status {failed[0]}")
+                continue
+            medians = [statistics.median(run[column] for run in runs) for column in columns]
+            print(f"{mode:>6} " + ' '.join(f'{value:>17.1f}' for value in medians))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""
+Local OpenAI-compatible chat completions server for offline load tests.
+
+Answers POST /v1/chat/completions, streamed or not, without an API key or
+network. Each reply waits for a latency drawn from a configurable
+distribution and has a random length. When the prompt asks for
+delegation markers, a reply can include some, so collaboration trees
+are exercised. A share of calls can fail with 500 or 429, or run slow.
+GET /stats reports the calls served.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:PORT/v1.
+
+Usage:
+    python benchmarks/fake_openai.py [--port 8001] [--latency lognormal:800:0.5]
+        [--model-latency gpt-3.5-turbo=lognormal:300:0.4] [--reply-words 60:250]
+        [--marker-rate 0.3] [--error-rate 0.01] [--rate-limit-rate 0.01]
+        [--slow-rate 0.02] [--seed 1]
+"""
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.markers import NEED_MARKER_AGENTS
+
+# Share of a streamed reply's latency spent before the first chunk
+FIRST_CHUNK_SHARE = 0.2
+
+# Words sent per chunk of a streamed reply
+WORDS_PER_CHUNK = 8
+
+SENTENCES = [
+    "We should split the work into small, reviewable increments.",
+    "The API contract needs to be agreed before the frontend work starts.",
+    "Automated tests must cover the login flow and the checkout flow.",
+    "Deploy to staging first and watch the error rate for a day.",
+    "The data model needs an index on the customer and order tables.",
+    "Document the rollout plan and share it with the stakeholders.",
+    "Accessibility checks belong in the definition of done.",
+    "Estimate the remaining stories and flag the risky ones early.",
+]
+
+MARKER_REQUESTS = [
+    "review the implementation plan",
+    "estimate the effort for this change",
+    "list the risks we should track",
+    "check the impact on the release",
+]
+
+
+class LatencyDistribution:
+    """
+    Reply latency in seconds, parsed from 'kind:ARGS' with milliseconds:
+    fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV or lognormal:MEDIAN:SIGMA.
+    """
+
+    KINDS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+
+    def __init__(self, spec: str):
+        kind, _, args = spec.partition(':')
+        try:
+            values = [float(value) for value in args.split(':')] if args else []
+        except ValueError:
+            values = []
+        if kind not in self.KINDS or len(values) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency '{spec}'; expected one of "
+                             "fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV, lognormal:MEDIAN:SIGMA")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            ms = self.values[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(*self.values)
+        elif self.kind == 'normal':
+            ms = rng.gauss(*self.values)
+        else:
+            median, sigma = self.values
+            ms = median * rng.lognormvariate(0, sigma)
+        return max(0.0, ms) / 1000
+
+
+class FakeOpenAIServer:
+    """
+    The fake server, run in a background thread or with serve_forever().
+
+    Random draws come from one seeded generator, so a run with the same
+    settings and the same call order gives the same replies.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0',
+                 model_latency: dict = None, reply_words: tuple = (60, 250),
+                 marker_rate: float = 0.0, max_markers: int = 2, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, slow_rate: float = 0.0, slow_factor: float = 10.0,
+                 seed: int = None):
+        """
+        Args:
+            host: Interface to listen on
+            port: Port to listen on; a free one when 0
+            latency: Default latency distribution (see LatencyDistribution)
+            model_latency: Latency distribution spec by model name
+            reply_words: (min, max) words per reply, capped by the request's max tokens
+            marker_rate: Share of replies that include delegation markers
+            max_markers: Most markers in one reply
+            error_rate: Share of calls answered with a 500 error
+            rate_limit_rate: Share of calls answered with a 429 error
+            slow_rate: Share of calls that take slow_factor times their latency
+            slow_factor: Latency multiplier for slow calls
+            seed: Random seed
+        """
+        self.latency = LatencyDistribution(latency)
+        self.model_latency = {model: LatencyDistribution(spec) for model, spec in (model_latency or {}).items()}
+        self.reply_words = reply_words
+        self.marker_rate = marker_rate
+        self.max_markers = max_markers
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._by_model = Counter()
+        self._thread = None
+
+        self.httpd = ThreadingHTTPServer((host, port), _FakeOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+
+    @property
+    def url(self) -> str:
+        """Base URL for OPENAI_BASE_URL."""
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self) -> 'FakeOpenAIServer':
+        """Serve in a daemon thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['by_model'] = dict(self._by_model)
+        for name in ('calls', 'completions', 'streamed', 'server_errors', 'rate_limited', 'slow', 'markers'):
+            stats.setdefault(name, 0)
+        return stats
+
+    def plan_reply(self, payload: dict) -> dict:
+        """Decide a call's outcome, latency and reply text."""
+        model = payload.get('model', 'gpt-4o')
+        with self._lock:
+            self._counters['calls'] += 1
+            self._by_model[model] += 1
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self._counters['server_errors'] += 1
+                return {'status': 500}
+            if roll < self.error_rate + self.rate_limit_rate:
+                self._counters['rate_limited'] += 1
+                return {'status': 429}
+
+            latency = self.model_latency.get(model, self.latency).sample(self._rng)
+            if self._rng.random() < self.slow_rate:
+                self._counters['slow'] += 1
+                latency *= self.slow_factor
+            text, markers = self._reply_text(payload)
+            self._counters['completions'] += 1
+            self._counters['markers'] += markers
+            if payload.get('stream'):
+                self._counters['streamed'] += 1
+        return {'status': 200, 'model': model, 'latency': latency, 'text': text}
+
+    def _reply_text(self, payload: dict) -> tuple:
+        """Reply text and its number of markers; call with the lock held."""
+        low, high = self.reply_words
+        limit = payload.get('max_completion_tokens') or payload.get('max_tokens')
+        words_wanted = self._rng.randint(low, high)
+        if limit:
+            # Roughly four tokens for every three words
+            words_wanted = max(1, min(words_wanted, int(limit) * 3 // 4))
+
+        words = []
+        while len(words) < words_wanted:
+            words.extend(self._rng.choice(SENTENCES).split())
+        words = words[:words_wanted]
+
+        markers = 0
+        prompt = ' '.join(str(message.get('content', '')) for message in payload.get('messages', []))
+        # Only prompts that explain the marker format get markers back
+        if '[NEED_' in prompt and self._rng.random() < self.marker_rate:
+            markers = self._rng.randint(1, self.max_markers)
+            for name in self._rng.sample(sorted(NEED_MARKER_AGENTS), markers):
+                marker = f'[NEED_{name}: {self._rng.choice(MARKER_REQUESTS)}]'
+                words.insert(self._rng.randint(0, len(words)), marker)
+        return ' '.join(words), markers
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server.fake.stats())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        reply = self.server.fake.plan_reply(payload)
+        if reply['status'] == 429:
+            self._send_json(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'requests',
+                                            'code': 'rate_limit_exceeded'}},
+                            headers={'Retry-After': '1'})
+        elif reply['status'] != 200:
+            self._send_json(reply['status'], {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+        elif payload.get('stream'):
+            self._stream(payload, reply)
+        else:
+            time.sleep(reply['latency'])
+            self._send_json(200, {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': reply['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': reply['text']}}],
+                'usage': _usage(payload, reply['text'])
+            })
+
+    def _stream(self, payload, reply):
+        words = reply['text'].split(' ')
+        pieces = [' '.join(words[i:i + WORDS_PER_CHUNK]) + ' ' for i in range(0, len(words), WORDS_PER_CHUNK)]
+        pieces[-1] = pieces[-1].rstrip()
+        first_wait = reply['latency'] * FIRST_CHUNK_SHARE
+        chunk_wait = (reply['latency'] - first_wait) / max(1, len(pieces) - 1)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(first_wait)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(chunk_wait)
+            delta = {'content': piece}
+            if index == 0:
+                delta['role'] = 'assistant'
+            self._send_event(_chunk(reply['model'], [{'index': 0, 'delta': delta, 'finish_reason': None}]))
+        self._send_event(_chunk(reply['model'], [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            self._send_event(_chunk(reply['model'], [], usage=_usage(payload, reply['text'])))
+        self._send_chunk(b'data: [DONE]\n\n')
+        self._send_chunk(b'')
+
+    def _send_event(self, data):
+        self._send_chunk(f'data: {json.dumps(data)}\n\n'.encode('utf-8'))
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _chunk(model, choices, usage=None):
+    chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+             'model': model, 'choices': choices}
+    if usage is not None:
+        chunk['usage'] = usage
+    return chunk
+
+
+def _usage(payload, text):
+    """Approximate token counts at four characters per token."""
+    prompt_tokens = sum(len(str(message.get('content', ''))) for message in payload.get('messages', [])) // 4
+    completion_tokens = len(text) // 4
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the fake server's settings to a command line parser."""
+    group = parser.add_argument_group('fake OpenAI server')
+    group.add_argument('--latency', default='lognormal:800:0.5',
+                       help='reply latency: fixed:MS, uniform:LOW:HIGH, normal:MEAN:SD or lognormal:MEDIAN:SIGMA')
+    group.add_argument('--model-latency', action='append', default=[], metavar='MODEL=LATENCY',
+                       help='latency for one model; repeatable')
+    group.add_argument('--reply-words', default='60:250', metavar='MIN:MAX', help='words per reply')
+    group.add_argument('--marker-rate', type=float, default=0.3,
+                       help='share of replies with [NEED_*] delegation markers')
+    group.add_argument('--max-markers', type=int, default=2, help='most markers in one reply')
+    group.add_argument('--error-rate', type=float, default=0.0, help='share of calls failing with 500')
+    group.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of calls failing with 429')
+    group.add_argument('--slow-rate', type=float, default=0.0, help='share of calls taking --slow-factor times longer')
+    group.add_argument('--slow-factor', type=float, default=10.0, help='latency multiplier for slow calls')
+    group.add_argument('--seed', type=int, default=None, help='random seed')
+
+
+def server_from_args(args: argparse.Namespace, host: str = '127.0.0.1', port: int = 0) -> FakeOpenAIServer:
+    """Build a FakeOpenAIServer from arguments added by add_arguments."""
+    low, _, high = args.reply_words.partition(':')
+    model_latency = dict(item.split('=', 1) for item in args.model_latency)
+    return FakeOpenAIServer(
+        host=host, port=port, latency=args.latency, model_latency=model_latency,
+        reply_words=(int(low), int(high or low)), marker_rate=args.marker_rate,
+        max_markers=args.max_markers, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor, seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8001, help='port to listen on')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.host, args.port)
+    print(f"Fake OpenAI server on {server.url} (OPENAI_BASE_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Load generator for /interact and /api/projects.
+
+Sends requests at a target rate, open loop: a request's latency is timed
+from when it was due, so time spent waiting for a free worker counts too.
+It reports p50/p95/p99 latency, throughput and status codes per endpoint.
+It also reads the fake OpenAI server's /stats to count the LLM calls
+each /interact request caused.
+
+With --spawn, the fake OpenAI server (see fake_openai.py) runs in this
+process and the app is started against it, so a whole run needs no API
+key or network:
+    python benchmarks/load_generator.py --spawn asgi --rps 20 --duration 30
+
+Against an app that is already running:
+    python benchmarks/load_generator.py --url http://127.0.0.1:5000 \
+        --fake-openai-url http://127.0.0.1:8001/v1 --rps 20 --duration 30
+"""
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from fake_openai import add_arguments, server_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = [
+    "Plan the next sprint for the checkout redesign.",
+    "Which tests cover the login flow?",
+    "How should we deploy the new payment service?",
+    "Write the acceptance criteria for order cancellation.",
+    "Review the API design for the reporting endpoints.",
+    "What are the risks of moving the database to a managed service?",
+    "Design the onboarding screens for new customers.",
+    "Estimate the work for adding single sign-on.",
+]
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+class LoadGenerator:
+    """Sends a mix of requests at a target rate and records the outcome of each."""
+
+    def __init__(self, url: str, rps: float, duration: float, mix: dict, agents: list,
+                 max_in_flight: int = 256, timeout: float = 120, arrival: str = 'poisson',
+                 sessions: int = 0, project: str = None, use_cache: bool = False, seed: int = None):
+        self.url = url.rstrip('/')
+        self.rps = rps
+        self.duration = duration
+        self.mix = mix
+        self.agents = agents
+        self.timeout = timeout
+        self.arrival = arrival
+        self.sessions = sessions
+        self.project = project
+        self.use_cache = use_cache
+        self.rng = random.Random(seed)
+        self.client = httpx.Client(timeout=timeout, limits=httpx.Limits(
+            max_connections=max_in_flight, max_keepalive_connections=max_in_flight))
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='load')
+        self.results = []
+        self._lock = threading.Lock()
+
+    def run(self) -> list:
+        """Send requests for the configured duration; returns (endpoint, status, latency, due) tuples."""
+        endpoints = list(self.mix)
+        weights = [self.mix[endpoint] for endpoint in endpoints]
+        start = time.perf_counter()
+        offset = 0.0
+        index = 0
+        while offset < self.duration:
+            endpoint = self.rng.choices(endpoints, weights)[0]
+            request = self._request(endpoint, index)
+            wait = start + offset - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self.pool.submit(self._send, endpoint, request, start + offset, offset)
+            index += 1
+            offset += self.rng.expovariate(self.rps) if self.arrival == 'poisson' else 1 / self.rps
+        self.pool.shutdown(wait=True)
+        self.client.close()
+        return self.results
+
+    def _request(self, endpoint: str, index: int) -> dict:
+        if endpoint == 'projects':
+            return {'method': 'GET', 'url': f'{self.url}/api/projects'}
+        data = {'message': self.rng.choice(MESSAGES), 'agent': self.rng.choice(self.agents)}
+        if not self.use_cache:
+            data['no_cache'] = True
+        if self.sessions:
+            data['session'] = f'load-{index % self.sessions}'
+        if self.project:
+            data['project'] = self.project
+        return {'method': 'POST', 'url': f'{self.url}/interact', 'json': data}
+
+    def _send(self, endpoint: str, request: dict, due: float, offset: float) -> None:
+        try:
+            status = self.client.request(**request).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latency = time.perf_counter() - due
+        with self._lock:
+            self.results.append((endpoint, status, latency, offset))
+
+
+def summarize(results: list, elapsed: float, warmup: float = 0.0) -> dict:
+    """Per-endpoint latency percentiles, throughput and status counts."""
+    by_endpoint = defaultdict(list)
+    for endpoint, status, latency, offset in results:
+        if offset >= warmup:
+            by_endpoint[endpoint].append((status, latency))
+
+    window = max(elapsed - warmup, 1e-9)
+    summary = {}
+    for endpoint, outcomes in sorted(by_endpoint.items()):
+        latencies = sorted(latency * 1000 for status, latency in outcomes if status == 200)
+        summary[endpoint] = {
+            'requests': len(outcomes),
+            'ok': len(latencies),
+            'statuses': dict(Counter(str(status) for status, latency in outcomes)),
+            'throughput_rps': round(len(latencies) / window, 2),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(latencies[-1], 1) if latencies else 0.0
+        }
+    return summary
+
+
+def llm_calls(before: dict, after: dict, interactions: int) -> dict:
+    """LLM calls made during the run, from two fake OpenAI /stats snapshots."""
+    calls = {name: after.get(name, 0) - before.get(name, 0)
+             for name in ('calls', 'completions', 'server_errors', 'rate_limited', 'slow', 'markers')}
+    calls['by_model'] = {model: count - before.get('by_model', {}).get(model, 0)
+                         for model, count in after.get('by_model', {}).items()}
+    calls['per_interaction'] = round(calls['calls'] / interactions, 2) if interactions else 0.0
+    return calls
+
+
+def fetch_stats(fake_openai_url: str) -> dict:
+    base = fake_openai_url.rstrip('/')
+    if base.endswith('/v1'):
+        base = base[:-len('/v1')]
+    return httpx.get(f'{base}/stats', timeout=10).json()
+
+
+def spawn_app(server: str, base_url: str) -> tuple:
+    """Start the app on a free port against the fake OpenAI server; returns (process, url)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                   '--host', '127.0.0.1', '--port', str(port), '--with-threads']
+    env = dict(os.environ, OPENAI_BASE_URL=base_url)
+    env.setdefault('OPENAI_API_KEY', 'load-test')
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode} before it was ready")
+        try:
+            httpx.get(f'{url}/api/metrics', timeout=2)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The app did not start within 60s")
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(','):
+        endpoint, _, weight = item.partition('=')
+        if endpoint not in ('interact', 'projects'):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{endpoint}'; use interact or projects")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def print_report(report: dict) -> None:
+    columns = ('requests', 'ok', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    print(f"{'endpoint':>10} " + ' '.join(f'{column:>14}' for column in columns) + '  statuses')
+    for endpoint, row in report['endpoints'].items():
+        print(f'{endpoint:>10} ' + ' '.join(f'{row[column]:>14}' for column in columns)
+              + '  ' + ', '.join(f'{status}: {count}' for status, count in sorted(row['statuses'].items())))
+    if 'llm_calls' in report:
+        calls = report['llm_calls']
+        print(f"LLM calls: {calls['calls']} ({calls['per_interaction']} per /interact request), "
+              f"{calls['server_errors']} injected 500s, {calls['rate_limited']} injected 429s, "
+              f"{calls['markers']} delegation markers")
+        print('By model: ' + ', '.join(f'{model}: {count}' for model, count in sorted(calls['by_model'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='app URL, unless --spawn is used')
+    parser.add_argument('--spawn', choices=('wsgi', 'asgi'),
+                        help='start the fake OpenAI server and the app (flask run or uvicorn asgi:application)')
+    parser.add_argument('--fake-openai-url', help='fake OpenAI server to read LLM call counts from')
+    parser.add_argument('--rps', type=float, default=10, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to send requests for')
+    parser.add_argument('--warmup', type=float, default=0, help='leading seconds left out of the report')
+    parser.add_argument('--arrival', choices=('poisson', 'constant'), default='poisson',
+                        help='gaps between requests')
+    parser.add_argument('--mix', type=parse_mix, default='interact=9,projects=1',
+                        help='endpoint weights, e.g. interact=9,projects=1')
+    parser.add_argument('--agents', default='pm,dev,tester,devops,ba,uxd',
+                        help='agents /interact requests are spread across')
+    parser.add_argument('--sessions', type=int, default=0,
+                        help='spread requests across this many conversation sessions; none when 0')
+    parser.add_argument('--project', help='project id sent with /interact requests')
+    parser.add_argument('--use-cache', action='store_true', help='let the response caches answer repeats')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='most requests open at once')
+    parser.add_argument('--timeout', type=float, default=120, help='per-request timeout in seconds')
+    parser.add_argument('--json', help='also write the report to this file')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake_server = app_process = None
+    url, fake_openai_url = args.url, args.fake_openai_url
+    try:
+        if args.spawn:
+            fake_server = server_from_args(args).start()
+            fake_openai_url = fake_server.url
+            app_process, url = spawn_app(args.spawn, fake_server.url)
+
+        before = fetch_stats(fake_openai_url) if fake_openai_url else None
+        generator = LoadGenerator(
+            url, args.rps, args.duration, args.mix, args.agents.split(','),
+            max_in_flight=args.max_in_flight, timeout=args.timeout, arrival=args.arrival,
+            sessions=args.sessions, project=args.project, use_cache=args.use_cache, seed=args.seed
+        )
+        started = time.perf_counter()
+        results = generator.run()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'settings': {name: value for name, value in vars(args).items() if name != 'json'},
+            'elapsed_s': round(elapsed, 2),
+            'endpoints': summarize(results, elapsed, args.warmup)
+        }
+        if before is not None:
+            interactions = sum(1 for endpoint, status, latency, offset in results if endpoint == 'interact')
+            report['llm_calls'] = llm_calls(before, fetch_stats(fake_openai_url), interactions)
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        if fake_server is not None:
+            fake_server.shutdown()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Optional SQLite file shared by worker processes, and how long followers wait for a leader
+DEFAULT_COALESCE_DB = os.environ.get('COALESCE_DB')
+DEFAULT_WAIT_TIMEOUT = float(os.environ.get('COALESCE_WAIT_TIMEOUT', 120))
+
+# How long a finished result stays readable by followers in other processes that were already waiting
+DEFAULT_RESULT_TTL = 5.0
+POLL_INTERVAL = 0.1
+
+
+class _Flight:
+    """A computation in progress in this process."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    Share one computation between concurrent identical requests.
+
+    The first request for a key becomes the leader and runs the computation;
+    requests arriving with the same key before it finishes wait for it and
+    receive the same result. Within a process this uses an in-memory table of
+    flights. When ``db_path`` is set, a SQLite lock table extends this to
+    every worker process on the host: followers in other processes poll the
+    leader's row until its JSON-encoded result appears. Only requests that
+    arrive while the leader is still running share its result; a request
+    arriving after it finished runs again.
+
+    A follower that waits longer than ``wait_timeout`` (or the timeout
+    given to run), or whose leader fails in another process, computes the
+    result itself.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_COALESCE_DB, wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+                 result_ttl: float = DEFAULT_RESULT_TTL):
+        """
+        Args:
+            db_path: Optional SQLite file for coalescing across processes
+            wait_timeout: Seconds a follower waits before computing on its own
+            result_ttl: Seconds a finished result stays visible to other processes
+        """
+        self.db_path = db_path
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owner = f"{os.getpid()}-{id(self)}"
+        self._counters = {'leaders': 0, 'coalesced': 0, 'coalesced_remote': 0, 'fallbacks': 0}
+
+        if self.db_path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS inflight_requests ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, started_at REAL NOT NULL, "
+                "result TEXT, finished_at REAL)"
+            )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the values that make two requests identical."""
+        payload = json.dumps(parts, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def run(self, key: str, compute, timeout: float = None) -> tuple:
+        """
+        Return the result of compute(), shared with concurrent callers of the same key.
+
+        Args:
+            key: Identity of the request, from make_key
+            compute: Callable producing the result; with db_path set it must
+                be JSON-serializable
+            timeout: Longest wait for a leader, when shorter than wait_timeout
+
+        Returns:
+            (result, shared): shared is True when another request computed it
+        """
+        wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(wait_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                self._count('coalesced')
+                return flight.result, True
+            logger.warning("Coalesced request timed out waiting for its leader; computing it again")
+            self._count('fallbacks')
+            return compute(), False
+
+        try:
+            flight.result, shared = self._lead(key, compute, wait_timeout)
+            return flight.result, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._flights)
+        stats['shared'] = bool(self.db_path)
+        return stats
+
+    def _lead(self, key: str, compute, wait_timeout: float) -> tuple:
+        """Compute as this process's leader, deferring to another process's leader if there is one."""
+        if not self.db_path:
+            self._count('leaders')
+            return compute(), False
+
+        arrived = time.time()
+        deadline = arrived + wait_timeout
+        while True:
+            try:
+                claimed, row = self._claim(key, arrived)
+            except sqlite3.Error as e:
+                logger.warning(f"Request coalescing table unavailable: {str(e)}")
+                self._count('leaders')
+                return compute(), False
+
+            if claimed:
+                break
+            if row and row[0] is not None:
+                self._count('coalesced_remote')
+                return json.loads(row[0]), True
+            if time.time() >= deadline:
+                logger.warning("Timed out waiting for another worker's identical request")
+                self._count('fallbacks')
+                return compute(), False
+            time.sleep(POLL_INTERVAL)
+
+        self._count('leaders')
+        try:
+            result = compute()
+        except BaseException:
+            self._release(key)
+            raise
+
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "UPDATE inflight_requests SET result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+                    (json.dumps(result), time.time(), key, self._owner)
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Failed to publish coalesced result: {str(e)}")
+            self._release(key)
+        return result, False
+
+    def _claim(self, key: str, arrived: float) -> tuple:
+        """
+        Try to become the leader for a key across processes.
+
+        A result that finished before this request arrived is not shared;
+        the request replaces it and runs as the new leader.
+
+        Returns:
+            (claimed, row): row is (result,) of the current leader when not claimed
+        """
+        now = time.time()
+        with self._connection() as connection:
+            # Forget finished results past their TTL and leaders that never finished
+            connection.execute(
+                "DELETE FROM inflight_requests WHERE finished_at < ? OR (finished_at IS NULL AND started_at < ?)",
+                (now - self.result_ttl, now - self.wait_timeout)
+            )
+            connection.execute(
+                "DELETE FROM inflight_requests WHERE key = ? AND finished_at < ?", (key, arrived)
+            )
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO inflight_requests (key, owner, started_at) VALUES (?, ?, ?)",
+                (key, self._owner, now)
+            ).rowcount
+            if inserted:
+                return True, None
+            row = connection.execute(
+                "SELECT result FROM inflight_requests WHERE key = ?", (key,)
+            ).fetchone()
+        return False, row
+
+    def _release(self, key: str) -> None:
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "DELETE FROM inflight_requests WHERE key = ? AND owner = ?", (key, self._owner)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to release coalescing lock: {str(e)}")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets several processes share the file."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
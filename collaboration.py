@@ -0,0 +1,499 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agents.markers import MarkerStreamParser
+from agents.deadline import DeadlineExceeded
+from agents.admission import AgentOverloadedError, AgentRateLimitError
+from planner import CollaborationPlan
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on simultaneous collaborator LLM calls across all requests
+DEFAULT_MAX_WORKERS = int(os.environ.get('COLLABORATION_MAX_WORKERS', 6))
+
+
+class CollaborationExecutor:
+    """
+    Run an agent collaboration tree breadth-first, one depth level at a time.
+
+    Every collaborator requested at the same depth is processed in parallel
+    on a bounded thread pool. Their nested collaboration needs are merged into
+    the next level once the whole level has finished, so agent deduplication
+    and result order stay the same as a sequential breadth-first walk. A
+    CollaborationPlan merges requests from several parents to the same agent
+    and keeps the tree within its depth, agent-count and token budgets.
+    arun() walks the tree the same way with the agents' coroutine API.
+    """
+
+    def __init__(self, agents: dict, max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        Args:
+            agents: Mapping of agent type to (agent, display name)
+            max_workers: Maximum number of concurrent collaborator calls
+        """
+        self.agents = agents
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, max_workers),
+            thread_name_prefix='collaboration'
+        )
+
+    def new_plan(self, agent_type: str, result: dict = None) -> CollaborationPlan:
+        """
+        Start the plan of a request whose primary agent replied with result.
+
+        Without a result the plan is created before the reply, for an
+        EarlyDispatcher; record_primary() is then called once it arrives.
+        """
+        plan = CollaborationPlan()
+        if result is not None:
+            plan.record_primary(self.agents[agent_type][0], result)
+        return plan
+
+    def run(self, message: str, agent_type: str, result: dict,
+            display_name: str, project_context: dict = None, ordered: bool = True,
+            prefetched: dict = None, request_options: dict = None,
+            plan: CollaborationPlan = None):
+        """
+        Process the collaborators requested by the primary agent.
+
+        Args:
+            message: The original user message
+            agent_type: Type of the primary agent
+            result: The primary agent's process_input result
+            display_name: Display name of the primary agent
+            project_context: Optional project context dictionary
+            ordered: Yield a level's results in request order; when False they
+                are yielded as soon as each call completes
+            prefetched: Collaborator calls started by an EarlyDispatcher,
+                reused for the first level when their requests match
+            request_options: Per-request settings added to every collaborator's
+                context, such as 'session' or 'no_cache'
+            plan: CollaborationPlan that admits each level's calls and records
+                what ran; one from new_plan() is used when omitted
+
+        Yields:
+            dict with parent_type, agent_type, display_name, result and
+            latency (seconds) for every successful collaborator. Collaborators
+            that the plan's limits or the 'deadline' in request_options left
+            out are yielded with skipped=True, a reason and no result.
+        """
+        if plan is None:
+            plan = self.new_plan(agent_type, result)
+
+        collaboration_context = {agent_type: self._context_entry(result, display_name)}
+        level = [(agent_type, collab_type) for collab_type in result.get('needs_collaboration', [])]
+        used_agents = {agent_type}
+        prefetched = dict(prefetched or {})
+        deadline = (request_options or {}).get('deadline')
+        depth = 1
+
+        try:
+            while level:
+                # Every collaborator in a level sees the same snapshot of earlier responses
+                previous_responses = {
+                    known_type: info['response']
+                    for known_type, info in collaboration_context.items()
+                }
+
+                # Early calls were admitted on a partial reply; the first wave is planned on the full one
+                plan.release_early()
+                calls, rejected = plan.plan_wave(
+                    self._schedule_level(level, used_agents, plan, depth), depth, used_agents,
+                    {known_type: info.get('requests', {}) for known_type, info in collaboration_context.items()},
+                    previous_responses, message
+                )
+                for call in rejected:
+                    used_agents.add(call.agent_type)
+                    early = prefetched.pop(call.agent_type, None)
+                    if early:
+                        early[1].cancel()
+                    yield self._skipped(call)
+                if not calls:
+                    break
+
+                futures = {}
+                adopted = {}
+                for call in plan.submission_order(calls):
+                    early = prefetched.pop(call.agent_type, None)
+                    if early and early[0] == call.requests:
+                        futures[call.agent_type] = early[1]
+                        adopted[early[1]] = early[2]
+                        continue
+                    if early:
+                        early[1].cancel()
+
+                    if deadline is not None and deadline.expired:
+                        continue
+
+                    collab_context = self._build_context(
+                        previous_responses,
+                        {call.agent_type: call.requests},
+                        call.agent_type,
+                        project_context,
+                        request_options
+                    )
+                    futures[call.agent_type] = self._pool.submit(
+                        self._timed_call, call.agent, message, collab_context
+                    )
+
+                # Collaborators the deadline left no time for
+                for call in calls:
+                    if call.agent_type not in futures:
+                        used_agents.add(call.agent_type)
+                        plan.fail(call, 'skipped', 'deadline')
+                        yield self._skipped(call)
+
+                calls_by_future = {futures[call.agent_type]: call for call in calls if call.agent_type in futures}
+                completed = {}
+                pending = list(calls_by_future) if ordered else as_completed(calls_by_future)
+                for future in pending:
+                    call = calls_by_future[future]
+                    outcome = future.result
+                    if future in adopted:
+                        outcome = functools.partial(self._adopt, call.agent, message, future, adopted[future])
+                    event = self._settle(call, outcome, plan, used_agents, completed, deadline)
+                    if event:
+                        yield event
+
+                level = self._merge_level(calls, completed, used_agents, collaboration_context)
+                depth += 1
+
+                # Early calls the final parse did not ask for are not used
+                self.discard(prefetched)
+                prefetched.clear()
+        finally:
+            # Early calls nobody used are dropped; their turns never reached memory
+            self.discard(prefetched)
+
+    @staticmethod
+    def discard(prefetched: dict) -> None:
+        """Drop early calls that will not be used; calls already running finish without touching memory."""
+        for early in prefetched.values():
+            early[1].cancel()
+
+    @staticmethod
+    def _adopt(agent, message: str, future, context: dict) -> tuple:
+        """Result of a used early call, with its turn committed to the collaborator's memory."""
+        result, latency = future.result()
+        return agent.adopt_turn(message, result, context), latency
+
+    async def arun(self, message: str, agent_type: str, result: dict,
+                   display_name: str, project_context: dict = None, ordered: bool = True,
+                   request_options: dict = None, plan: CollaborationPlan = None):
+        """
+        run() for coroutines: collaborators are aprocess_input calls on the running event loop.
+
+        Yields the same events as run(). Calls are bounded by the agents'
+        admission controller instead of the thread pool, and there is no
+        early dispatch.
+        """
+        if plan is None:
+            plan = self.new_plan(agent_type, result)
+
+        collaboration_context = {agent_type: self._context_entry(result, display_name)}
+        level = [(agent_type, collab_type) for collab_type in result.get('needs_collaboration', [])]
+        used_agents = {agent_type}
+        deadline = (request_options or {}).get('deadline')
+        depth = 1
+        tasks = {}
+
+        try:
+            while level:
+                previous_responses = {
+                    known_type: info['response']
+                    for known_type, info in collaboration_context.items()
+                }
+
+                calls, rejected = plan.plan_wave(
+                    self._schedule_level(level, used_agents, plan, depth), depth, used_agents,
+                    {known_type: info.get('requests', {}) for known_type, info in collaboration_context.items()},
+                    previous_responses, message
+                )
+                for call in rejected:
+                    used_agents.add(call.agent_type)
+                    yield self._skipped(call)
+                if not calls:
+                    break
+
+                tasks = {}
+                for call in plan.submission_order(calls):
+                    if deadline is not None and deadline.expired:
+                        continue
+                    collab_context = self._build_context(
+                        previous_responses,
+                        {call.agent_type: call.requests},
+                        call.agent_type,
+                        project_context,
+                        request_options
+                    )
+                    tasks[call.agent_type] = asyncio.ensure_future(
+                        self._atimed_call(call.agent, message, collab_context)
+                    )
+
+                for call in calls:
+                    if call.agent_type not in tasks:
+                        used_agents.add(call.agent_type)
+                        plan.fail(call, 'skipped', 'deadline')
+                        yield self._skipped(call)
+
+                calls_by_task = {tasks[call.agent_type]: call for call in calls if call.agent_type in tasks}
+                completed = {}
+                if ordered:
+                    for task in calls_by_task:
+                        await asyncio.wait([task])
+                        event = self._settle(calls_by_task[task], task.result, plan, used_agents, completed, deadline)
+                        if event:
+                            yield event
+                else:
+                    pending = set(calls_by_task)
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            event = self._settle(
+                                calls_by_task[task], task.result, plan, used_agents, completed, deadline
+                            )
+                            if event:
+                                yield event
+
+                level = self._merge_level(calls, completed, used_agents, collaboration_context)
+                depth += 1
+        finally:
+            # Calls still running when the walk stops early (a disconnected client, an error) are cancelled
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    def _settle(self, call, outcome, plan: CollaborationPlan, used_agents: set, completed: dict, deadline) -> dict:
+        """
+        Record a finished collaborator call in the plan.
+
+        Args:
+            call: The PlannedCall
+            outcome: Callable returning the call's (result, latency) or raising its error
+            plan: The request's CollaborationPlan
+            used_agents: Agents that already ran or were ruled out
+            completed: Results of the level so far, by agent type
+            deadline: The request's Deadline, if any
+
+        Returns:
+            The event to yield, or None when the call failed
+        """
+        try:
+            collab_result, latency = outcome()
+        except Exception as e:
+            # Calls cut short by the deadline or refused for capacity or quota are skipped, not failed
+            if isinstance(e, DeadlineExceeded) or (deadline is not None and deadline.expired):
+                used_agents.add(call.agent_type)
+                plan.fail(call, 'skipped', 'deadline')
+                return self._skipped(call)
+            if isinstance(e, (AgentOverloadedError, AgentRateLimitError)):
+                used_agents.add(call.agent_type)
+                plan.fail(call, 'skipped', 'overloaded' if isinstance(e, AgentOverloadedError) else 'rate_limited')
+                return self._skipped(call)
+            plan.fail(call, 'failed', str(e))
+            logger.warning(f"Collaboration with {call.agent_type} agent failed: {str(e)}")
+            return None
+
+        plan.complete(call, collab_result, latency)
+        completed[call.agent_type] = collab_result
+        return {
+            'parent_type': call.parent_type,
+            'agent_type': call.agent_type,
+            'display_name': call.display_name,
+            'result': collab_result,
+            'latency': latency
+        }
+
+    def _merge_level(self, calls: list, completed: dict, used_agents: set, collaboration_context: dict) -> list:
+        """Merge a finished level in request order and return the next one, so the walk is deterministic."""
+        next_level = []
+        for call in calls:
+            collab_result = completed.get(call.agent_type)
+            if collab_result is None:
+                continue
+
+            used_agents.add(call.agent_type)
+            collaboration_context[call.agent_type] = self._context_entry(collab_result, call.display_name)
+
+            # Nested collaboration joins the next level
+            for nested_type in collab_result.get('needs_collaboration', []):
+                if nested_type not in used_agents:
+                    next_level.append((call.agent_type, nested_type))
+        return next_level
+
+    @staticmethod
+    def _context_entry(result: dict, display_name: str) -> dict:
+        return {
+            'response': result['response'],
+            'display_name': display_name,
+            'requests': result.get('collaboration_requests', {}),
+            'context_summary': result.get('context_summary')
+        }
+
+    @staticmethod
+    def _skipped(call) -> dict:
+        logger.info(f"Skipped {call.agent_type} agent: {call.reason}")
+        return {
+            'parent_type': call.parent_type,
+            'agent_type': call.agent_type,
+            'display_name': call.display_name,
+            'skipped': True,
+            'reason': call.reason
+        }
+
+    @staticmethod
+    def _timed_call(agent, message: str, context: dict) -> tuple:
+        """Call an agent and measure how long the call took."""
+        started = time.perf_counter()
+        result = agent.process_input(message, context)
+        return result, time.perf_counter() - started
+
+    @staticmethod
+    async def _atimed_call(agent, message: str, context: dict) -> tuple:
+        """Await an agent call and measure how long it took."""
+        started = time.perf_counter()
+        result = await agent.aprocess_input(message, context)
+        return result, time.perf_counter() - started
+
+    def _schedule_level(self, level: list, used_agents: set, plan: CollaborationPlan, depth: int) -> list:
+        """
+        Resolve a level's requests to agents, dropping unknown and already used ones.
+
+        Agents that cannot be built are recorded in the plan as failed calls,
+        and the rest of the tree runs without them.
+        """
+        scheduled = []
+        unavailable = {}
+        for parent_type, collab_type in level:
+            if collab_type in used_agents:
+                continue
+
+            if collab_type in unavailable:
+                plan.record_unavailable(parent_type, collab_type, depth, unavailable[collab_type])
+                continue
+            try:
+                collab_agent, collab_display_name = self.agents.get(collab_type, (None, None))
+            except Exception as e:
+                unavailable[collab_type] = str(e)
+                plan.record_unavailable(parent_type, collab_type, depth, str(e))
+                logger.warning(f"Collaboration with {collab_type} agent failed: {str(e)}")
+                continue
+            if not collab_agent:
+                continue
+
+            scheduled.append((parent_type, collab_type, collab_agent, collab_display_name))
+        return scheduled
+
+    @staticmethod
+    def _build_context(previous_responses: dict, parent_requests: dict,
+                       collab_type: str, project_context: dict = None,
+                       request_options: dict = None) -> dict:
+        """Prepare the context passed to a collaborator."""
+        collab_context = {'previous_responses': dict(previous_responses)}
+
+        if project_context:
+            collab_context['project'] = project_context
+
+        if request_options:
+            collab_context.update(request_options)
+
+        if collab_type in parent_requests:
+            collab_context['requests'] = parent_requests[collab_type]
+
+        return collab_context
+
+
+class EarlyDispatcher:
+    """
+    Start collaborators while the parent agent is still streaming.
+
+    Tokens from the parent are fed to a MarkerStreamParser. As soon as a
+    [NEED_X: ...] marker is closed, that collaborator's call is submitted with
+    the parent's response so far and the marker's request. The resulting
+    futures are passed to CollaborationExecutor.run as ``prefetched``; a call
+    is only used when its request list matches the post-hoc parse of the full
+    response, otherwise the collaborator is run again as usual. Early calls
+    are speculative: their turns only reach the collaborator's memory once
+    run() uses them. discard() drops the calls when run() never gets them.
+
+    Each call is first admitted by the request's CollaborationPlan, so early
+    dispatch stays within the same limits as the rest of the tree; run()
+    cancels early calls that the plan refuses once the reply is complete.
+    """
+
+    def __init__(self, executor: CollaborationExecutor, message: str,
+                 parent_type: str, project_context: dict = None, request_options: dict = None,
+                 plan: CollaborationPlan = None):
+        """
+        Args:
+            executor: The executor whose pool runs early calls
+            message: The original user message
+            parent_type: Type of the streaming parent agent
+            project_context: Optional project context dictionary
+            request_options: Per-request settings added to every call's context
+            plan: The CollaborationPlan later passed to run(); a new one when omitted
+        """
+        self.executor = executor
+        self.message = message
+        self.parent_type = parent_type
+        self.project_context = project_context
+        self.request_options = request_options
+        self.plan = plan if plan is not None else executor.new_plan(parent_type)
+        self.dispatched = {}
+        self._parser = MarkerStreamParser(exclude=parent_type)
+        self._chunks = []
+
+    def feed(self, token: str) -> list:
+        """
+        Add a parent token and dispatch any collaborators it requests.
+
+        Returns:
+            List of agent types dispatched by this token
+        """
+        self._chunks.append(token)
+        started = []
+        for collab_type, collab_request in self._parser.feed(token):
+            if collab_type in self.dispatched:
+                # The early call only saw the first request, so it is stale
+                self.dispatched[collab_type] = (None,) + self.dispatched[collab_type][1:]
+                continue
+
+            try:
+                collab_agent, collab_display_name = self.executor.agents.get(collab_type, (None, None))
+            except Exception as e:
+                # run() records the failure in the plan when it schedules the level
+                logger.warning(f"Could not dispatch {collab_type} agent early: {str(e)}")
+                continue
+            if not collab_agent:
+                continue
+
+            requests = [collab_request]
+            previous_responses = {self.parent_type: ''.join(self._chunks)}
+            if not self.plan.admit_early(collab_type, collab_display_name, collab_agent, requests,
+                                         previous_responses, self.message):
+                continue
+
+            collab_context = self.executor._build_context(
+                previous_responses,
+                {collab_type: requests},
+                collab_type,
+                self.project_context,
+                self.request_options
+            )
+            collab_context['speculative'] = True
+            future = self.executor._pool.submit(
+                self.executor._timed_call, collab_agent, self.message, collab_context
+            )
+            self.dispatched[collab_type] = (requests, future, collab_context)
+            started.append(collab_type)
+            logger.info(f"Dispatched {collab_type} agent while {self.parent_type} is streaming")
+        return started
+
+    def discard(self) -> None:
+        """Drop every early call not taken by run(), e.g. when the parent failed or asked for nobody."""
+        self.executor.discard(self.dispatched)
+        self.dispatched = {}
+        self.plan.release_early()
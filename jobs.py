@@ -0,0 +1,155 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+from agents.markers import scan_collaboration_markers
+
+logger = logging.getLogger(__name__)
+
+# Interactions run at once in the background, and how many may wait for a worker
+DEFAULT_JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+DEFAULT_MAX_QUEUED_JOBS = int(os.environ.get('JOB_MAX_QUEUED', 100))
+
+
+class InteractionJob(db.Model):
+    """Progress and partial results of an interaction run in the background."""
+    __tablename__ = 'interaction_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    project_id = db.Column(db.String(64))
+    agent_type = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    events = db.Column(db.Text, nullable=False, default='[]')
+    pending = db.Column(db.Text, nullable=False, default='[]')
+    skipped = db.Column(db.Text, nullable=False, default='[]')
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        events = json.loads(self.events)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'project_id': self.project_id,
+            'agent_type': self.agent_type,
+            'done': [event['agent_type'] for event in events],
+            'pending': json.loads(self.pending),
+            'skipped': json.loads(self.skipped),
+            'responses': events,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class JobQueueFull(Exception):
+    """Raised when no more background jobs can be accepted."""
+
+
+class JobManager:
+    """
+    Run interactions on a bounded worker pool and record their progress.
+
+    Every job's state lives in the interaction_jobs table and is updated
+    after each agent replies or is skipped, so any worker process can report
+    on any job. Jobs still running when their process exits are left in
+    'running'.
+    """
+
+    def __init__(self, app, run_events, max_workers: int = DEFAULT_JOB_WORKERS,
+                 max_queued: int = DEFAULT_MAX_QUEUED_JOBS):
+        """
+        Args:
+            app: Flask application whose context the workers use
+            run_events: Callable(message, agent_type, project_id, request_options)
+                yielding (event name, payload) pairs, like _interaction_events
+            max_workers: Maximum number of interactions running at once
+            max_queued: Maximum number of accepted jobs not yet finished
+        """
+        self.app = app
+        self.run_events = run_events
+        self.max_queued = max_queued
+        self._active = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='interaction-job')
+
+    def submit(self, message: str, agent_type: str, project_id=None, request_options: dict = None) -> str:
+        """
+        Record a new job and queue it.
+
+        Returns:
+            The job id
+
+        Raises:
+            JobQueueFull: when max_queued jobs are already waiting or running
+        """
+        with self._lock:
+            if self._active >= self.max_queued:
+                raise JobQueueFull(f"{self._active} interaction jobs are already queued")
+            self._active += 1
+
+        try:
+            job = InteractionJob(
+                id=uuid.uuid4().hex, project_id=project_id, agent_type=agent_type, message=message
+            )
+            db.session.add(job)
+            db.session.commit()
+            self._pool.submit(self._run, job.id, message, agent_type, project_id, request_options or {})
+            return job.id
+        except Exception:
+            with self._lock:
+                self._active -= 1
+            raise
+
+    def get(self, job_id: str):
+        """Return a job's state as a dict, or None if it does not exist."""
+        job = db.session.get(InteractionJob, job_id)
+        return job.to_dict() if job else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'active': self._active, 'max_queued': self.max_queued}
+
+    def _run(self, job_id: str, message: str, agent_type: str, project_id, request_options: dict) -> None:
+        with self.app.app_context():
+            try:
+                self._update(job_id, status='running')
+                events, skipped, requested = [], [], set()
+                for name, event in self.run_events(message, agent_type, project_id, request_options):
+                    if name == 'agent':
+                        events.append(event)
+                        needed, _ = scan_collaboration_markers(event['response'], exclude=event['agent_type'])
+                        requested.update(needed)
+                    elif name == 'skipped':
+                        # Left out by the deadline or the plan's limits: no reply is coming
+                        skipped.append({'agent_type': event['agent_type'], 'reason': event['reason']})
+                    else:
+                        continue
+                    finished = {item['agent_type'] for item in events + skipped}
+                    self._update(
+                        job_id, events=json.dumps(events), skipped=json.dumps(skipped),
+                        pending=json.dumps(sorted(requested - finished))
+                    )
+                self._update(job_id, status='completed', pending='[]')
+            except Exception as e:
+                logger.error(f"Interaction job {job_id} failed: {str(e)}")
+                db.session.rollback()
+                try:
+                    self._update(job_id, status='failed', error=str(e))
+                except Exception as update_error:
+                    logger.error(f"Failed to record failure of job {job_id}: {str(update_error)}")
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._active -= 1
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields['updated_at'] = datetime.utcnow()
+        db.session.query(InteractionJob).filter_by(id=job_id).update(fields)
+        db.session.commit()
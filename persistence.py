@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import atexit
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from database import db, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Hand rows to a background writer instead of committing at the end of each request
+DEFAULT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND') == '1'
+
+# Largest batch committed by the background writer and how long it waits to fill one
+DEFAULT_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BATCH_SIZE', 200))
+DEFAULT_FLUSH_INTERVAL = float(os.environ.get('CHAT_WRITE_FLUSH_INTERVAL', 0.5))
+
+PendingMessage = namedtuple(
+    'PendingMessage',
+    ['sequence', 'agent_type', 'message_type', 'content', 'context_summary', 'offset']
+)
+
+
+class InteractionLog:
+    """
+    Chat messages produced by one interaction, kept until it finishes.
+
+    Each message records its position and its offset in seconds from the
+    start of the interaction, so rows are inserted in the order the
+    conversation happened and slow steps can be traced in the logs. Rows
+    carry the interaction's session, which agent memory is rehydrated by.
+    """
+
+    def __init__(self, project_id, session: str = None):
+        self.project_id = project_id
+        self.session = session
+        self.started = time.perf_counter()
+        self.entries = []
+
+    def add(self, agent_type: str, message_type: str, content: str, context_summary: str = None) -> None:
+        self.entries.append(PendingMessage(
+            len(self.entries), agent_type, message_type, content, context_summary,
+            time.perf_counter() - self.started
+        ))
+
+    def rows(self) -> list:
+        """Build ChatMessage rows in the order the messages were recorded."""
+        return [
+            ChatMessage(
+                project_id=self.project_id,
+                session_id=self.session,
+                agent_type=entry.agent_type,
+                message_type=entry.message_type,
+                content=entry.content,
+                context_summary=entry.context_summary
+            )
+            for entry in self.entries
+        ]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class MessageWriter:
+    """
+    Persist interaction logs with one bulk insert and one commit each.
+
+    In write-behind mode logs are queued to a background thread that commits
+    several of them together, so requests never wait on the database for
+    their chat history. Rows still queued at shutdown are flushed by an
+    atexit hook.
+    """
+
+    def __init__(self, app, write_behind: bool = DEFAULT_WRITE_BEHIND,
+                 batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        """
+        Args:
+            app: Flask application whose context the background writer uses
+            write_behind: Commit on a background thread instead of the request
+            batch_size: Maximum number of rows per background commit
+            flush_interval: Seconds the background writer waits for more logs
+        """
+        self.app = app
+        self.write_behind = write_behind
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {'commits': 0, 'rows': 0, 'failed_rows': 0}
+        self._queue = None
+
+        if self.write_behind:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def write(self, log: InteractionLog) -> None:
+        """Persist a finished interaction's messages."""
+        if not log.entries:
+            return
+        if self.write_behind:
+            self._queue.put(log)
+        else:
+            self._commit([log])
+
+    async def awrite(self, log: InteractionLog) -> None:
+        """write() for coroutines: the commit runs on a worker thread with its own app context."""
+        if not log.entries:
+            return
+        if self.write_behind:
+            self._queue.put(log)
+        else:
+            await asyncio.to_thread(self._commit_in_app_context, [log])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats['rows_per_commit'] = round(stats['rows'] / stats['commits'], 2) if stats['commits'] else 0.0
+        stats['write_behind'] = self.write_behind
+        stats['queued'] = self._queue.qsize() if self._queue else 0
+        return stats
+
+    def close(self) -> None:
+        """Stop the background writer after flushing everything queued."""
+        if self._queue is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _commit(self, logs: list) -> None:
+        rows = [row for log in logs for row in log.rows()]
+        started = time.perf_counter()
+        try:
+            db.session.add_all(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._counters['failed_rows'] += len(rows)
+            raise
+
+        with self._lock:
+            self._counters['commits'] += 1
+            self._counters['rows'] += len(rows)
+        logger.debug(
+            f"Persisted {len(rows)} chat message(s) from {len(logs)} interaction(s) "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms; "
+            f"offsets: {[round(entry.offset, 3) for log in logs for entry in log.entries]}"
+        )
+
+    def _commit_in_app_context(self, logs: list) -> None:
+        with self.app.app_context():
+            self._commit(logs)
+
+    def _run(self) -> None:
+        """Background loop committing queued logs in batches."""
+        stopping = False
+        while not stopping:
+            log = self._queue.get()
+            if log is None:
+                break
+            batch, size = [log], len(log)
+
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.batch_size:
+                try:
+                    log = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if log is None:
+                    stopping = True
+                    break
+                batch.append(log)
+                size += len(log)
+
+            with self.app.app_context():
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    logger.error(f"Failed to persist {size} chat message(s): {str(e)}")
@@ -0,0 +1,271 @@
+import os
+import logging
+from agents.prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Limits on one request's collaboration tree; a cost budget of 0 means no cost limit
+DEFAULT_MAX_DEPTH = int(os.environ.get('COLLABORATION_MAX_DEPTH', 3))
+DEFAULT_MAX_AGENTS = int(os.environ.get('COLLABORATION_MAX_AGENTS', 6))
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('COLLABORATION_TOKEN_BUDGET', 60000))
+DEFAULT_COST_BUDGET = float(os.environ.get('COLLABORATION_COST_BUDGET', 0))
+
+# Completion length assumed for a collaborator before it has replied
+DEFAULT_EXPECTED_OUTPUT_TOKENS = int(os.environ.get('COLLABORATION_EXPECTED_OUTPUT_TOKENS', 500))
+
+# Fixed part of every prompt: the user input line and the [NEED_X] instructions
+PROMPT_OVERHEAD_TOKENS = 120
+
+
+def estimate_cost(model_info: dict, prompt_tokens: int, output_tokens: int) -> float:
+    """Dollar cost of a call from a SUPPORTED_MODELS entry's per-1k token prices."""
+    return (prompt_tokens * model_info.get('input_cost_per_1k', 0.0)
+            + output_tokens * model_info.get('output_cost_per_1k', 0.0)) / 1000
+
+
+class PlannedCall:
+    """One collaborator in a plan: who asked for it, what, and what it cost."""
+
+    def __init__(self, agent_type: str, display_name: str, agent, depth: int):
+        self.agent_type = agent_type
+        self.display_name = display_name
+        self.agent = agent
+        self.depth = depth
+        self.parents = []
+        self.requests = []
+        self.status = 'planned'
+        self.reason = None
+        self.wave = None
+        self.estimated_tokens = 0
+        self.tokens = None
+        self.latency = None
+
+    @property
+    def parent_type(self) -> str:
+        return self.parents[0]
+
+    def add_requests(self, parent_type: str, requests: list) -> None:
+        """Merge a parent's requests, skipping ones another parent already made."""
+        if parent_type not in self.parents:
+            self.parents.append(parent_type)
+        for request in requests or []:
+            if request not in self.requests:
+                self.requests.append(request)
+
+    def to_dict(self) -> dict:
+        return {
+            'agent_type': self.agent_type,
+            'parents': list(self.parents),
+            'depth': self.depth,
+            'wave': self.wave,
+            'requests': list(self.requests),
+            'status': self.status,
+            'reason': self.reason,
+            'estimated_tokens': self.estimated_tokens,
+            'tokens': self.tokens,
+            'latency_ms': round(self.latency * 1000) if self.latency is not None else None
+        }
+
+
+class CollaborationPlan:
+    """
+    Delegation DAG of one request, built wave by wave as agents reply.
+
+    Requests from different parents to the same agent are merged into one
+    call. A wave holds every call whose parents have all replied, so the
+    whole wave runs in parallel. Calls are admitted while the tree stays
+    within its depth, agent-count, token and cost limits; the others are
+    kept in the plan with the limit that stopped them.
+    """
+
+    def __init__(self, max_depth: int = DEFAULT_MAX_DEPTH, max_agents: int = DEFAULT_MAX_AGENTS,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, cost_budget: float = DEFAULT_COST_BUDGET,
+                 expected_output_tokens: int = DEFAULT_EXPECTED_OUTPUT_TOKENS):
+        """
+        Args:
+            max_depth: Deepest collaboration level run; the primary agent is 0
+            max_agents: Most collaborators run for one request
+            token_budget: Estimated prompt plus completion tokens for the whole
+                request, the primary agent's included
+            cost_budget: Estimated dollars for the whole request; 0 disables it
+            expected_output_tokens: Completion length assumed for a collaborator
+        """
+        self.max_depth = max_depth
+        self.max_agents = max_agents
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.expected_output_tokens = expected_output_tokens
+        self.calls = {}
+        self.waves = []
+        self.tokens = 0
+        self.cost = 0.0
+        # Calls started while the primary agent streams, holding their estimate until the first wave
+        self.early = {}
+
+    def record_primary(self, agent, result: dict) -> None:
+        """Charge the primary agent's call to the budget."""
+        self._charge(agent, result)
+
+    def admit_early(self, agent_type: str, display_name: str, agent, requests: list,
+                    previous_responses: dict, message: str) -> bool:
+        """
+        Check a collaborator dispatched before the primary agent finished against the limits.
+
+        An admitted call's estimate is reserved until release_early(); the
+        first wave is then planned as usual and may still refuse it.
+
+        Returns:
+            True when the call may start
+        """
+        call = PlannedCall(agent_type, display_name, agent, 1)
+        call.requests = list(requests)
+        call.estimated_tokens = self._estimate(call, count_tokens(message) + sum(
+            count_tokens(response) for response in previous_responses.values()
+        ))
+        reason = self._limit_reached(call)
+        if reason:
+            logger.info(f"Planner refused early {agent_type} call: {reason}")
+            return False
+
+        self.tokens += call.estimated_tokens
+        self.cost += self._estimated_cost(call)
+        self.early[agent_type] = call
+        return True
+
+    def release_early(self) -> None:
+        """Return the reservations of early calls, before the first wave decides which of them to keep."""
+        for call in self.early.values():
+            self.tokens -= call.estimated_tokens
+            self.cost -= self._estimated_cost(call)
+        self.early = {}
+
+    def plan_wave(self, level: list, depth: int, used_agents: set, requests_by_parent: dict,
+                  previous_responses: dict, message: str) -> tuple:
+        """
+        Turn the requests made by the last wave into the next one.
+
+        Args:
+            level: (parent_type, collab_type, agent, display_name) in request order
+            depth: Depth of the agents in this wave
+            used_agents: Agents that already ran or were ruled out
+            requests_by_parent: Each parent's collaboration_requests
+            previous_responses: Responses the wave's prompts will include
+            message: The original user message
+
+        Returns:
+            (admitted, rejected): PlannedCalls in request order
+        """
+        wave = {}
+        for parent_type, collab_type, agent, display_name in level:
+            if collab_type in used_agents:
+                continue
+            call = wave.get(collab_type)
+            if call is None:
+                call = wave[collab_type] = PlannedCall(collab_type, display_name, agent, depth)
+            call.add_requests(parent_type, requests_by_parent.get(parent_type, {}).get(collab_type))
+
+        admitted, rejected = [], []
+        context_tokens = count_tokens(message) + sum(
+            count_tokens(response) for response in previous_responses.values()
+        )
+        for call in wave.values():
+            self.calls[call.agent_type] = call
+            call.estimated_tokens = self._estimate(call, context_tokens)
+            reason = self._limit_reached(call)
+            if reason:
+                call.status, call.reason = 'skipped', reason
+                rejected.append(call)
+                logger.info(f"Planner skipped {call.agent_type} agent: {reason}")
+                continue
+
+            # Reserve the estimate until the call's real usage is known
+            call.wave = len(self.waves)
+            self.tokens += call.estimated_tokens
+            self.cost += self._estimated_cost(call)
+            admitted.append(call)
+
+        if admitted:
+            self.waves.append([call.agent_type for call in self.submission_order(admitted)])
+        return admitted, rejected
+
+    def record_unavailable(self, parent_type: str, agent_type: str, depth: int, reason: str) -> PlannedCall:
+        """Keep a requested agent that could not be built in the plan, as a failed call."""
+        call = self.calls.get(agent_type)
+        if call is None or call.depth != depth:
+            call = self.calls[agent_type] = PlannedCall(agent_type, None, None, depth)
+        call.add_requests(parent_type, None)
+        call.status, call.reason = 'failed', reason
+        return call
+
+    @staticmethod
+    def submission_order(calls: list) -> list:
+        """Start the longest calls first so a full pool finishes the wave sooner."""
+        return sorted(calls, key=lambda call: call.estimated_tokens, reverse=True)
+
+    def complete(self, call: PlannedCall, result: dict, latency: float) -> None:
+        """Replace a call's estimate with what it actually used."""
+        self.tokens -= call.estimated_tokens
+        self.cost -= self._estimated_cost(call)
+        call.tokens = self._charge(call.agent, result)
+        call.latency = latency
+        call.status = 'completed'
+
+    def fail(self, call: PlannedCall, status: str, reason: str = None) -> None:
+        """Release a call's reservation when it produced nothing."""
+        self.tokens -= call.estimated_tokens
+        self.cost -= self._estimated_cost(call)
+        call.status, call.reason = status, reason
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': [call.to_dict() for call in self.calls.values()],
+            'waves': [list(wave) for wave in self.waves],
+            'tokens': self.tokens,
+            'estimated_cost': round(self.cost, 4),
+            'limits': {
+                'max_depth': self.max_depth,
+                'max_agents': self.max_agents,
+                'token_budget': self.token_budget,
+                'cost_budget': self.cost_budget
+            }
+        }
+
+    def _limit_reached(self, call: PlannedCall) -> str:
+        if call.depth > self.max_depth:
+            return 'max_depth'
+        running = sum(1 for known in self.calls.values() if known.wave is not None) + len(self.early)
+        if running + 1 > self.max_agents:
+            return 'max_agents'
+        if self.tokens + call.estimated_tokens > self.token_budget:
+            return 'token_budget'
+        if self.cost_budget and self.cost + self._estimated_cost(call) > self.cost_budget:
+            return 'cost_budget'
+        return None
+
+    def _estimate(self, call: PlannedCall, context_tokens: int) -> int:
+        """Prompt and completion tokens a call is expected to use."""
+        prompt_tokens = (
+            count_tokens(call.agent.system_message.content) + context_tokens
+            + sum(count_tokens(request) for request in call.requests) + PROMPT_OVERHEAD_TOKENS
+        )
+        # The prompt builder never sends more than the model's budget
+        prompt_tokens = min(prompt_tokens, call.agent.prompt_builder.budget)
+        return prompt_tokens + self.expected_output_tokens
+
+    def _estimated_cost(self, call: PlannedCall) -> float:
+        output_tokens = min(self.expected_output_tokens, call.estimated_tokens)
+        return estimate_cost(self._model_info(call.agent), call.estimated_tokens - output_tokens, output_tokens)
+
+    def _charge(self, agent, result: dict) -> int:
+        """Add a finished call's usage, priced for the model that served it; cached replies cost nothing."""
+        if result.get('cached'):
+            return 0
+        prompt_tokens = (result.get('prompt_usage') or {}).get('total', 0)
+        output_tokens = count_tokens(result['response'])
+        self.tokens += prompt_tokens + output_tokens
+        self.cost += estimate_cost(self._model_info(agent, result.get('model')), prompt_tokens, output_tokens)
+        return prompt_tokens + output_tokens
+
+    @staticmethod
+    def _model_info(agent, model: str = None) -> dict:
+        return agent.SUPPORTED_MODELS.get(model or agent.model, {})
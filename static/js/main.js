@@ -10,6 +10,22 @@ document.addEventListener('DOMContentLoaded', function() {
     let isLoadingMessages = false;
     let hasMoreMessages = true;
 
+    // Identifies this page's conversation so agent memory is kept per session
+    const sessionId = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+    // Why a collaborator was left out, by the reason sent with its 'skipped' event
+    const skipReasons = {
+        'deadline': 'the request ran out of time',
+        'max_depth': 'the collaboration went too deep',
+        'max_agents': 'too many agents were already involved',
+        'token_budget': "the request's token budget was used up",
+        'cost_budget': "the request's cost budget was used up",
+        'overloaded': 'the agents are busy',
+        'rate_limited': 'the model rate limit was reached'
+    };
+
     // Agent configuration with display names, colors, and welcome message routing
     const agentConfig = {
         'pm': { 
@@ -296,7 +312,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     message: welcomeMessage,
                     agent: 'pm',
-                    project: currentProject
+                    project: currentProject,
+                    session: sessionId
                 })
             });
 
@@ -431,7 +448,7 @@ document.addEventListener('DOMContentLoaded', function() {
         userInput.value = '';
 
         try {
-            const response = await fetch('/interact', {
+            const response = await fetch('/interact/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -439,22 +456,123 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     message: message,
                     agent: currentAgent,
-                    project: currentProject
+                    project: currentProject,
+                    session: sessionId
                 })
             });
 
-            const data = await response.json();
-            if (data.success) {
-                addMessage(data.response, false, currentAgent);
-            } else {
+            // Validation errors come back as plain JSON before streaming starts
+            if (!response.ok || !response.body) {
+                const data = await response.json();
                 addMessage(`Error: ${data.error}`, false, currentAgent);
+                return;
             }
+
+            let liveReply = null;
+            await readEventStream(response, (event, data) => {
+                if (event === 'token') {
+                    // Show the primary agent's reply while it is being generated
+                    if (!liveReply) {
+                        liveReply = appendAgentReply(currentAgent, {
+                            agent_type: data.agent_type,
+                            response: ''
+                        });
+                        liveReply.dataset.text = '';
+                    }
+                    liveReply.dataset.text += data.token;
+                    setMessageText(liveReply, liveReply.dataset.text);
+                } else if (event === 'agent') {
+                    if (liveReply && !data.parent_type) {
+                        setMessageText(liveReply, data.response.trim());
+                        describeLatency(liveReply, data);
+                        liveReply = null;
+                    } else {
+                        appendAgentReply(currentAgent, data);
+                    }
+                } else if (event === 'skipped') {
+                    const reason = skipReasons[data.reason] || data.reason || skipReasons.deadline;
+                    addMessage(`${data.display_name} was skipped: ${reason}`, false, currentAgent);
+                } else if (event === 'error') {
+                    addMessage(`Error: ${data.error}`, false, currentAgent);
+                }
+            });
         } catch (error) {
             console.error('Error in sendMessage:', error);
             addMessage(`Error: ${error.message}`, false, currentAgent);
         }
     }
 
+    // Read Server-Sent Events from a streaming fetch response
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+
+                if (dataLines.length) {
+                    try {
+                        onEvent(eventName, JSON.parse(dataLines.join('\n')));
+                    } catch (error) {
+                        console.error('Error parsing stream event:', error);
+                    }
+                }
+            }
+        }
+    }
+
+    // Render one agent's reply in the chat it was requested from
+    function appendAgentReply(targetAgent, event) {
+        const chatContainer = getChatContainer(targetAgent);
+        if (!chatContainer) {
+            console.error(`Chat container not found for agent: ${targetAgent}`);
+            return;
+        }
+
+        const messageDiv = createMessageElement(event.response.trim(), false, event.agent_type);
+        if (event.latency_ms !== undefined) {
+            describeLatency(messageDiv, event);
+        }
+        chatContainer.appendChild(messageDiv);
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+        lastMessages.set(`agent-${targetAgent}`, event.response);
+        return messageDiv;
+    }
+
+    // Replace the text of a rendered agent message
+    function setMessageText(messageDiv, content) {
+        const textContainer = messageDiv.querySelector('.message-text');
+        textContainer.lastChild.innerHTML = content.split('\n').map(line => `<p>${line}</p>`).join('');
+        const chatContainer = messageDiv.parentElement;
+        if (chatContainer) {
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        }
+    }
+
+    function describeLatency(messageDiv, event) {
+        messageDiv.dataset.latencyMs = event.latency_ms;
+        messageDiv.title = `${event.display_name} responded in ${(event.latency_ms / 1000).toFixed(1)}s`;
+    }
+
     // Initialize event listeners
     sendButton.addEventListener('click', sendMessage);
     userInput.addEventListener('keypress', function(e) {
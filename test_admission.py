@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from agents.admission import AdmissionController, AgentOverloadedError
+
+
+def test_coroutines_queue_for_slots_and_time_out():
+    admission = AdmissionController(max_concurrency=2, max_per_agent=2, max_queue=1, queue_timeout=0.2)
+    order = []
+
+    async def call(name, seconds):
+        async with admission.aslot('dev'):
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    async def main():
+        first = asyncio.gather(call('a', 0.1), call('b', 0.1))
+        await asyncio.sleep(0)
+        # The third call waits for a slot, the fourth finds the queue full
+        queued = asyncio.ensure_future(call('c', 0))
+        await asyncio.sleep(0)
+        with pytest.raises(AgentOverloadedError):
+            await call('d', 0)
+        await asyncio.gather(first, queued)
+
+        async with admission.aslot('dev'), admission.aslot('dev'):
+            with pytest.raises(AgentOverloadedError):
+                await call('e', 0)
+
+    asyncio.run(main())
+    assert order == ['a', 'b', 'c']
+    stats = admission.stats()
+    assert stats['running'] == 0 and stats['queue_depth'] == 0
+    assert stats['rejected_full'] == 1 and stats['rejected_timeout'] == 1
@@ -0,0 +1,189 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agents.admission import AdmissionController, AgentOverloadedError
+from agents.base_agent import BaseAgent
+from agents.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from agents.deadline import Deadline, DeadlineExceeded
+from agents.llm_transport import MAX_RETRIES
+from agents.memory_store import SessionMemoryStore
+from agents.rate_limiter import TokenRateLimiter
+from agents.response_cache import ResponseCache
+
+
+class FakeLLM:
+    """Answers every call with the same text, split into word tokens when streamed."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def invoke(self, prompt, **options):
+        return AIMessage(content=self.text)
+
+    def stream(self, prompt, **options):
+        for word in self.text.split(' '):
+            yield AIMessageChunk(content=word + ' ')
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    agent = BaseAgent('dev', 'You are a developer.')
+    agent.memory_store = SessionMemoryStore(background=False)
+    agent.admission = AdmissionController(max_concurrency=1, max_per_agent=1, max_queue=0)
+    return agent
+
+
+class ScriptedLLM:
+    """Answers successive calls after a delay each, raising the outcomes that are exceptions."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.options = []
+
+    def invoke(self, prompt, **options):
+        self.options.append(options)
+        delay, outcome = self.steps.pop(0)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return AIMessage(content=outcome)
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+@pytest.fixture
+def breakers(agent):
+    agent.circuit_breakers = CircuitBreakerRegistry(hedge=True, min_calls=1, failure_rate=0.5, reset_timeout=60)
+    return agent.circuit_breakers
+
+
+def use_llm(agent, model, llm):
+    agent._llms[model, MAX_RETRIES] = llm
+
+
+def test_a_streamed_call_frees_its_slot_before_the_reader_catches_up(agent):
+    use_llm(agent, agent.model, FakeLLM('The release notes are ready for review.'))
+
+    tokens = agent.stream_input('Write the release notes', {'no_cache': True})
+    assert next(tokens) == 'The '
+    waited = time.monotonic()
+    while agent.admission.stats()['running'] and time.monotonic() - waited < 2:
+        time.sleep(0.01)
+    assert agent.admission.stats()['running'] == 0
+
+    rest = []
+    while True:
+        try:
+            rest.append(next(tokens))
+        except StopIteration as stop:
+            result = stop.value
+            break
+    assert ''.join(['The '] + rest) == 'The release notes are ready for review. '
+    assert result['response'] == 'The release notes are ready for review. '
+
+
+def test_a_call_refused_a_slot_gets_its_quota_back(agent):
+    use_llm(agent, agent.model, FakeLLM('Not called while the slot is taken.'))
+    agent.rate_limiter = TokenRateLimiter({agent.model: (100000, 60)}, max_wait=0)
+
+    with agent.admission.slot('pm'):
+        with pytest.raises(AgentOverloadedError):
+            agent.process_input('Review the schema', {'no_cache': True})
+
+    stats = agent.rate_limiter.stats()
+    assert stats['reserved'] == 1
+    assert agent.rate_limiter._take(agent.model, 100000) == 0
+
+
+def test_an_open_circuit_falls_back_to_the_next_model(agent, breakers):
+    use_llm(agent, 'gpt-4o', FakeLLM('Answer from the primary model.'))
+    use_llm(agent, 'gpt-4', FakeLLM('Answer from the fallback model.'))
+    breakers.get('gpt-4o').record_error(TimeoutError('read timed out'))
+
+    result = agent.process_input('Review the schema', {'no_cache': True})
+
+    assert result['response'] == 'Answer from the fallback model.'
+    assert result['model'] == 'gpt-4'
+    assert breakers.stats()['fallbacks'] == 1
+
+    breakers.get('gpt-4').record_error(ServerError())
+    with pytest.raises(CircuitOpenError):
+        agent.process_input('Review the schema again', {'no_cache': True})
+
+
+def test_a_duplicate_call_wins_when_the_first_is_slow(agent, breakers):
+    breaker = breakers.get(agent.model)
+    for _ in range(20):
+        breaker.latency.record(0.02)
+    use_llm(agent, agent.model, ScriptedLLM((0.5, 'The slow first answer.'), (0, 'The hedged answer wins.')))
+    agent.rate_limiter = TokenRateLimiter({agent.model: (100000, 60)}, max_wait=0)
+
+    result = agent.process_input('Review the schema', {'no_cache': True})
+
+    assert result['response'] == 'The hedged answer wins.'
+    assert breaker.stats()['hedge_wins'] == 1
+    # The duplicate reserved its own quota
+    assert agent.rate_limiter.stats()['reserved'] == 2
+
+
+def test_when_the_first_call_to_finish_fails_the_other_decides(agent, breakers):
+    breaker = breakers.get(agent.model)
+    for _ in range(20):
+        breaker.latency.record(0.02)
+    use_llm(agent, agent.model, ScriptedLLM((0.1, ServerError()), (0.2, 'The duplicate still answers.')))
+
+    result = agent.process_input('Review the schema', {'no_cache': True})
+
+    assert result['response'] == 'The duplicate still answers.'
+    assert breaker.stats()['hedge_wins'] == 1
+    assert breaker.stats()['failures'] == 0
+
+
+def test_hedged_calls_stop_at_the_request_deadline(agent, breakers):
+    breaker = breakers.get(agent.model)
+    for _ in range(20):
+        breaker.latency.record(0.02)
+    # A request with a deadline uses the client that does not retry
+    llm = agent._llms[agent.model, 0] = ScriptedLLM((1, 'Too late.'), (1, 'Also too late.'))
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        agent.process_input('Review the schema', {'no_cache': True, 'deadline': Deadline(0.3)})
+
+    assert time.monotonic() - started < 0.8
+    first, duplicate = llm.options
+    # The duplicate only gets what was left of the deadline when it started
+    assert duplicate['timeout'] < first['timeout'] <= 0.3
+
+
+class FixedRouter:
+    """Sends every call to one model."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def route(self, agent_type, model, prompt_tokens, **signals):
+        return self.model
+
+
+def test_cached_replies_are_kept_per_model(agent):
+    agent.response_cache = ResponseCache(max_entries=10, db_path=None)
+    use_llm(agent, 'gpt-3.5-turbo', FakeLLM('Answer from the light model.'))
+    use_llm(agent, 'gpt-4o', FakeLLM('Answer from the deep model.'))
+
+    agent.model_router = FixedRouter('gpt-3.5-turbo')
+    assert agent.process_input('Review the schema', {'session': 'a'})['response'] == 'Answer from the light model.'
+
+    agent.model_router = FixedRouter('gpt-4o')
+    result = agent.process_input('Review the schema', {'session': 'b'})
+    assert result['response'] == 'Answer from the deep model.'
+    assert result['model'] == 'gpt-4o'
+
+    repeated = agent.process_input('Review the schema', {'session': 'c'})
+    assert repeated['response'] == 'Answer from the deep model.'
+    assert repeated['cached'] is True
@@ -0,0 +1,42 @@
+import pytest
+
+from agents.cassette import Cassette, CassetteMissError
+
+
+def test_replays_recorded_calls_by_prompt_then_falls_back(tmp_path):
+    path = str(tmp_path / 'calls.jsonl')
+    recorder = Cassette(path)
+    recorder.record_interaction({'message': 'Plan the sprint', 'agent': 'pm'})
+    recorder.record('pm', 'gpt-4o', 'prompt one', 'First answer', 1.5)
+    recorder.record('pm', 'gpt-4o', 'prompt two', 'Second answer', 0.5)
+    recorder.record('pm', 'gpt-4o', 'prompt one', 'Third answer', 0.5)
+    recorder.close()
+
+    player = Cassette(path, mode='replay', latency='zero')
+    assert player.interactions() == [{'message': 'Plan the sprint', 'agent': 'pm'}]
+    assert player.replay('pm', 'gpt-4o', 'prompt one').content == 'First answer'
+    assert player.replay('pm', 'gpt-4o', 'prompt one').content == 'Third answer'
+    # Repeats of a prompt keep getting its last recording
+    assert player.replay('pm', 'gpt-4o', 'prompt one').content == 'Third answer'
+    # An unrecorded prompt gets the agent's next unused call
+    assert player.replay('pm', 'gpt-4o', 'prompt three').content == 'Second answer'
+    with pytest.raises(CassetteMissError):
+        player.replay('pm', 'gpt-4o', 'prompt four')
+    with pytest.raises(CassetteMissError):
+        Cassette(path, mode='replay', strict=True).replay('pm', 'gpt-4o', 'prompt three')
+
+    stats = player.stats()
+    assert (stats['replayed'], stats['fallbacks'], stats['misses']) == (4, 1, 1)
+
+
+def test_cache_served_replies_are_recorded_for_replay(tmp_path):
+    path = str(tmp_path / 'calls.jsonl')
+    recorder = Cassette(path)
+    recorder.record('tester', 'gpt-4o', 'prompt one', 'Fresh answer', 1.0)
+    recorder.record('tester', 'gpt-4o', 'prompt two', 'Cached answer', 0.0, cached=True)
+    assert (recorder.stats()['recorded'], recorder.stats()['recorded_cached']) == (2, 1)
+    recorder.close()
+
+    player = Cassette(path, mode='replay', latency='zero', strict=True)
+    assert player.replay('tester', 'gpt-4o', 'prompt two').content == 'Cached answer'
+    assert player.stats()['fallbacks'] == 0
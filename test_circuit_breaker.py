@@ -0,0 +1,67 @@
+import time
+
+from agents.circuit_breaker import CircuitBreaker, is_outage
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+def test_outages_open_the_breaker_and_a_trial_closes_it():
+    breaker = CircuitBreaker('gpt-4', window=4, min_calls=4, failure_rate=0.5, reset_timeout=0.05)
+
+    breaker.record_success(1.0)
+    breaker.record_success(1.0)
+    breaker.record_error(TimeoutError('read timed out'))
+    assert breaker.state == 'closed'
+    breaker.record_error(StatusError(503))
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # One trial call goes through; others wait for its outcome
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_success(1.0)
+    assert breaker.state == 'closed'
+    assert breaker.stats()['opened'] == 1
+
+
+def test_a_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker('gpt-4', window=2, min_calls=2, failure_rate=1.0, reset_timeout=0.05)
+    breaker.record_error(ConnectionError('reset by peer'))
+    breaker.record_error(ConnectionError('reset by peer'))
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_error(StatusError(502))
+
+    assert breaker.state == 'open'
+    assert breaker.stats()['opened'] == 2
+
+
+def test_rejected_requests_do_not_count_as_failures():
+    breaker = CircuitBreaker('gpt-4', window=2, min_calls=2, failure_rate=0.5, reset_timeout=0.05)
+
+    for status in (400, 401, 429):
+        breaker.record_error(StatusError(status))
+
+    assert breaker.state == 'closed'
+    assert breaker.stats()['client_errors'] == 3
+    assert not is_outage(ValueError('Response too short or empty'))
+    assert is_outage(StatusError(500))
+
+
+def test_a_rejected_trial_lets_the_next_call_try():
+    breaker = CircuitBreaker('gpt-4', window=1, min_calls=1, failure_rate=1.0, reset_timeout=0.05)
+    breaker.record_error(TimeoutError('read timed out'))
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_error(StatusError(400))
+
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
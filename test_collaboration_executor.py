@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+import time
+
+from collaboration import CollaborationExecutor, EarlyDispatcher
+from planner import CollaborationPlan
+
+
+class StubAgent:
+    """Replies after a delay, asking for the given collaborators, and logs when each call starts and ends."""
+
+    def __init__(self, name, log, seconds=0, needs=()):
+        self.name = name
+        self.log = log
+        self.seconds = seconds
+        self.needs = list(needs)
+        self.model = 'gpt-4'
+        self.system_message = SimpleNamespace(content='You are a helpful agent.')
+        self.prompt_builder = SimpleNamespace(budget=4000)
+        self.SUPPORTED_MODELS = {'gpt-4': {'input_cost_per_1k': 0.03, 'output_cost_per_1k': 0.06}}
+
+    def process_input(self, message, context):
+        self.log.append(('start', self.name))
+        time.sleep(self.seconds)
+        self.log.append(('end', self.name))
+        return {
+            'response': f'{self.name} done.',
+            'needs_collaboration': self.needs,
+            'collaboration_requests': {need: [f'help {self.name}'] for need in self.needs}
+        }
+
+
+def run_tree(ordered):
+    log = []
+    executor = CollaborationExecutor({
+        'ba': (StubAgent('ba', log, seconds=0.2, needs=['ux']), 'BUSINESS ANALYST'),
+        'dev': (StubAgent('dev', log, seconds=0, needs=['tester', 'ba']), 'DEVELOPER'),
+        'ux': (StubAgent('ux', log), 'UX DESIGNER'),
+        'tester': (StubAgent('tester', log), 'TESTER'),
+    }, max_workers=4)
+    primary = {'response': 'Plan ready.', 'needs_collaboration': ['ba', 'dev'],
+               'collaboration_requests': {'ba': ['analyse'], 'dev': ['build it']}}
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000)
+
+    events = list(executor.run('hello', 'pm', primary, 'PM', ordered=ordered, plan=plan))
+    return events, log
+
+
+def test_levels_run_one_after_the_other_and_results_keep_request_order():
+    events, log = run_tree(ordered=True)
+
+    # The slow ba reply still comes first, as the primary agent asked for it first
+    assert [(event['parent_type'], event['agent_type']) for event in events] == [
+        ('pm', 'ba'), ('pm', 'dev'), ('ba', 'ux'), ('dev', 'tester')
+    ]
+    # Both level-one calls run together; level two starts once both have finished
+    assert {entry for entry in log[:2]} == {('start', 'ba'), ('start', 'dev')}
+    assert log.index(('start', 'ux')) > log.index(('end', 'ba'))
+    assert log.index(('start', 'tester')) > log.index(('end', 'ba'))
+
+
+def test_unordered_runs_yield_each_level_as_calls_complete():
+    events, _ = run_tree(ordered=False)
+
+    assert [event['agent_type'] for event in events[:2]] == ['dev', 'ba']
+    assert {event['agent_type'] for event in events[2:]} == {'ux', 'tester'}
+
+
+def test_early_dispatch_stays_within_the_plan():
+    log = []
+    executor = CollaborationExecutor({
+        'dev': (StubAgent('dev', log), 'DEVELOPER'),
+        'ba': (StubAgent('ba', log), 'BUSINESS ANALYST'),
+    }, max_workers=2)
+    plan = CollaborationPlan(max_depth=3, max_agents=1, token_budget=100000)
+    dispatcher = EarlyDispatcher(executor, 'hello', 'pm', plan=plan)
+
+    assert dispatcher.feed('First [NEED_DEV: build it] ') == ['dev']
+    # A second collaborator would go over max_agents, so it waits for the full reply
+    assert dispatcher.feed('then [NEED_BA: analyse]') == []
+    assert list(dispatcher.dispatched) == ['dev']
+    dispatcher.discard()
+
+
+class PendingFuture:
+    """An early call that has not started, recording whether it was cancelled."""
+
+    cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+def test_early_calls_the_plan_refuses_after_the_reply_are_cancelled():
+    log = []
+    executor = CollaborationExecutor({'dev': (StubAgent('dev', log), 'DEVELOPER')}, max_workers=1)
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=2000)
+    dispatcher = EarlyDispatcher(executor, 'hello', 'pm', plan=plan)
+    assert dispatcher.feed('[NEED_DEV: build it]') == ['dev']
+    dispatcher.dispatched['dev'][1].result()
+
+    # The finished reply used most of the budget, so the first wave has no room for dev
+    primary = {'response': '[NEED_DEV: build it]', 'needs_collaboration': ['dev'],
+               'collaboration_requests': {'dev': ['build it']}, 'prompt_usage': {'total': 1900}}
+    plan.record_primary(StubAgent('pm', log), primary)
+    early = PendingFuture()
+    prefetched = {'dev': (['build it'], early, {})}
+
+    events = list(executor.run('hello', 'pm', primary, 'PM', prefetched=prefetched, plan=plan))
+
+    assert [(event['agent_type'], event.get('reason')) for event in events] == [('dev', 'token_budget')]
+    assert early.cancelled
+    assert plan.early == {}
@@ -0,0 +1,33 @@
+from agents.markers import MarkerStreamParser, scan_collaboration_markers
+
+
+def test_scan_recognizes_both_formats():
+    response = (
+        "Plan: [NEED_DEV: build the API] then "
+        "Tester -> Task for Tester [write tests] and [NEED_DEV: add auth]"
+    )
+    needed, requests = scan_collaboration_markers(response, exclude='pm')
+    assert needed == ['dev', 'tester']
+    assert requests == {'dev': ['build the API', 'add auth'], 'tester': ['write tests']}
+
+
+def test_scan_handles_test_ux_and_letter_case():
+    needed, requests = scan_collaboration_markers("[NEED_TEST: t] [need_ux: mockups] [NEED_DevOps: ci]")
+    assert needed == ['tester', 'devops', 'uxd']
+    assert requests['uxd'] == ['mockups']
+
+
+def test_scan_excludes_own_markers_and_mismatched_names():
+    response = "[NEED_PM: self] Developer -> Task for Tester [wrong] PM -> Task for PM [again]"
+    assert scan_collaboration_markers(response, exclude='pm') == ([], {})
+
+
+def test_stream_parser_matches_post_hoc_scan():
+    response = "Intro [link] [NEED_DEV: api] text [NEED_DEVOPS: deploy\nnow] [NEED_UX: flows]"
+    parser = MarkerStreamParser(exclude='pm')
+    streamed = []
+    for start in range(0, len(response), 3):
+        streamed.extend(parser.feed(response[start:start + 3]))
+
+    _, requests = scan_collaboration_markers(response, exclude='pm')
+    assert streamed == [(agent, request) for agent, items in requests.items() for request in items]
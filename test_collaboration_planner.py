@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from agents.prompt_builder import count_tokens
+from collaboration import CollaborationExecutor
+from planner import CollaborationPlan
+
+
+def make_agent():
+    return SimpleNamespace(
+        model='gpt-4',
+        system_message=SimpleNamespace(content='You are a helpful agent.'),
+        prompt_builder=SimpleNamespace(budget=4000),
+        SUPPORTED_MODELS={'gpt-4': {'input_cost_per_1k': 0.03, 'output_cost_per_1k': 0.06}}
+    )
+
+
+def test_requests_from_several_parents_are_merged_into_one_call():
+    agent = make_agent()
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000)
+    level = [('dev', 'tester', agent, 'TESTER'), ('devops', 'tester', agent, 'TESTER')]
+    requests = {'dev': {'tester': ['unit tests']}, 'devops': {'tester': ['smoke tests', 'unit tests']}}
+
+    admitted, rejected = plan.plan_wave(level, 2, set(), requests, {}, 'hello')
+
+    assert rejected == []
+    assert [call.agent_type for call in admitted] == ['tester']
+    assert admitted[0].parents == ['dev', 'devops']
+    assert admitted[0].requests == ['unit tests', 'smoke tests']
+
+
+def test_limits_skip_calls_with_a_reason():
+    agent = make_agent()
+    level = [('pm', 'dev', agent, 'DEVELOPER'), ('pm', 'ba', agent, 'BUSINESS ANALYST')]
+
+    plan = CollaborationPlan(max_depth=3, max_agents=1, token_budget=100000)
+    admitted, rejected = plan.plan_wave(level, 1, set(), {}, {}, 'hello')
+    assert [call.agent_type for call in admitted] == ['dev']
+    assert [(call.agent_type, call.reason) for call in rejected] == [('ba', 'max_agents')]
+
+    plan = CollaborationPlan(max_depth=0, max_agents=6, token_budget=100000)
+    _, rejected = plan.plan_wave(level, 1, set(), {}, {}, 'hello')
+    assert {call.reason for call in rejected} == {'max_depth'}
+
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=10)
+    _, rejected = plan.plan_wave(level, 1, set(), {}, {}, 'hello')
+    assert {call.reason for call in rejected} == {'token_budget'}
+
+
+class BrokenAgents(dict):
+    """Agents by type where building 'ba' fails, like a misconfigured AgentRegistry entry."""
+
+    def get(self, agent_type, default=None):
+        if agent_type == 'ba':
+            raise RuntimeError('Failed to initialize ba agent: missing API key')
+        return super().get(agent_type, default)
+
+
+def test_an_agent_that_cannot_be_built_is_recorded_and_the_rest_still_run():
+    dev = make_agent()
+    dev.process_input = lambda message, context: {
+        'response': 'Implementation plan ready.', 'needs_collaboration': [], 'collaboration_requests': {}
+    }
+    executor = CollaborationExecutor(BrokenAgents(dev=(dev, 'DEVELOPER')), max_workers=2)
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000)
+    primary = {'response': 'Plan ready.', 'needs_collaboration': ['ba', 'dev'],
+               'collaboration_requests': {'ba': ['analyse'], 'dev': ['build it']}}
+
+    events = list(executor.run('hello', 'pm', primary, 'PM', plan=plan))
+
+    assert [event['agent_type'] for event in events] == ['dev']
+    calls = {call['agent_type']: call for call in plan.to_dict()['calls']}
+    assert calls['dev']['status'] == 'completed'
+    assert calls['ba']['status'] == 'failed'
+    assert calls['ba']['parents'] == ['pm']
+    assert 'missing API key' in calls['ba']['reason']
+
+
+def test_arun_cancels_running_calls_when_the_walk_stops_early():
+    tasks = {}
+
+    def make_async_agent(name, seconds):
+        agent = make_agent()
+
+        async def aprocess_input(message, context):
+            tasks[name] = asyncio.current_task()
+            await asyncio.sleep(seconds)
+            return {'response': 'Done.', 'needs_collaboration': [], 'collaboration_requests': {}}
+
+        agent.aprocess_input = aprocess_input
+        return agent
+
+    executor = CollaborationExecutor({'dev': (make_async_agent('dev', 0), 'DEVELOPER'),
+                                      'ba': (make_async_agent('ba', 60), 'BUSINESS ANALYST')})
+    primary = {'response': 'Plan ready.', 'needs_collaboration': ['dev', 'ba'], 'collaboration_requests': {}}
+
+    async def main():
+        events = executor.arun('hello', 'pm', primary, 'PM', ordered=False,
+                               plan=CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000))
+        first = await events.__anext__()
+        await events.aclose()
+        await asyncio.sleep(0)
+        return first, tasks['ba'].cancelled()
+
+    first, cancelled = asyncio.run(main())
+
+    assert first['agent_type'] == 'dev'
+    assert cancelled
+
+
+def test_calls_are_charged_for_the_model_that_served_them():
+    agent = make_agent()
+    agent.SUPPORTED_MODELS = {
+        'gpt-4': {'input_cost_per_1k': 0.03, 'output_cost_per_1k': 0.06},
+        'gpt-3.5-turbo': {'input_cost_per_1k': 0.0005, 'output_cost_per_1k': 0.0015}
+    }
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000)
+
+    plan.record_primary(agent, {'response': 'Plan ready.', 'prompt_usage': {'total': 1000}, 'model': 'gpt-3.5-turbo'})
+
+    assert plan.tokens == 1000 + count_tokens('Plan ready.')
+    assert plan.cost == pytest.approx((1000 * 0.0005 + count_tokens('Plan ready.') * 0.0015) / 1000)
+
+
+def test_cached_replies_are_not_charged():
+    agent = make_agent()
+    plan = CollaborationPlan(max_depth=3, max_agents=6, token_budget=100000)
+    plan.record_primary(agent, {'response': 'Plan ready.', 'prompt_usage': {'total': 1000}, 'cached': True})
+    assert (plan.tokens, plan.cost) == (0, 0.0)
+
+    level = [('pm', 'dev', agent, 'DEVELOPER')]
+    (call,), _ = plan.plan_wave(level, 1, set(), {}, {}, 'hello')
+    plan.complete(call, {'response': 'Built.', 'prompt_usage': {'total': 800}, 'cached': True}, 0.01)
+
+    assert call.tokens == 0
+    assert (plan.tokens, plan.cost) == (0, pytest.approx(0.0))
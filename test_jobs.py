@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+database = pytest.importorskip('database')
+
+from jobs import JobManager, JobQueueFull  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    database.db.init_app(app)
+    with app.app_context():
+        database.db.create_all()
+        yield app
+
+
+class SteppedRun:
+    """Yields scripted interaction events, one step each time the test calls advance()."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.allowed = threading.Semaphore(0)
+
+    def advance(self):
+        self.allowed.release()
+
+    def __call__(self, message, agent_type, project_id, request_options):
+        for step in self.steps:
+            # Bounded, so a failed test does not leave the worker blocked
+            if not self.allowed.acquire(timeout=5):
+                raise TimeoutError('The test never advanced the run')
+            yield from step
+
+
+def agent(agent_type, response):
+    return 'agent', {'agent_type': agent_type, 'display_name': agent_type.upper(), 'response': response}
+
+
+def wait_for(manager, job_id, check):
+    waited = time.monotonic()
+    while time.monotonic() - waited < 2:
+        job = manager.get(job_id)
+        if check(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job never reached the expected state: {manager.get(job_id)}")
+
+
+def test_skipped_agents_leave_the_pending_list(app):
+    run = SteppedRun(
+        [agent('pm', 'Plan ready. [NEED_DEV: build it] [NEED_BA: analyse]')],
+        [('skipped', {'agent_type': 'ba', 'parent_type': 'pm', 'display_name': 'BA', 'reason': 'max_agents'})],
+        [agent('dev', 'Built.'), ('plan', {'calls': []})]
+    )
+    manager = JobManager(app, run, max_workers=1)
+    job_id = manager.submit('Ship it', 'pm')
+
+    run.advance()
+    job = wait_for(manager, job_id, lambda job: job['done'] == ['pm'])
+    assert job['status'] == 'running'
+    assert job['pending'] == ['ba', 'dev']
+
+    run.advance()
+    job = wait_for(manager, job_id, lambda job: job['skipped'])
+    assert job['pending'] == ['dev']
+    assert job['skipped'] == [{'agent_type': 'ba', 'reason': 'max_agents'}]
+
+    run.advance()
+    job = wait_for(manager, job_id, lambda job: job['status'] == 'completed')
+    assert job['done'] == ['pm', 'dev']
+    assert job['pending'] == []
+    assert manager.stats()['active'] == 0
+
+
+def test_a_failed_run_is_recorded(app):
+    def failing(message, agent_type, project_id, request_options):
+        yield agent('pm', 'Plan ready.')
+        raise RuntimeError('LLM unavailable')
+
+    manager = JobManager(app, failing, max_workers=1)
+    job_id = manager.submit('Ship it', 'pm')
+
+    job = wait_for(manager, job_id, lambda job: job['status'] == 'failed')
+    assert job['error'] == 'LLM unavailable'
+    assert job['done'] == ['pm']
+
+
+def test_jobs_beyond_the_queue_limit_are_refused(app):
+    run = SteppedRun([agent('pm', 'Plan ready.')])
+    manager = JobManager(app, run, max_workers=1, max_queued=1)
+    job_id = manager.submit('Ship it', 'pm')
+
+    with pytest.raises(JobQueueFull):
+        manager.submit('And this', 'pm')
+
+    run.advance()
+    wait_for(manager, job_id, lambda job: job['status'] == 'completed')
+    assert manager.get('missing') is None
@@ -0,0 +1,68 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import asyncio
+import json
+
+from agents.llm_transport import LLMTransport
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({
+            'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': 'Hello from the fake server.'}}],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': 6, 'total_tokens': 11}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_calls_reuse_one_pooled_connection():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    transport = LLMTransport(base_url=f'http://127.0.0.1:{server.server_port}/v1', api_key='test')
+    try:
+        completions = transport.chat_clients()['client']
+        for _ in range(3):
+            reply = completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': 'hi'}])
+            assert reply.choices[0].message.content == 'Hello from the fake server.'
+
+        stats = transport.stats()
+        assert stats['requests'] == 3
+        assert stats['new_connections'] == 1
+        assert stats['reused_connections'] == 2
+    finally:
+        transport.close()
+        server.shutdown()
+
+
+def test_aclose_closes_the_async_client_on_its_loop():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    transport = LLMTransport(base_url=f'http://127.0.0.1:{server.server_port}/v1', api_key='test')
+
+    async def main():
+        client = transport.async_client
+        completions = transport.chat_clients(max_retries=0)['async_client']
+        reply = await completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': 'hi'}])
+        assert reply.choices[0].message.content == 'Hello from the fake server.'
+        await transport.aclose()
+        return client
+
+    try:
+        client = asyncio.run(main())
+        assert client.is_closed()
+        assert transport.async_client is not client
+    finally:
+        transport.close()
+        server.shutdown()
@@ -0,0 +1,50 @@
+from agents.memory_store import SessionMemory, SessionMemoryStore
+
+
+def test_forked_memory_leaves_the_session_untouched():
+    memory = SessionMemory(window=4)
+    memory.add_user_message('Plan the checkout release')
+    memory.add_ai_message('Release plan ready')
+
+    fork = memory.fork()
+    fork.add_user_message('Speculative question')
+    fork.add_ai_message('Speculative answer', {'dev': ['build it']})
+
+    assert [message.content for message in fork.messages][-1] == 'Speculative answer'
+    assert [message.content for message in memory.messages] == ['Plan the checkout release', 'Release plan ready']
+    assert memory.index.open_requests() == {}
+
+
+def test_rehydration_summarizes_history_older_than_the_window():
+    history = [('user', 'The invoices must be exported as PDF.'), ('agent', 'Noted, PDF export it is.')]
+    history += [('user', f'Question {n}.') if n % 2 == 0 else ('agent', f'Answer {n}.') for n in range(6)]
+
+    def loader(project_id, agent_type, session, limit):
+        return history[-limit:]
+
+    store = SessionMemoryStore(window=4, loader=loader, background=False, summary_history=10)
+    memory = store.get('p1', 'ba', 'new-page-load')
+
+    assert [message.content for message in memory.messages] == ['Question 2.', 'Answer 3.', 'Question 4.', 'Answer 5.']
+    assert 'PDF' in memory.summary
+
+
+def test_each_session_is_rehydrated_from_its_own_history():
+    persisted = {
+        ('p1', 'ba', 'alice'): [('user', 'Export invoices as PDF.'), ('agent', 'PDF export noted.')],
+        ('p1', 'ba', None): [('user', 'Old question without a session.'), ('agent', 'Old answer.')],
+    }
+    loads = []
+
+    def loader(project_id, agent_type, session, limit):
+        loads.append(session)
+        return persisted.get((project_id, agent_type, session), [])[-limit:]
+
+    store = SessionMemoryStore(window=4, loader=loader, background=False)
+
+    assert [message.content for message in store.get('p1', 'ba', 'alice').messages] == [
+        'Export invoices as PDF.', 'PDF export noted.'
+    ]
+    assert store.get('p1', 'ba', 'bob').messages == []
+    assert [message.content for message in store.get('p1', 'ba').messages][0] == 'Old question without a session.'
+    assert loads == ['alice', 'bob', None]
@@ -0,0 +1,37 @@
+from agents.base_agent import BaseAgent
+from agents.circuit_breaker import CircuitBreakerRegistry
+from agents.model_router import ModelRouter, output_limit
+
+
+def make_router(latencies=None):
+    profiles = CircuitBreakerRegistry()
+    for model, seconds in (latencies or {}).items():
+        for _ in range(20):
+            profiles.get(model).latency.record(seconds)
+    return ModelRouter(BaseAgent.SUPPORTED_MODELS, profiles, deep_agents='pm,ba,dev')
+
+
+def test_short_follow_ups_go_to_the_light_model():
+    router = make_router()
+
+    assert router.route('tester', 'gpt-4o', 800, input_tokens=20, follow_up=True) == 'gpt-3.5-turbo'
+    assert router.route('dev', 'gpt-4o', 800, input_tokens=20, collaborator=True) == 'gpt-3.5-turbo'
+    # Deep-analysis agents answering the user, long inputs and first questions stay put
+    assert router.route('dev', 'gpt-4o', 800, input_tokens=20, follow_up=True) == 'gpt-4o'
+    assert router.route('tester', 'gpt-4o', 800, input_tokens=2000, follow_up=True) == 'gpt-4o'
+    assert router.route('tester', 'gpt-4o', 800, input_tokens=20) == 'gpt-4o'
+    # A prompt that overflows the light model's context window is not moved
+    assert router.route('tester', 'gpt-4o', 6000, input_tokens=20, follow_up=True) == 'gpt-4o'
+
+
+def test_short_deadline_picks_a_faster_model():
+    router = make_router({'gpt-4o': 8.0, 'gpt-4': 12.0, 'gpt-3.5-turbo': 2.0})
+
+    assert router.route('pm', 'gpt-4o', 800, input_tokens=500, deadline_remaining=30) == 'gpt-4o'
+    assert router.route('pm', 'gpt-4o', 800, input_tokens=500, deadline_remaining=5) == 'gpt-3.5-turbo'
+    assert router.stats()['reasons'] == {'default': 1, 'deadline': 1}
+
+
+def test_o1_models_use_max_output():
+    assert output_limit(BaseAgent.SUPPORTED_MODELS['o1-mini']) == 65536
+    assert output_limit(BaseAgent.SUPPORTED_MODELS['gpt-4o']) == 16384
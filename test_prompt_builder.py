@@ -0,0 +1,55 @@
+from agents.prompt_builder import PromptBuilder, PromptSection, count_tokens
+
+SYSTEM = "You are a senior developer. Always answer with working code.\n\n"
+INPUT = "User input: How should we cache the catalogue?\n"
+
+
+def history(turns):
+    return [f"{'User' if n % 2 == 0 else 'Assistant'}: message {n} " + 'about the catalogue ' * 10 + '\n'
+            for n in range(turns)]
+
+
+def test_prompt_stays_within_the_budget_and_keeps_the_system_message():
+    builder = PromptBuilder(context_length=400, reserved_output=100)
+    sections = [
+        PromptSection('history', "Previous conversation history:", history(30),
+                      priority=4, mode='oldest', max_share=0.3, always_header=True),
+        PromptSection('peers', "Previous agent responses:", ['PM: ' + 'plan details ' * 200 + '\n'],
+                      priority=3, mode='truncate', max_share=0.6),
+    ]
+
+    prompt = builder.build(SYSTEM, sections, INPUT)
+
+    assert prompt.usage['total'] <= builder.budget
+    assert count_tokens(prompt.text) <= builder.budget
+    assert prompt.text.startswith(SYSTEM)
+    assert prompt.text.endswith(INPUT)
+    assert set(prompt.usage['shrunk']) == {'history', 'peers'}
+
+
+def test_history_is_trimmed_oldest_first():
+    messages = history(12)
+    builder = PromptBuilder(context_length=1000, reserved_output=0)
+    section = PromptSection('history', "Previous conversation history:", messages,
+                            priority=4, mode='oldest', max_share=0.3, always_header=True)
+
+    prompt = builder.build(SYSTEM, [section], INPUT)
+
+    kept = [message for message in messages if message in prompt.text]
+    assert 0 < len(kept) < len(messages)
+    # What is left is the most recent stretch of the conversation, in order
+    assert kept == messages[-len(kept):]
+    assert prompt.text.index(kept[0]) < prompt.text.index(kept[-1])
+    assert prompt.usage['shrunk'] == {'history': len(messages) - len(kept)}
+    assert prompt.usage['history'] <= int(builder.budget * 0.3)
+
+
+def test_required_text_is_kept_when_no_history_fits():
+    builder = PromptBuilder(context_length=count_tokens(SYSTEM) + count_tokens(INPUT) + 64)
+    section = PromptSection('history', "Previous conversation history:", history(4),
+                            priority=4, mode='oldest', max_share=0.3)
+
+    prompt = builder.build(SYSTEM, [section], INPUT)
+
+    assert prompt.text == SYSTEM + INPUT
+    assert prompt.usage['history'] == 0
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import pytest
+
+from agents import rate_limiter
+from agents.admission import AgentRateLimitError
+from agents.rate_limiter import TokenRateLimiter
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping moves the clock forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+def test_buckets_refill_with_time(clock):
+    limiter = TokenRateLimiter({'gpt-4': (1000, 60)}, max_wait=0, expected_completion_tokens=100)
+
+    limiter.reserve('gpt-4', 400)
+    limiter.reserve('gpt-4', 400)
+    with pytest.raises(AgentRateLimitError) as refused:
+        limiter.reserve('gpt-4', 400)
+    # 500 of the 1000 tokens per minute come back after 30 seconds
+    assert refused.value.retry_after == 30
+
+    clock.sleep(30)
+    assert limiter.reserve('gpt-4', 400).tokens == 500
+    assert limiter.reserve('unlimited-model', 10 ** 6) is None
+
+
+def test_a_call_waits_for_budget_within_max_wait(clock):
+    limiter = TokenRateLimiter({'gpt-4': (600, 60)}, max_wait=60, expected_completion_tokens=100)
+
+    limiter.reserve('gpt-4', 500)
+    limiter.reserve('gpt-4', 500)
+
+    assert clock.now == 1060.0
+    assert limiter.stats()['waited'] == 1
+
+
+def test_reconcile_refunds_and_charges_the_difference(clock):
+    limiter = TokenRateLimiter({'gpt-4': (1000, 60)}, max_wait=0, expected_completion_tokens=100)
+
+    limiter.reconcile(limiter.reserve('gpt-4', 400), 200)
+    limiter.reconcile(limiter.reserve('gpt-4', 400), 700)
+    # A failed call keeps its prompt tokens and gets the expected completion back
+    limiter.reconcile(limiter.reserve('gpt-4', 0), None)
+
+    stats = limiter.stats()
+    assert stats['refunded_tokens'] == 400
+    assert stats['charged_tokens'] == 200
+    # 200 + 700 tokens used: 100 are left
+    assert limiter._take('gpt-4', 100) == 0
+    with pytest.raises(AgentRateLimitError):
+        limiter.reserve('gpt-4', 0)
+
+
+def test_refund_returns_the_whole_reservation(clock):
+    limiter = TokenRateLimiter({'gpt-4': (1000, 1)}, max_wait=0, expected_completion_tokens=100)
+
+    limiter.refund(limiter.reserve('gpt-4', 900))
+
+    assert limiter.reserve('gpt-4', 900).tokens == 1000
+
+
+def test_processes_sharing_a_db_draw_from_one_quota(clock, tmp_path):
+    db_path = str(tmp_path / 'rate.db')
+    first = TokenRateLimiter({'gpt-4': (1000, 60)}, db_path=db_path, max_wait=0, expected_completion_tokens=100)
+    second = TokenRateLimiter({'gpt-4': (1000, 60)}, db_path=db_path, max_wait=0, expected_completion_tokens=100)
+
+    first.reserve('gpt-4', 700)
+    with pytest.raises(AgentRateLimitError):
+        second.reserve('gpt-4', 700)
+
+    second.reconcile(first.reserve('gpt-4', 100), 0)
+    assert second.stats()['shared'] is True
+    assert second.reserve('gpt-4', 100).tokens == 200
+
+
+def test_coroutines_use_a_shared_db_off_the_event_loop(clock, tmp_path):
+    limiter = TokenRateLimiter({'gpt-4': (1000, 60)}, db_path=str(tmp_path / 'rate.db'), max_wait=0,
+                               expected_completion_tokens=100)
+    threads = []
+    take = limiter._take
+
+    def recording_take(model, tokens):
+        threads.append(threading.current_thread())
+        return take(model, tokens)
+
+    limiter._take = recording_take
+
+    async def main():
+        reservation = await limiter.areserve('gpt-4', 400)
+        await limiter.areconcile(reservation, 200)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(main())
+
+    assert threads and loop_thread not in threads
+    assert limiter.stats()['refunded_tokens'] == 300
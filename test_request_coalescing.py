@@ -0,0 +1,96 @@
+import threading
+import time
+
+from coalescing import RequestCoalescer
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    coalescer = RequestCoalescer(db_path=None)
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return ['reply']
+
+    threads = [
+        threading.Thread(target=lambda: results.append(coalescer.run('key', compute)))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert all(result == ['reply'] for result, _ in results)
+
+
+def test_a_request_after_the_leader_finished_runs_again(tmp_path):
+    coalescer = RequestCoalescer(db_path=str(tmp_path / 'coalesce.db'), result_ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ['reply']
+
+    assert coalescer.run('key', compute) == (['reply'], False)
+    assert coalescer.run('key', compute) == (['reply'], False)
+    assert len(calls) == 2
+
+
+def test_a_follower_stops_waiting_at_its_timeout():
+    coalescer = RequestCoalescer(db_path=None)
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: coalescer.run('key', lambda: release.wait(5) and ['slow']))
+    leader.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    assert coalescer.run('key', lambda: ['own'], timeout=0.1) == (['own'], False)
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join()
+
+
+def test_sessions_sharing_a_result_each_keep_the_turn(monkeypatch):
+    from langchain_core.messages import AIMessage
+    from agents.base_agent import BaseAgent
+    from agents.llm_transport import MAX_RETRIES
+    from agents.memory_store import SessionMemoryStore
+
+    class SlowLLM:
+        def invoke(self, prompt, **options):
+            time.sleep(0.2)
+            return AIMessage(content='Ship the export behind a feature flag.')
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    agent = BaseAgent('pm', 'You are a project manager.')
+    agent.memory_store = SessionMemoryStore(background=False)
+    agent._llms[agent.model, MAX_RETRIES] = SlowLLM()
+    coalescer = RequestCoalescer(db_path=None)
+    message = 'How do we release the export?'
+
+    def interact(session):
+        # Both sessions start empty, so their requests share one key
+        key = RequestCoalescer.make_key('p1', 'pm', message, agent.get_memory(None, session).fingerprint())
+        run, shared = coalescer.run(key, lambda: {
+            'session': session, 'response': agent.process_input(message, {'session': session})['response']
+        })
+        if shared and run['session'] != session:
+            agent.record_turn(message, run['response'], {'session': session})
+
+    threads = [threading.Thread(target=interact, args=(session,)) for session in ('alice', 'bob')]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    assert coalescer.stats()['coalesced'] == 1
+    for session in ('alice', 'bob'):
+        assert [turn.content for turn in agent.get_memory(None, session).messages] == [
+            message, 'Ship the export behind a feature flag.'
+        ]
@@ -0,0 +1,94 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from agents import response_cache
+from agents.base_agent import BaseAgent
+from agents.llm_transport import MAX_RETRIES
+from agents.memory_store import SessionMemoryStore
+from agents.response_cache import ResponseCache
+
+
+class FakeClock:
+    """Stands in for the time module."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, 'time', clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(max_entries=10, ttl=60, db_path=None)
+    cache.set('key', 'Cached reply.')
+
+    clock.now += 59
+    assert cache.get('key') == 'Cached reply.'
+    clock.now += 1
+    assert cache.get('key') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_the_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, ttl=60, db_path=None)
+    cache.set('first', 'one')
+    cache.set('second', 'two')
+    # Reading 'first' makes 'second' the least recently used
+    assert cache.get('first') == 'one'
+
+    cache.set('third', 'three')
+
+    assert cache.get('second') is None
+    assert cache.get('first') == 'one'
+    assert cache.get('third') == 'three'
+
+
+def test_the_sqlite_tier_is_shared_across_instances(clock, tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    ResponseCache(max_entries=10, ttl=60, db_path=db_path).set('key', 'Persisted reply.')
+
+    other = ResponseCache(max_entries=10, ttl=60, db_path=db_path)
+    assert other.get('key') == 'Persisted reply.'
+    assert other.stats()['disk_hits'] == 1
+    # Promoted into memory on the first read
+    assert other.get('key') == 'Persisted reply.'
+    assert other.stats()['memory_hits'] == 1
+
+    clock.now += 60
+    assert ResponseCache(max_entries=10, ttl=60, db_path=db_path).get('key') is None
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt, **options):
+        self.calls += 1
+        return AIMessage(content=f'Reply number {self.calls}.')
+
+
+def test_no_cache_requests_bypass_the_cache(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    agent = BaseAgent('dev', 'You are a developer.')
+    agent.memory_store = SessionMemoryStore(background=False)
+    agent.response_cache = ResponseCache(max_entries=10, db_path=None)
+    llm = agent._llms[agent.model, MAX_RETRIES] = CountingLLM()
+
+    # Separate sessions, so both prompts are the same
+    agent.process_input('Review the schema', {'session': 'a', 'no_cache': True})
+    result = agent.process_input('Review the schema', {'session': 'b', 'no_cache': True})
+
+    assert llm.calls == 2
+    assert not result.get('cached')
+    assert agent.response_cache.stats()['stores'] == 0
+
+    agent.process_input('Review the schema', {'session': 'c'})
+    assert agent.process_input('Review the schema', {'session': 'd'})['cached'] is True
+    assert llm.calls == 3
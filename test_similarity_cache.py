@@ -0,0 +1,60 @@
+from agents.similarity_cache import SimilarityCache
+
+
+def test_near_duplicate_hits_and_unrelated_misses():
+    cache = SimilarityCache(threshold=0.8, ttl=60, audit_path=None)
+    cache.add('dev', 'gpt-4', "How should we design the login API for the mobile app?", 'Use OAuth.')
+
+    assert cache.lookup('dev', 'gpt-4', "how should we design the login API for the mobile app") == 'Use OAuth.'
+    assert cache.lookup('dev', 'gpt-4', "Write a deployment pipeline for the billing service") is None
+    assert cache.lookup('tester', 'gpt-4', "How should we design the login API for the mobile app?") is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_entries_are_evicted_least_recently_used_first():
+    cache = SimilarityCache(threshold=0.8, max_entries=1, ttl=60, audit_path=None)
+    cache.add('pm', 'gpt-4', "Plan the first sprint for the analytics dashboard", 'first')
+    cache.add('pm', 'gpt-4', "Estimate the migration of the legacy payments system", 'second')
+
+    assert cache.lookup('pm', 'gpt-4', "Plan the first sprint for the analytics dashboard") is None
+    assert cache.stats()['size'] == 1
+
+
+def test_entries_only_match_lookups_from_the_same_conversation():
+    cache = SimilarityCache(threshold=0.8, ttl=60, audit_path=None)
+    cache.add('dev', 'gpt-4', "What about the second option?", 'Use Redis.', conversation='caching-thread')
+
+    assert cache.lookup('dev', 'gpt-4', "what about the second option", conversation='caching-thread') == 'Use Redis.'
+    assert cache.lookup('dev', 'gpt-4', "What about the second option?", conversation='deploy-thread') is None
+    assert cache.lookup('dev', 'gpt-4', "What about the second option?") is None
+
+
+def test_a_follow_up_with_different_history_misses(monkeypatch):
+    from langchain_core.messages import AIMessage
+    from agents.base_agent import BaseAgent
+    from agents.llm_transport import MAX_RETRIES
+    from agents.memory_store import SessionMemoryStore
+
+    class CountingLLM:
+        calls = 0
+
+        def invoke(self, prompt, **options):
+            self.calls += 1
+            return AIMessage(content=f'Reply number {self.calls}.')
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    agent = BaseAgent('dev', 'You are a developer.')
+    agent.memory_store = SessionMemoryStore(background=False)
+    agent.similarity_cache = SimilarityCache(threshold=0.8, ttl=60, audit_path=None)
+    llm = agent._llms[agent.model, MAX_RETRIES] = CountingLLM()
+    for session, topic in (('caching', 'How should we cache the catalogue?'),
+                           ('deploys', 'How should we roll out the billing service?')):
+        agent.get_memory(None, session).add_user_message(topic)
+        agent.get_memory(None, session).add_ai_message('There are two options.')
+
+    first = agent.process_input('What about the second option?', {'session': 'caching'})
+    other = agent.process_input('What about the second option?', {'session': 'deploys'})
+
+    assert llm.calls == 2
+    assert not other.get('cached')
+    assert other['response'] != first['response']